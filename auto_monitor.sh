@@ -1,4 +1,8 @@
 #!/bin/bash
+# Usage: ./auto_monitor.sh [--mux]
+#   --mux  read through a running serial_mux.py daemon instead of the device
+PORT=/dev/cu.usbserial-230
+
 echo "============================================"
 echo "🔄 Waiting for upload to complete..."
 echo "============================================"
@@ -7,6 +11,9 @@ echo "This will automatically start monitoring after upload."
 echo "Press Ctrl+C to stop monitoring."
 echo ""
 sleep 3
-echo "📡 Starting serial monitor on /dev/cu.usbserial-230..."
+echo "📡 Starting serial monitor on $PORT..."
 echo "--------------------------------------------"
-cat /dev/cu.usbserial-230 
+if [ "$1" = "--mux" ]; then
+    exec python3 "$(dirname "$0")/serial_mux.py" --attach "$PORT"
+fi
+cat "$PORT"
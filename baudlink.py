@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Negotiated serial link speed for main.py, esp32_l298n_main.py and
+fall_detector.ino, plus baud auto-detection for boards without it.
+
+The boards boot at 115200. After connecting, the host asks which rates the
+firmware offers and tries the fastest first:
+
+    host  ~B?                        board  ~B RATES 115200 921600 2000000
+    host  ~B SET 2000000 <nonce>     board  ~B ACK 2000000 <nonce>      (old rate)
+          both ends switch                  ~B TEST <i> <94 chars> <crc16>  x 8
+    host  ~B KEEP <nonce> <crc16>    board  ~B KEPT 2000000
+
+A test line that is missing or fails its CRC (the cable, USB bridge or level
+shifter can't carry the rate) means no KEEP, and the board drops back to
+115200 on its own after LINK_TRIAL_S; the host then tries the next rate
+down. Boards that don't answer "~B?" stay at whatever rate detect_baud()
+found them at, which also finds a board left at a fast rate by a tool that
+exited without putting it back.
+
+While streaming, Link counts bytes/sec and the CRC error rate of the binary
+frames; if errors pass MAX_ERROR_RATE, check() steps the link down one rate.
+The handshake consumes whatever the board sends meanwhile (under a second).
+
+    ser, link = open_link('/dev/cu.usbserial-0001', fast=True)
+    data = ser.read(4096); dec.feed(data); link.count(len(data), dec)
+    link.check()                 # once a second or so
+    print(link.stats)            # 2000000 baud: 12.4 kB/s (6% of line), 0.00% frame errors
+
+    python3 baudlink.py -p /dev/cu.usbserial-0001    detect, negotiate, measure 5 s
+    python3 baudlink.py --selftest                   fake boards on ptys
+
+Requires: pip install pyserial (and numpy for detect_baud)
+"""
+
+import binascii
+import os
+import random
+import re
+import sys
+import time
+
+LINK_BASE = 115200
+FAST_RATES = (2000000, 921600)          # tried fastest first
+DETECT_BAUDS = (115200, 921600, 2000000, 57600, 9600)
+DETECT_S = 0.3          # per candidate rate
+REPLY_S = 0.4           # RATES / ACK / KEPT
+TEST_S = 0.4            # all test lines after switching
+LINK_TEST_LINES = 8     # the firmware's LINK_TEST_LINES
+LINK_TRIAL_S = 1.5      # the firmware's LINK_TRIAL_MS; then it is back at LINK_BASE
+CHECK_MIN_FRAMES = 50   # frames in a check() window before its error rate counts
+MAX_ERROR_RATE = 0.01
+
+_REPLY = re.compile(rb'~B ([^\r\n\x00]*)')
+
+
+def crc16(data):
+    # telemetry.crc16, without making serial_mux.py depend on numpy
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def _crc_hex(text):
+    return '%04x' % crc16(text.encode())
+
+
+def _printable(data):
+    text = sum(1 for b in data if 32 <= b < 127 or b in (9, 10, 13))
+    return text / len(data) if data else 1.0
+
+
+def _replies(ser, timeout):
+    """'~B' replies as word lists until timeout (s); everything else is dropped."""
+    deadline = time.monotonic() + timeout
+    buf = b''
+    while time.monotonic() < deadline:
+        buf += ser.read(max(1, ser.in_waiting))
+        *lines, buf = buf.split(b'\n')
+        for line in lines:
+            m = _REPLY.search(line)
+            if m:
+                yield m.group(1).decode('ascii', 'replace').split()
+
+
+def hello(ser, timeout=REPLY_S):
+    """Rates the board offers, or None if it doesn't know the handshake."""
+    ser.write(b'~B?\n')
+    for words in _replies(ser, timeout):
+        if words[:1] == ['RATES']:
+            return [int(w) for w in words[1:] if w.isdigit()]
+    return None
+
+
+def detect_baud(ser, bauds=DETECT_BAUDS, listen_s=DETECT_S):
+    """(baud, offered rates or None) the board is talking at, or (None, None) if silent/garbled."""
+    from telemetry import StreamDecoder
+
+    for baud in bauds:
+        ser.baudrate = baud
+        ser.reset_input_buffer()
+        ser.write(b'~B?\n')
+        data = bytearray()
+        dec = StreamDecoder()
+        deadline = time.monotonic() + listen_s
+        while time.monotonic() < deadline:
+            chunk = ser.read(max(1, ser.in_waiting))
+            data += chunk
+            dec.feed(chunk)
+            m = re.search(rb'~B RATES ([\d ]+)\r?\n', data)
+            if m:
+                return baud, [int(w) for w in m.group(1).split()]
+            if len(data) >= 64 and not dec.frames and _printable(data) < 0.8:
+                break                   # wrong rate: try the next one
+        else:
+            if data and (dec.frames or _printable(data) >= 0.8):
+                return baud, None
+    return None, None
+
+
+class LinkStats:
+    """Bytes/sec and frame error rate of one link at one rate."""
+
+    def __init__(self, rate):
+        self.reset(rate)
+
+    def reset(self, rate):
+        self.rate = rate
+        self.t0 = time.monotonic()
+        self.bytes = self.frames = self.errors = 0
+
+    def update(self, nbytes, frames=0, errors=0):
+        self.bytes += nbytes
+        self.frames += frames
+        self.errors += errors
+
+    @property
+    def bytes_per_s(self):
+        return self.bytes / max(1e-9, time.monotonic() - self.t0)
+
+    @property
+    def error_rate(self):
+        n = self.frames + self.errors
+        return self.errors / n if n else 0.0
+
+    def __str__(self):
+        bps = self.bytes_per_s
+        return (f'{self.rate} baud: {bps / 1000:.1f} kB/s ({bps * 10 / self.rate:.0%} of line), '
+                f'{self.error_rate:.2%} frame errors ({self.errors}/{self.frames + self.errors})')
+
+
+class Link:
+    """Rate control and statistics for one open serial port."""
+
+    def __init__(self, ser, offered=None, log=print):
+        self.ser = ser
+        self.offered = offered          # None: no handshake, the rate can't change
+        self.log = log
+        self.rate = getattr(ser, 'baudrate', LINK_BASE)
+        self.stats = LinkStats(self.rate)
+        self.history = []               # earlier LinkStats, one per rate used
+        self._seen = (0, 0)
+        self._window = [0, 0]
+
+    def _set_rate(self, rate):
+        self.ser.baudrate = rate
+        if self.stats.bytes:
+            self.history.append(self.stats)
+        self.stats = LinkStats(rate)
+        self.rate = rate
+
+    def negotiate(self, rates=FAST_RATES):
+        """Move to the fastest of rates that the board offers and the link carries."""
+        if self.offered is None:
+            self.log(f'{self.ser.port}: no link handshake, staying at {self.rate}')
+            return self.rate
+        for rate in rates:
+            if rate in self.offered and rate != self.rate and self.switch(rate):
+                break
+        self.log(f'{self.ser.port}: link at {self.rate} baud')
+        return self.rate
+
+    def switch(self, rate):
+        """Trial one rate; True if the board kept it, else both ends are back at LINK_BASE."""
+        ser = self.ser
+        timeout, ser.timeout = ser.timeout, 0.05
+        try:
+            nonce = '%04x' % random.getrandbits(16)
+            ser.reset_input_buffer()
+            ser.write(f'~B SET {rate} {nonce}\n'.encode())
+            t_set = time.monotonic()
+            if not any(w == ['ACK', str(rate), nonce] for w in _replies(ser, REPLY_S)):
+                return False            # not heard: the board is still where it was
+            self._set_rate(rate)
+            if rate == LINK_BASE:
+                return any(w == ['KEPT', str(rate)] for w in _replies(ser, REPLY_S))
+            good = set()
+            for w in _replies(ser, TEST_S):
+                if len(w) == 4 and w[0] == 'TEST' and _crc_hex(w[2]) == w[3]:
+                    good.add(w[1])
+                    if len(good) == LINK_TEST_LINES:
+                        break
+            if len(good) == LINK_TEST_LINES:
+                ser.write(f'~B KEEP {nonce} {_crc_hex("KEEP " + nonce)}\n'.encode())
+                if any(w == ['KEPT', str(rate)] for w in _replies(ser, REPLY_S)):
+                    return True
+            self.log(f'{ser.port}: {rate} baud failed ({len(good)}/{LINK_TEST_LINES} test lines)')
+            # No KEEP, or the KEPT was lost: wait out the board's trial
+            time.sleep(max(0.0, t_set + LINK_TRIAL_S + 0.2 - time.monotonic()))
+            self._set_rate(LINK_BASE)
+            ser.reset_input_buffer()
+            if hello(ser) is None:
+                # It kept the rate after all (our KEEP got through, its KEPT didn't)
+                baud, self.offered = detect_baud(ser)
+                self._set_rate(baud or LINK_BASE)
+            return False
+        finally:
+            ser.timeout = timeout
+
+    def step_down(self):
+        """Next slower offered rate (LINK_BASE last). False if already there."""
+        if self.offered is None or self.rate <= LINK_BASE:
+            return False
+        slower = [r for r in FAST_RATES if r in self.offered and r < self.rate]
+        return self.switch(slower[0]) if slower else self.switch(LINK_BASE)
+
+    def count(self, nbytes, dec=None):
+        """Account bytes read, plus the frames/CRC errors dec has seen since the last call."""
+        frames = errors = 0
+        if dec is not None:
+            frames, errors = dec.frames - self._seen[0], dec.crc_errors - self._seen[1]
+            self._seen = (dec.frames, dec.crc_errors)
+        self.stats.update(nbytes, frames, errors)
+        self._window[0] += frames
+        self._window[1] += errors
+
+    def check(self):
+        """Step down a rate if frame errors since the last check passed MAX_ERROR_RATE."""
+        frames, errors = self._window
+        if frames + errors < CHECK_MIN_FRAMES:
+            return False
+        self._window = [0, 0]
+        if errors / (frames + errors) <= MAX_ERROR_RATE or not self.step_down():
+            return False
+        self.log(f'{self.ser.port}: {errors}/{frames + errors} frame errors, down to {self.rate} baud')
+        return True
+
+    def report(self):
+        return '\n'.join(str(s) for s in self.history + [self.stats])
+
+
+def connect(ser, auto=True, fast=False, rates=FAST_RATES, log=print):
+    """Link for an open port: optionally find its current rate, then optionally speed it up."""
+    timeout, ser.timeout = ser.timeout, 0.05
+    try:
+        if auto:
+            baud, offered = detect_baud(ser)
+            if baud is None:
+                ser.baudrate = LINK_BASE
+                log(f'{ser.port}: no readable output at {", ".join(map(str, DETECT_BAUDS))}; '
+                    f'using {LINK_BASE}')
+            elif baud != LINK_BASE:
+                log(f'{ser.port}: board is at {baud} baud')
+        else:
+            ser.reset_input_buffer()
+            offered = hello(ser) if fast else None
+        link = Link(ser, offered, log)
+        if fast:
+            link.negotiate(rates)
+        return link
+    finally:
+        ser.timeout = timeout
+
+
+def open_link(port, baud=None, fast=False, mux=False, rates=FAST_RATES, log=print, **kwargs):
+    """(serial port, Link). baud None detects it; fast negotiates up. Through
+    serial_mux the daemon owns the rate (serial_mux.py --fast)."""
+    from serial_mux import open_serial
+
+    ser = open_serial(port, baud or LINK_BASE, mux=mux, **kwargs)
+    if mux:
+        return ser, Link(ser, None, log)
+    return ser, connect(ser, auto=baud is None, fast=fast, rates=rates, log=log)
+
+
+def baud_arg(text):
+    """argparse type for -b: a rate, or 'auto' (None) to detect it."""
+    return None if text == 'auto' else int(text)
+
+
+# ---------------------------------------------------------------------------
+# Self-test: fake boards on ptys. The fake sees the rate pyserial set on the
+# pty and garbles both directions when the two ends disagree, like a UART.
+
+
+class FakeBoard:
+    def __init__(self, handshake=True, rate=LINK_BASE, max_rate=2000000, binary=True, bad_above=None):
+        import pty
+        import threading
+        import tty
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.handshake = handshake
+        self.rate = rate
+        self.max_rate = max_rate
+        self.binary = binary
+        self.bad_above = bad_above      # rates above this corrupt about 1 byte in 200
+        self.trial = None               # (deadline, nonce)
+        self.rng = random.Random(1)
+        self.seq = 0
+        self.stop = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _host_rate(self):
+        import termios
+        if not hasattr(FakeBoard, '_speeds'):
+            FakeBoard._speeds = {getattr(termios, n): int(n[1:]) for n in dir(termios)
+                                 if n.startswith('B') and n[1:].isdigit()}
+        return self._speeds.get(termios.tcgetattr(self.slave)[5])
+
+    def _send(self, data):
+        if self._host_rate() != self.rate:
+            data = bytes(self.rng.randrange(256) for _ in range(max(1, len(data) // 2)))
+        elif self.bad_above and self.rate > self.bad_above:
+            data = bytes(b ^ 0x10 if self.rng.random() < 0.005 else b for b in data)
+        os.write(self.master, data)
+        time.sleep(len(data) * 10 / self.rate)
+
+    def _println(self, *words):
+        self._send((' '.join(map(str, words)) + '\r\n').encode())
+
+    def _frame(self):
+        body = bytes([1, self.seq & 0xFF]) + bytes(24)
+        self.seq += 1
+        raw = body + crc16(body).to_bytes(2, 'little')
+        out, block = bytearray(b'\x00'), bytearray()
+        for b in raw + b'\x00':         # COBS
+            if b == 0 or len(block) == 254:
+                out += bytes([len(block) + 1]) + block
+                block = bytearray()
+                if b != 0:
+                    block.append(b)
+            else:
+                block.append(b)
+        return bytes(out + b'\x00')
+
+    def _set(self, rate):
+        time.sleep(0.005)
+        self.rate = rate
+
+    def _command(self, p):
+        if p == ['~B?']:
+            self._println('~B RATES', LINK_BASE, *[r for r in FAST_RATES[::-1] if r <= self.max_rate])
+        elif len(p) == 4 and p[0] == '~B' and p[1] == 'SET':
+            try:
+                rate = int(p[2])
+            except ValueError:
+                rate = 0
+            if rate != LINK_BASE and (rate not in FAST_RATES or rate > self.max_rate):
+                self._println('~B NAK', rate)
+                return
+            self._println('~B ACK', rate, p[3])
+            self._set(rate)
+            time.sleep(0.05)
+            if rate == LINK_BASE:
+                self.trial = None
+                self._println('~B KEPT', rate)
+                return
+            self.trial = (time.monotonic() + LINK_TRIAL_S, p[3])
+            for i in range(LINK_TEST_LINES):
+                pay = ''.join(chr(33 + (i + k) % 94) for k in range(94))
+                self._println('~B TEST', i, pay, _crc_hex(pay))
+        elif len(p) == 4 and p[0] == '~B' and p[1] == 'KEEP' and self.trial:
+            if p[2] == self.trial[1] and p[3] == _crc_hex('KEEP ' + p[2]):
+                self.trial = None
+                self._println('~B KEPT', self.rate)
+
+    def _run(self):
+        import select
+
+        line = b''
+        while not self.stop.is_set():
+            if select.select([self.master], [], [], 0.005)[0]:
+                data = os.read(self.master, 1024)
+                if self._host_rate() != self.rate:
+                    data = b''          # framing errors: nothing usable arrives
+                for c in data:
+                    if line or c == ord('~'):
+                        if c in b'\r\n':
+                            if self.handshake:
+                                self._command(line.decode('ascii', 'replace').split())
+                            line = b''
+                        else:
+                            line += bytes([c])
+            if self.trial and time.monotonic() >= self.trial[0]:
+                self.trial = None
+                self._set(LINK_BASE)
+                self._println('~B REVERT', LINK_BASE)
+            if self.binary:
+                self._send(self._frame())
+            else:
+                self._println('ACC g: 0.01 -0.02 1.0 |a|= 1.0')
+
+    def close(self):
+        self.stop.set()
+
+
+def measure(ser, link, seconds):
+    from telemetry import StreamDecoder
+
+    dec = StreamDecoder()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        data = ser.read(max(1, ser.in_waiting))
+        dec.feed(data)
+        link.count(len(data), dec)
+        link.check()
+    return dec
+
+
+def selftest():
+    import serial
+
+    quiet = lambda *a: None
+    cases = [
+        # name, board, expected final rate
+        ('2M clean', dict(), 2000000),
+        ('2M corrupt, 921600 clean', dict(bad_above=921600), 921600),
+        ('921600 only', dict(max_rate=921600), 921600),
+        ('no handshake', dict(handshake=False), LINK_BASE),
+        ('left at 921600', dict(rate=921600), 2000000),
+        ('no handshake, fixed 921600', dict(handshake=False, rate=921600), 921600),
+        ('text firmware', dict(binary=False), 2000000),
+    ]
+    ok = True
+    for name, board, expect in cases:
+        fake = FakeBoard(**board)
+        t0 = time.monotonic()
+        with serial.Serial(fake.name, LINK_BASE, timeout=0.05) as ser:
+            link = connect(ser, auto=True, fast=True, log=quiet)
+            t_setup = time.monotonic() - t0
+            measure(ser, link, 0.5)
+            good = link.rate == expect and fake.rate == expect and link.stats.error_rate < MAX_ERROR_RATE
+            ok &= good
+            print(f'{"ok  " if good else "FAIL"} {name:28} {t_setup:4.2f} s setup  {link.stats}')
+        fake.close()
+
+    # A link that goes bad mid-stream steps down on CRC errors
+    fake = FakeBoard()
+    with serial.Serial(fake.name, LINK_BASE, timeout=0.05) as ser:
+        link = connect(ser, auto=False, fast=True, log=quiet)
+        fake.bad_above = 921600
+        measure(ser, link, 1.0)
+        good = link.rate == 921600 == fake.rate
+        ok &= good
+        print(f'{"ok  " if good else "FAIL"} {"degrades mid-stream":28}  ' + link.report().replace('\n', '  ->  '))
+    fake.close()
+
+    # The firmware itself, in the simulator: a garbled SET is NAKed and the
+    # command loop keeps answering
+    import sim
+    from sim.mpu6050 import MPU6050, still
+    garbled = [(1, '~B SET fast x\n'), (1.5, '~B SET 921600x 1\n'), (2, '~B?\n')]
+    for script, devices in (('main.py', {0x68: MPU6050(still())}), ('esp32_l298n_main.py', {})):
+        s = sim.run(os.path.join(os.path.dirname(os.path.abspath(__file__)), script), 3,
+                    devices=devices, stdin=garbled, echo=False)
+        replies = [line.text.strip() for line in s.stdout.lines if line.text.startswith('~B')]
+        good = len(replies) == 3 and replies[:2] == ['~B NAK 0', '~B NAK 0'] and replies[2].startswith('~B RATES')
+        ok &= good
+        print(f'{"ok  " if good else "FAIL"} {"garbled SET, " + script:28}  ' + ' | '.join(replies))
+    print('OK' if ok else 'FAILED')
+    return ok
+
+
+def main():
+    import argparse
+
+    import serial
+
+    parser = argparse.ArgumentParser(description='Negotiate a faster serial link and measure it')
+    parser.add_argument('-p', '--port', help='Serial port (e.g., /dev/cu.usbserial-0001)')
+    parser.add_argument('-b', '--baud', type=baud_arg, default=None,
+                        help="Current baud rate, or 'auto' (default: auto)")
+    parser.add_argument('--rates', default=','.join(map(str, FAST_RATES)),
+                        help='Rates to try, fastest first (default: %(default)s)')
+    parser.add_argument('--seconds', type=float, default=5.0, help='How long to measure')
+    parser.add_argument('--selftest', action='store_true', help='Negotiate with fake boards on ptys')
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    if not args.port:
+        parser.error('-p/--port is required')
+
+    try:
+        rates = tuple(int(r) for r in args.rates.split(','))
+        ser, link = open_link(args.port, args.baud, fast=True, rates=rates, timeout=0.05)
+        with ser:
+            measure(ser, link, args.seconds)
+            print(link.report())
+    except serial.SerialException as e:
+        print('Serial error:', e)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -4,132 +4,289 @@ Quick ESP32-CAM Connection Checker
 Shows all available serial ports and identifies likely ESP32 devices
 """
 
-import subprocess
+import json
+import os
 import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-def check_with_system_profiler():
-    """Check USB devices using macOS system profiler"""
-    print("\n📱 USB Devices (from System Profiler):")
-    print("-" * 40)
-    try:
-        result = subprocess.run(
-            ["system_profiler", "SPUSBDataType"],
-            capture_output=True,
-            text=True
-        )
-        
-        lines = result.stdout.split('\n')
-        esp_found = False
-        
-        for i, line in enumerate(lines):
-            if any(x in line.lower() for x in ['cp210', 'ch340', 'uart', 'serial', 'esp32', 'silicon labs']):
-                # Print context around the match
-                start = max(0, i-2)
-                end = min(len(lines), i+5)
-                for j in range(start, end):
-                    print(lines[j])
-                esp_found = True
-                print()
-        
-        if not esp_found:
-            print("No ESP32-related USB devices found in system profiler")
-            
-    except Exception as e:
-        print(f"Error running system_profiler: {e}")
+from port_discovery import is_esp32, list_ports
+
+PROBE_TIMEOUT_S = 1.5       # per board, and so roughly for the whole check
+PROBE_BAUDS = (115200, 921600, 2000000, 57600, 9600)   # tried in order while the output looks garbled
+PROBE_CACHE = os.path.expanduser('~/.cache/esp32_probe.json')
+PROBE_CACHE_DAYS = 7        # re-probe a board after this long (or with --reprobe)
+
+# Known output -> (what the board runs, firmware); first match wins
+FINGERPRINTS = [
+    ('MicroPython Fall Detector', 'fall detector', 'MicroPython'),
+    ('MPU-6050 Fall Detector', 'fall detector', 'Arduino'),
+    ('FALL_DETECTED', 'fall detector', None),
+    ('ACC g:', 'fall detector', None),
+    ('Camera Ready', 'camera', 'Arduino'),
+    ('Camera Diagnostic', 'camera diagnostic', 'Arduino'),
+    ('Camera init', 'camera', 'Arduino'),
+    ('ESP32-CAM', 'camera', None),
+    ('FORWARD', 'L298N motor', 'MicroPython'),
+    ('STOP', 'L298N motor', 'MicroPython'),
+    ('MicroPython v', 'REPL', 'MicroPython'),
+    ('>>>', 'REPL', 'MicroPython'),
+]
+
+Fingerprint = namedtuple('Fingerprint', 'device serial_number baud kind firmware banner seconds cached error')
 
 def check_serial_ports():
-    """Check available serial ports"""
+    """Check available serial ports (sysfs on Linux, IOKit via pyserial on macOS)"""
     print("\n🔌 Serial Ports Available:")
     print("-" * 40)
     
     try:
-        result = subprocess.run(
-            ["ls", "-la", "/dev/cu.*"],
-            shell=True,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0 and result.stdout:
-            lines = result.stdout.strip().split('\n')
-            esp_ports = []
-            
-            for line in lines:
-                print(line)
-                if 'usbserial' in line or 'SLAB' in line or 'wchusbserial' in line:
-                    # Extract the device name
-                    parts = line.split()
-                    if parts:
-                        device = parts[-1]
-                        esp_ports.append(device)
-            
-            if esp_ports:
-                print("\n✅ Likely ESP32 ports found:")
-                for port in esp_ports:
-                    print(f"   • {port}")
-                return esp_ports
-            else:
-                print("\n⚠️  No typical ESP32 serial ports found")
-        else:
-            print("No serial ports found in /dev/cu.*")
-            
+        ports = list_ports()
     except Exception as e:
         print(f"Error checking serial ports: {e}")
+        return []
     
+    if not ports:
+        print("No serial ports found")
+        return []
+    
+    esp_ports = []
+    for port in ports:
+        ids = f"{port.vid:04x}:{port.pid:04x}" if port.vid is not None else "no USB ids"
+        print(f"{port.device}  [{ids}]  {port.description}")
+        if port.manufacturer or port.serial_number:
+            print(f"    {port.manufacturer or ''}  serial: {port.serial_number or '-'}")
+        if is_esp32(port):
+            esp_ports.append(port)
+    
+    if esp_ports:
+        print("\n✅ Likely ESP32 ports found:")
+        for port in esp_ports:
+            print(f"   • {port.device}" + (f" ({port.chip})" if port.chip else ""))
+        return esp_ports
+    print("\n⚠️  No typical ESP32 serial ports found")
     return []
 
-def test_port_access(port):
-    """Test if we can access a serial port"""
-    print(f"\n🧪 Testing port access: {port}")
-    print("-" * 40)
-    
-    try:
-        # Check if pyserial is installed
+def _printable(data):
+    text = sum(1 for b in data if 32 <= b < 127 or b in (9, 10, 13))
+    return text / len(data) if data else 1.0
+
+def fingerprint(text, frames=0):
+    """(kind, firmware) from what a board printed; binary telemetry frames mean the fall detector"""
+    kind = firmware = None
+    for needle, k, fw in FINGERPRINTS:
+        if needle in text:
+            kind = kind or k
+            firmware = firmware or fw
+    if frames and not kind:
+        kind = 'fall detector'
+    return kind, firmware
+
+def probe_port(port, timeout=PROBE_TIMEOUT_S):
+    """Listen to one board for up to timeout s (poking the REPL once) and fingerprint it"""
+    import serial
+    from telemetry import StreamDecoder
+
+    t0 = time.monotonic()
+    deadline = t0 + timeout
+    device = port.device
+    result = dict(device=device, serial_number=port.serial_number, baud=None, kind=None,
+                  firmware=None, banner='', seconds=0.0, cached=False, error=None)
+    garbled = False
+    for baud in PROBE_BAUDS:
+        if time.monotonic() >= deadline:
+            break
         try:
-            import serial
-            
-            # Try to open the port
-            ser = serial.Serial(port, 115200, timeout=0.5)
-            print(f"✅ Successfully opened {port}")
-            
-            # Send a simple command
-            ser.write(b'\r\n')
-            
-            # Try to read something
-            data = ser.read(100)
-            if data:
-                print(f"📥 Received {len(data)} bytes")
-                try:
-                    text = data.decode('utf-8', errors='ignore')
-                    if text.strip():
-                        print(f"   Data preview: {text[:50]}...")
-                except:
-                    print(f"   Raw data: {data[:20].hex()}...")
-            else:
-                print("📭 No immediate response (device might be idle)")
-            
+            ser = serial.Serial(device, baud, timeout=0.05)
+        except Exception as e:
+            result['error'] = str(e)
+            if "Permission denied" in str(e):
+                result['error'] += f" (try: sudo chmod 666 {device})"
+            break
+        try:
+            ser.write(b'\r\n')        # an idle MicroPython REPL answers with >>>
+            data = bytearray()
+            dec = StreamDecoder()
+            garbled = False
+            while time.monotonic() < deadline:
+                chunk = ser.read(max(1, ser.in_waiting))
+                if not chunk:
+                    continue
+                data += chunk
+                dec.feed(chunk)
+                text = data.decode('utf-8', errors='ignore')
+                kind, firmware = fingerprint(text, dec.frames)
+                if kind and kind != 'REPL' or '>>>' in text:
+                    break                       # conclusive, no need to wait out the timeout
+                if len(data) >= 64 and not dec.frames and _printable(data) < 0.8:
+                    garbled = True              # wrong baud rate: try the next one
+                    break
+        finally:
             ser.close()
-            return True
-            
-        except ImportError:
-            print("⚠️  pyserial not installed. Install with: pip3 install pyserial")
-            print("    Skipping port test...")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Could not access port: {e}")
-        if "Permission denied" in str(e):
-            print(f"\n💡 Try: sudo chmod 666 {port}")
-        return False
+        if garbled:
+            continue
+        if data:
+            text = data.decode('utf-8', errors='replace')
+            result['baud'] = baud
+            result['kind'], result['firmware'] = fingerprint(text, dec.frames)
+            lines = [l.strip() for l in text.splitlines() if l.strip() and _printable(l.encode()) > 0.9]
+            result['banner'] = ' | '.join(lines[:3])[:120]
+        break
+    else:
+        if garbled:
+            result['error'] = f"output garbled at {', '.join(map(str, PROBE_BAUDS))} baud"
+    result['seconds'] = time.monotonic() - t0
+    return Fingerprint(**result)
+
+def load_probe_cache():
+    try:
+        with open(PROBE_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_probe_cache(cache):
+    os.makedirs(os.path.dirname(PROBE_CACHE), exist_ok=True)
+    tmp = PROBE_CACHE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, PROBE_CACHE)
+
+def probe_ports(ports, timeout=PROBE_TIMEOUT_S, reprobe=False):
+    """Fingerprint every port at once; boards with a USB serial number come from the cache"""
+    cache = {} if reprobe else load_probe_cache()
+    fresh = time.time() - PROBE_CACHE_DAYS * 86400
+    results = {}
+    todo = []
+    for port in ports:
+        hit = cache.get(port.serial_number) if port.serial_number else None
+        if hit and hit['probed'] > fresh:
+            results[port.device] = Fingerprint(port.device, port.serial_number, hit['baud'], hit['kind'],
+                                               hit['firmware'], hit['banner'], 0.0, True, None)
+        else:
+            todo.append(port)
+    if todo:
+        with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+            for fp in pool.map(lambda p: probe_port(p, timeout), todo):
+                results[fp.device] = fp
+        if reprobe:
+            cache = load_probe_cache()
+        for fp in results.values():
+            if fp.serial_number and not fp.cached and fp.error is None and fp.baud:
+                cache[fp.serial_number] = {'baud': fp.baud, 'kind': fp.kind, 'firmware': fp.firmware,
+                                           'banner': fp.banner, 'probed': time.time()}
+        try:
+            save_probe_cache(cache)
+        except OSError as e:
+            print(f"(could not save probe cache: {e})")
+    return [results[p.device] for p in ports]
+
+def print_fingerprints(results, elapsed):
+    print(f"\n🧪 Probed {len(results)} port(s) in {elapsed:.2f} s:")
+    print("-" * 40)
+    for fp in results:
+        if fp.error:
+            print(f"❌ {fp.device}: {fp.error}")
+            continue
+        if fp.baud is None:
+            print(f"📭 {fp.device}: no output (idle sketch, or in download mode?)")
+            continue
+        src = "cached" if fp.cached else f"{fp.seconds:.2f} s"
+        print(f"✅ {fp.device}: {fp.kind or 'unknown firmware'}"
+              f"{' (' + fp.firmware + ')' if fp.firmware else ''} at {fp.baud} baud  [{src}]")
+        if fp.banner:
+            print(f"   {fp.banner}")
+
+def selftest():
+    """Fake boards on ptys: REPL, fall detector, camera, garbage, silence"""
+    import pty
+    import random
+    import shutil
+    import tempfile
+    import threading
+    import tty
+    global PROBE_CACHE
+    from port_discovery import Port
+
+    def repl(fd):
+        while True:
+            if b'\r' in os.read(fd, 100):
+                os.write(fd, b'\r\n>>> ')
+
+    def fall_detector(fd):
+        time.sleep(0.4)             # reset during the probe, so the banner is seen
+        os.write(fd, b'MicroPython Fall Detector running at 50 Hz\r\nI2C: SDA= 21  SCL= 22\r\n')
+        while True:
+            time.sleep(0.2)
+            os.write(fd, b'ACC g: 0.01 -0.02 1.0 |a|= 1.0\r\n')
+
+    def camera(fd):
+        time.sleep(0.3)
+        os.write(fd, b"WiFi connected\r\nCamera Ready! Use 'http://192.168.1.20' to connect\r\n")
+
+    def garbage(fd):
+        rng = random.Random(1)
+        while True:
+            os.write(fd, bytes(rng.randrange(128, 256) for _ in range(32)))
+            time.sleep(0.02)
+
+    boards = [('repl', 'SN-REPL', repl), ('fall', 'SN-FALL', fall_detector),
+              ('cam', 'SN-CAM', camera), ('garbage', None, garbage), ('silent', None, None)]
+    ports = []
+    for name, serial_number, play in boards:
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        ports.append(Port(os.ttyname(slave), name, name, 0x10C4, 0xEA60, serial_number,
+                          None, None, None, 'CP210x'))
+        if play:
+            threading.Thread(target=lambda f=play, m=master: _quiet(f, m), daemon=True).start()
+
+    saved_cache = PROBE_CACHE
+    d = tempfile.mkdtemp()
+    PROBE_CACHE = os.path.join(d, 'probe.json')
+    ok = True
+    try:
+        for run in ('first run', 'second run (cache)'):
+            t0 = time.monotonic()
+            results = probe_ports(ports)
+            elapsed = time.monotonic() - t0
+            print(f"\n{run}:")
+            print_fingerprints(results, elapsed)
+            by = {p.name: fp for p, fp in zip(ports, results)}
+            ok &= by['repl'].kind == 'REPL' and by['fall'].kind == 'fall detector' \
+                and by['fall'].firmware == 'MicroPython' and by['cam'].kind == 'camera' \
+                and by['garbage'].error is not None and by['silent'].baud is None
+            ok &= elapsed < PROBE_TIMEOUT_S * 1.5
+            if run.startswith('second'):
+                ok &= by['repl'].cached and by['fall'].cached and by['cam'].cached
+    finally:
+        PROBE_CACHE = saved_cache
+        shutil.rmtree(d)
+    print("\nOK" if ok else "\nFAILED")
+    return ok
+
+def _quiet(play, fd):
+    try:
+        play(fd)
+    except OSError:
+        pass
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Find and fingerprint ESP32 boards')
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT_S,
+                        help=f'Seconds to listen to each board, all at once (default: {PROBE_TIMEOUT_S})')
+    parser.add_argument('--reprobe', action='store_true', help=f'Ignore the cache in {PROBE_CACHE}')
+    parser.add_argument('--selftest', action='store_true', help='Probe fake boards on ptys')
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+
     print("=" * 50)
-    print("🔍 ESP32-CAM Connection Checker for Mac")
+    print("🔍 ESP32-CAM Connection Checker")
     print("=" * 50)
     
-    # Check system profiler
-    check_with_system_profiler()
-    
     # Check serial ports
     ports = check_serial_ports()
     
@@ -139,7 +296,7 @@ def main():
         print("💡 Quick Start Commands:")
         print("=" * 50)
         
-        first_port = ports[0]
+        first_port = ports[0].device
         
         print(f"\n1. Monitor with Python script:")
         print(f"   python3 monitor_esp32cam.py")
@@ -152,8 +309,10 @@ def main():
         print(f"   - Open Serial Monitor (Cmd+Shift+M)")
         print(f"   - Set baud rate to 115200")
         
-        # Test the first port
-        test_port_access(first_port)
+        # Listen to every board at once
+        t0 = time.monotonic()
+        results = probe_ports(ports, args.timeout, args.reprobe)
+        print_fingerprints(results, time.monotonic() - t0)
     else:
         print("\n" + "=" * 50)
         print("❌ No ESP32-CAM detected!")
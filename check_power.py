@@ -1,29 +1,50 @@
 """
 Power Supply Diagnostic for L298N
 Helps identify if the issue is power-related
+
+With a divider from the 5 V rail to SUPPLY_PIN (22k from 5 V, 10k to GND)
+it also measures how close each load step gets to a brownout: a Timer
+samples the rail SAMPLE_HZ times a second into a preallocated ring, and
+around every step of the tests PRE_MS before and POST_MS after are copied
+out and reduced to one line as soon as the window is complete:
+    ~P min=4.712V sag=0.268V rec=12.5ms margin=0.312V  Flash 1: ON
+min is the lowest rail voltage after the step, sag how far that is below
+the level just before it, rec how long until the rail settles within
+RECOVER_MV of its level under the new load, and margin how far min stayed
+above BROWNOUT_V. The deepest window is dumped at the end for plotting, as
+"~W <sample from the step> <rail mV> ..." lines. Lines stream as the test
+runs, so they reach the host even if the board resets.
+In the simulator:
+    python3 -m sim check_power.py --supply 34:0.3
 """
 
-from machine import Pin
+from machine import ADC, Pin, Timer
+from array import array
 import time
+from l298n import Pattern, PINS_D23
+
+SUPPLY_PIN = 34         # ADC1, input only
+DIVIDER = 3.2           # rail volts per ADC volt: (22k + 10k) / 10k
+SAMPLE_HZ = 4000
+PRE_MS = 20             # kept before each load step
+POST_MS = 200           # and after it
+RECOVER_MV = 50         # recovered: back within this of the level under the new load
+BROWNOUT_V = 4.4        # about where the 3.3 V regulator drops out and the ESP32 resets
+MIN_MARGIN_V = 0.2      # less than this above BROWNOUT_V is a fail
+CAPTURE_TIMER = 0       # the patterns play on l298n.PATTERN_TIMER
 
 print("=" * 50)
 print("L298N POWER SUPPLY CHECK")
 print("=" * 50)
 
-# Use built-in LED if available (GPIO 2 on most ESP32 boards)
-try:
-    led = Pin(2, Pin.OUT)
-    has_led = True
-except:
-    has_led = False
-
-# Setup motor control pins
-pins = {
-    'IN1': Pin(5, Pin.OUT),
-    'IN2': Pin(18, Pin.OUT),
-    'IN3': Pin(19, Pin.OUT),
-    'IN4': Pin(23, Pin.OUT)  # or 21 if you haven't changed wiring
-}
+# Motor control pins IN1-IN4 (PINS_D21 if you haven't changed wiring) and
+# the built-in LED (GPIO 2 on most ESP32 boards), played by the pattern
+# engine in l298n.py (upload it too)
+LED_PIN = 2
+PINS = PINS_D23 + (LED_PIN,)
+NAMES = ('IN1', 'IN2', 'IN3', 'IN4')
+ALL_ON = (1, 1, 1, 1, 1)
+ALL_OFF = (0, 0, 0, 0, 0)
 
 print("\n### WHAT YOU SHOULD SEE ###\n")
 print("WITH PROPER POWER:")
@@ -41,47 +62,167 @@ print("\n" + "=" * 50)
 print("QUICK POWER TEST")
 print("=" * 50)
 
-def flash_all(count=3):
-    """Flash all outputs to check for brownout"""
-    for i in range(count):
-        # All on
-        for pin in pins.values():
-            pin.on()
-        if has_led:
-            led.on()
-        print(f"Flash {i+1}: ON")
-        time.sleep(0.5)
-        
-        # All off
-        for pin in pins.values():
-            pin.off()
-        if has_led:
-            led.off()
-        print(f"Flash {i+1}: OFF")
-        time.sleep(0.5)
+# Flash all outputs to check for brownout
+steps = []
+for i in range(3):
+    steps.append((f"Flash {i+1}: ON", ALL_ON, 500))
+    steps.append((f"Flash {i+1}: OFF", ALL_OFF, 500))
+FLASH = Pattern(PINS, steps)
+
+# One motor input at a time (the LED stays as it is)
+steps = []
+for i, name in enumerate(NAMES):
+    steps.append((f"{name}: HIGH", tuple(1 if j == i else 0 for j in range(4)) + (None,), 500))
+    steps.append((f"{name}: LOW", (0, 0, 0, 0, None), 300))
+SINGLE = Pattern(PINS, steps)
+
+SUSTAINED = Pattern(PINS, (
+    ("All pins HIGH for 3 seconds...", (1, 1, 1, 1, None), 3000),
+    ("All pins LOW", (0, 0, 0, 0, None), 0),
+))
+
+
+PRE_N = PRE_MS * SAMPLE_HZ // 1000
+WIN = PRE_N + POST_MS * SAMPLE_HZ // 1000
+RING = 2 * WIN
+
+
+class Capture:
+    """Rail samples from a Timer into a ring, and a window around each load step."""
+
+    def __init__(self):
+        self.adc = ADC(Pin(SUPPLY_PIN), atten=ADC.ATTN_11DB)
+        self.ring = array('H', [0] * RING)  # ADC mV
+        self.n = 0                          # samples taken
+        self.trig = array('i', [0] * 8)     # sample count at a step, queued
+        self.step = array('i', [0] * 8)     # and which step it was
+        self.tw = 0
+        self.tr = 0
+        self.names = ()
+        self.win = array('H', [0] * WIN)
+        self.worst = array('H', [0] * WIN)
+        self.worst_name = None
+        self.worst_sag = -1.0
+        self.lowest = None                  # rail volts
+        self.longest = 0.0                  # recovery ms
+        self.lost = 0
+        self.timer = Timer(CAPTURE_TIMER)
+
+    def start(self):
+        self.timer.init(mode=Timer.PERIODIC, freq=SAMPLE_HZ, callback=self._sample)
+
+    def _sample(self, t):
+        # No allocation: a small int into a preallocated array
+        n = self.n
+        self.ring[n % RING] = self.adc.read_uv() // 1000
+        self.n = n + 1
+
+    def trigger(self, k):
+        # Pattern hook, also in a Timer callback
+        i = self.tw % 8
+        self.trig[i] = self.n
+        self.step[i] = k
+        self.tw += 1
+
+    def poll(self):
+        """Reduce every window whose post-trigger part is complete."""
+        while self.tr < self.tw:
+            i = self.tr % 8
+            t0 = self.trig[i] - PRE_N
+            if self.n < t0 + WIN:
+                return
+            self.tr += 1
+            if self.n - t0 > RING or t0 < 0:
+                self.lost += 1              # overwritten before we got to it
+                continue
+            self._reduce(t0, self.names[self.step[i]])
+
+    def drain(self, names):
+        self.names = names
+        while self.tr < self.tw:
+            self.poll()
+            time.sleep_ms(5)
+
+    def _reduce(self, t0, name):
+        w = self.win
+        ring = self.ring
+        for j in range(WIN):
+            w[j] = ring[(t0 + j) % RING]
+        pre = sum(w[j] for j in range(PRE_N)) / PRE_N
+        lo = PRE_N
+        for j in range(PRE_N, WIN):
+            if w[j] < w[lo]:
+                lo = j
+        # Recovered once within RECOVER_MV of where the rail ends up under
+        # the new load (the last PRE_N samples)
+        end = sum(w[j] for j in range(WIN - PRE_N, WIN)) / PRE_N
+        rec = None
+        for j in range(lo, WIN):
+            if abs(end - w[j]) * DIVIDER <= RECOVER_MV:
+                rec = max(0, j - PRE_N) * 1000 / SAMPLE_HZ
+                break
+        low = w[lo] * DIVIDER / 1000
+        sag = (pre - w[lo]) * DIVIDER / 1000
+        print("~P min=%.3fV sag=%.3fV rec=%s margin=%.3fV  %s" % (
+            low, sag, "%.1fms" % rec if rec is not None else ">%dms" % POST_MS, low - BROWNOUT_V, name))
+        if self.lowest is None or low < self.lowest:
+            self.lowest = low
+        if rec is None or rec > self.longest:
+            self.longest = POST_MS if rec is None else rec
+        if sag > self.worst_sag:
+            self.worst_sag = sag
+            self.worst_name = name
+            for j in range(WIN):
+                self.worst[j] = w[j]
+
+    def stop(self):
+        self.timer.deinit()
+
+    def summary(self):
+        if self.lowest is None:
+            return
+        print("~P lowest=%.3fV deepest_sag=%.3fV (%s) longest_rec=%.1fms margin=%.3fV lost=%d" % (
+            self.lowest, self.worst_sag, self.worst_name, self.longest, self.lowest - BROWNOUT_V, self.lost))
+        for j in range(0, WIN, 20):
+            print("~W %d" % (j - PRE_N), " ".join(str(int(v * DIVIDER)) for v in self.worst[j:j + 20]))
+        if self.lowest - BROWNOUT_V < MIN_MARGIN_V:
+            print("Less than %.1f V from a brownout: use a stronger supply or add capacitance." % MIN_MARGIN_V)
+        else:
+            print("Supply margin OK (%.2f V above brownout)." % (self.lowest - BROWNOUT_V))
+
+
+def run(pattern):
+    """Play a pattern, capturing a window around each of its steps."""
+    if cap is None:
+        pattern.play()
+        return
+    cap.names = pattern.names
+    pattern.play(hook=cap.trigger, idle=cap.poll)
+    cap.drain(pattern.names)
+
+
+# Capture only if something is on the divider
+cap = Capture()
+cap.start()
+time.sleep_ms(PRE_MS * 2)
+if cap.ring[0] * DIVIDER < 2000:
+    print("\n(No supply on GPIO %d: wire the divider to measure the sag)" % SUPPLY_PIN)
+    cap.stop()
+    cap = None
 
 print("\nTest 1: Flashing all pins...")
 print("(If ESP32 resets, you have a power issue!)\n")
-flash_all()
+run(FLASH)
 
 print("\nTest 2: Individual pin test...")
-for name, pin in pins.items():
-    print(f"{name}: HIGH ", end="")
-    pin.on()
-    time.sleep(0.5)
-    print("→ LOW")
-    pin.off()
-    time.sleep(0.3)
+run(SINGLE)
 
 print("\nTest 3: Sustained load test...")
-print("All pins HIGH for 3 seconds...")
-for pin in pins.values():
-    pin.on()
-time.sleep(3)
-
-print("All pins LOW")
-for pin in pins.values():
-    pin.off()
+run(SUSTAINED)
+SUSTAINED.report()
+if cap is not None:
+    cap.stop()
+    cap.summary()
 
 print("\n" + "=" * 50)
 print("DIAGNOSIS:")
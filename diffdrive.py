@@ -0,0 +1,149 @@
+"""
+Differential drive with PWM speed control on the L298N (MicroPython, ESP32)
+
+Upload next to l298n.py and setpoint.py, then run it (or import it from
+main). Take the jumpers off ENA/ENB and wire them to EN_PINS; IN1-IN4 stay on
+PINS_MAIN as for esp32_l298n_main.py.
+
+The host streams (left, right) speeds, -127..127, at 50-100 Hz in the
+setpoint.py encoding (mac_keyboard_drive.py --pwm); a space stops, q quits.
+A Timer moves each wheel towards its setpoint by at most SLEW_PER_S of full
+scale per second, every TICK_MS, so the motor current ramps instead of
+stepping (full-current steps are what brown the board out, see
+check_power.py). A wheel stops at zero before it reverses, and its
+direction inputs only change there. If no setpoint arrives for TIMEOUT_MS,
+both wheels ramp down to a stop.
+
+A new setpoint reaches the PWM on the next timer tick, so the added latency
+is under TICK_MS; the status line shows what it measured. In the simulator:
+    python3 -m sim diffdrive.py --keys "0.1:V646456\\n,1:V9c64ae\\n" --pwm-log pwm.csv
+"""
+
+from machine import Pin, PWM, Timer
+import sys
+import time
+import uselect
+from l298n import L298N, PINS_MAIN
+import setpoint
+
+EN_PINS = (25, 26)      # ENA (motor A, left wheel), ENB (motor B, right wheel)
+PWM_FREQ = 20000        # Hz, above hearing
+TICK_MS = 10            # slew control tick
+SLEW_PER_S = 4          # full scales per second at most: stop to full in 250 ms
+TIMEOUT_MS = 250        # no setpoint for this long: ramp down to stop
+STATUS_MS = 1000        # speeds and latency line while moving, None = off
+
+
+class DiffDrive:
+    def __init__(self, pins=PINS_MAIN, en_pins=EN_PINS, tick_ms=TICK_MS):
+        self.motor = L298N(pins)
+        self.pwm = [PWM(Pin(p), freq=PWM_FREQ, duty_u16=0) for p in en_pins]
+        m = self.motor.masks
+        # Direction masks per wheel, indexed by sign + 1
+        self.dirs = ((m["a_backward"], m["a_stop"], m["a_forward"]),
+                     (m["b_backward"], m["b_stop"], m["b_forward"]))
+        self.target = [0, 0]
+        self.speed = [0, 0]
+        self.step = max(1, SLEW_PER_S * setpoint.FULL * tick_ms // 1000)
+        self.t_set = time.ticks_ms()
+        # Setpoint-to-PWM latency: [ticks_us of a new setpoint or None, n, sum, max]
+        self.lat = [None, 0, 0, 0]
+        self.timer = Timer(0)
+        self.timer.init(period=tick_ms, mode=Timer.PERIODIC, callback=self._tick)
+
+    def set(self, left, right):
+        if left != self.target[0] or right != self.target[1]:
+            self.target[0] = left
+            self.target[1] = right
+            if self.lat[0] is None:
+                self.lat[0] = time.ticks_us()
+        self.t_set = time.ticks_ms()
+
+    def _tick(self, t):
+        if time.ticks_diff(time.ticks_ms(), self.t_set) > TIMEOUT_MS:
+            self.target[0] = self.target[1] = 0
+        for i in (0, 1):
+            v = self.speed[i]
+            d = self.target[i] - v
+            if d == 0:
+                continue
+            if d > self.step:
+                d = self.step
+            elif d < -self.step:
+                d = -self.step
+            n = v + d
+            if v > 0 > n or v < 0 < n:
+                n = 0
+            self._apply(i, v, n)
+        lat = self.lat
+        if lat[0] is not None:
+            us = time.ticks_diff(time.ticks_us(), lat[0])
+            lat[0] = None
+            lat[1] += 1
+            lat[2] += us
+            if us > lat[3]:
+                lat[3] = us
+
+    def _apply(self, i, old, new):
+        s = (new > 0) - (new < 0)
+        if s != (old > 0) - (old < 0):
+            # Only at zero: one side of the change always has no duty
+            self.motor.apply(self.dirs[i][s + 1])
+        self.pwm[i].duty_u16(abs(new) * 65535 // setpoint.FULL)
+        self.speed[i] = new
+
+    def halt(self):
+        self.timer.deinit()
+        for p in self.pwm:
+            p.duty_u16(0)
+        self.motor.go("stop")
+        self.speed[0] = self.speed[1] = 0
+
+
+def run():
+    drive = DiffDrive()
+    poll = uselect.poll()
+    poll.register(sys.stdin, uselect.POLLIN)
+
+    def ready():
+        for _ in poll.ipoll(0):
+            return True
+        return False
+
+    frame = None                # hex digits after a 'V', None outside a frame
+    t_status = time.ticks_ms()
+    print("Diff drive ready: V<left><right><check> setpoints, space = stop, q = quit.")
+    while True:
+        poll.poll(STATUS_MS if STATUS_MS is not None else -1)
+        while ready():
+            c = sys.stdin.read(1)
+            if frame is not None:
+                if c == "\n" or c == "\r":
+                    sp = setpoint.decode("".join(frame))
+                    if sp:
+                        drive.set(sp[0], sp[1])
+                    frame = None
+                elif len(frame) < 6:
+                    frame.append(c)
+                else:
+                    frame = None
+            elif c == "V":
+                frame = []
+            elif c == " " or c == "x":
+                drive.set(0, 0)
+            elif c == "q":
+                drive.halt()
+                print("Stopped. Reboot to run again.")
+                return
+
+        now = time.ticks_ms()
+        if STATUS_MS is not None and time.ticks_diff(now, t_status) >= STATUS_MS:
+            t_status = now
+            lat = drive.lat
+            if drive.speed[0] or drive.speed[1] or drive.target[0] or drive.target[1]:
+                print("L %4d R %4d  setpoint to PWM us avg/max: %d / %d (%d)" % (
+                    drive.speed[0], drive.speed[1], lat[2] // max(1, lat[1]), lat[3], lat[1]))
+
+
+if __name__ == "__main__":
+    run()
@@ -1,7 +1,7 @@
-from machine import Pin
 import sys
 import time
 import uselect
+from l298n import L298N
 
 # Pin mapping for L298N inputs
 # Adjust these if your wiring order is different
@@ -10,94 +10,233 @@ IN2_PIN = 19  # Motor A input 2
 IN3_PIN = 22  # Motor B input 1
 IN4_PIN = 23  # Motor B input 2
 
-in1 = Pin(IN1_PIN, Pin.OUT)
-in2 = Pin(IN2_PIN, Pin.OUT)
-in3 = Pin(IN3_PIN, Pin.OUT)
-in4 = Pin(IN4_PIN, Pin.OUT)
-
-# Helper functions
-
-def stop():
-    in1.off(); in2.off(); in3.off(); in4.off()
-    print("STOP")
-
-def forward():
-    # Both motors forward
-    in1.on();  in2.off()
-    in3.on();  in4.off()
-    print("FORWARD")
-
-def backward():
-    # Both motors backward
-    in1.off(); in2.on()
-    in3.off(); in4.on()
-    print("BACKWARD")
-
-def left():
-    # Left motor backward, right motor forward
-    in1.off(); in2.on()   # Left
-    in3.on();  in4.off()  # Right
-    print("LEFT")
-
-def right():
-    # Left motor forward, right motor backward
-    in1.on();  in2.off()  # Left
-    in3.off(); in4.on()   # Right
-    print("RIGHT")
-
-# Non-blocking character read from stdin
+# Link speed, same handshake as main.py: "~B SET <rate> <nonce>" from
+# baudlink.py moves the UART to a faster rate for a CRC-checked trial, and it
+# falls back to LINK_BASE unless "~B KEEP" confirms within LINK_TRIAL_MS
+LINK_BASE = 115200
+LINK_RATES = (921600, 2000000)
+LINK_TRIAL_MS = 1500
+LINK_SETTLE_MS = 50
+LINK_TEST_LINES = 8
+
+# Framed commands from mac_keyboard_drive.py --framed: "~M <seq> <key>" with
+# seq in hex, acked as "~A <seq> <ticks_us when applied>" (both hex). Once
+# frames are coming, the motors stop if none arrives for DEADMAN_MS and
+# "~X <ticks_us>" is printed; the host can change the window with "~D <ms>"
+# (0 = off). A plain key byte hands control back to a terminal (no deadman).
+DEADMAN_MS = 500
+
+# Direction changes are single register writes (l298n.py, upload it too)
+motor = L298N((IN1_PIN, IN2_PIN, IN3_PIN, IN4_PIN))
+
+# Motion commands; motor A is the left wheel, motor B the right
+STOP, FORWARD, BACKWARD, LEFT, RIGHT, QUIT = range(6)
+NAMES = ("STOP", "FORWARD", "BACKWARD", "LEFT", "RIGHT")
+MASKS = [motor.masks[name.lower()] for name in NAMES]
+
+def drive(cmd):
+    motor.apply(MASKS[cmd])
+
+# Key bytes -> command. Arrow keys arrive as ESC [ A/B/C/D.
+KEYS = {}
+for _keys, _cmd in (("wW", FORWARD), ("sS", BACKWARD), ("aA", LEFT), ("dD", RIGHT),
+                    (" \r\nxX", STOP), ("qQ", QUIT)):
+    for _k in _keys:
+        KEYS[ord(_k)] = _cmd
+ARROWS = {ord("A"): FORWARD, ord("B"): BACKWARD, ord("C"): RIGHT, ord("D"): LEFT}
+
+# Non-blocking stdin
 poll = uselect.poll()
 poll.register(sys.stdin, uselect.POLLIN)
 
-def read_char(timeout_ms=0):
-    events = poll.poll(timeout_ms)
-    if events:
+def ready():
+    # ipoll: no result list is allocated per check
+    for _ in poll.ipoll(0):
+        return True
+    return False
+
+# Byte parser state, kept across reads so a sequence split between two
+# reads still parses: plain keys, after ESC, inside ESC [ ..., in a '~' line
+P_KEY, P_ESC, P_CSI, P_LINK = range(4)
+parser = [P_KEY]
+line = []
+
+# Framed mode: [armed, ms of the last frame, window ms]; seqs to ack
+deadman = [False, 0, DEADMAN_MS]
+acks = []
+
+def frame(p):
+    """Handle a "~M" or "~D" line. Returns its command, or -1."""
+    try:
+        if p[0] == "~M" and len(p) == 3:
+            seq = int(p[1], 16)
+            c = KEYS.get(ord(p[2][0]), -1)
+            if c < 0:
+                return -1
+            acks.append(seq)
+            deadman[0] = deadman[2] > 0
+            deadman[1] = time.ticks_ms()
+            return c
+        if p[0] == "~D" and len(p) == 2:
+            deadman[2] = int(p[1])
+            deadman[0] = deadman[0] and deadman[2] > 0
+            print("~D", deadman[2])
+    except ValueError:
+        pass                                    # garbled frame: the host sees no ack
+    return -1
+
+def pump():
+    """Parse every byte that has arrived. Returns the last command in them,
+    QUIT if any was quit, or -1 if there was none."""
+    cmd = -1
+    while ready():
+        b = ord(sys.stdin.read(1))
+        st = parser[0]
+        if st == P_LINK:
+            if b == 13 or b == 10:
+                parser[0] = P_KEY
+                p = ("".join(line)).split()
+                line.clear()
+                if p and p[0][:2] in ("~M", "~D"):
+                    c = frame(p)
+                    if c >= 0 and cmd != QUIT:
+                        cmd = c
+                else:
+                    link_command(p)
+            elif len(line) < 48:
+                line.append(chr(b))
+            continue
+        if st == P_ESC:
+            if b == 0x5B:                       # '['
+                parser[0] = P_CSI
+                continue
+            parser[0] = P_KEY                   # lone ESC: b is a key of its own
+        elif st == P_CSI:
+            if 0x40 <= b <= 0x7E:               # final byte ends the sequence
+                parser[0] = P_KEY
+                c = ARROWS.get(b, -1)
+                if c >= 0 and cmd != QUIT:
+                    cmd = c
+            continue
+        if b == 0x1B:
+            parser[0] = P_ESC
+        elif b == 0x7E:                         # '~'
+            parser[0] = P_LINK
+            line.append("~")
+        else:
+            c = KEYS.get(b, -1)
+            if c >= 0:
+                deadman[0] = False
+                if cmd != QUIT:
+                    cmd = c
+    return cmd
+
+# Link speed negotiation
+# [rate, trial deadline, nonce or None once kept]
+link = [LINK_BASE, 0, None]
+uart = None
+
+def crc16(data):
+    # CRC-16/CCITT-FALSE, as in main.py and telemetry.py
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+    return "%04x" % crc
+
+def link_rate(rate):
+    global uart
+    from machine import UART
+    time.sleep_ms(5)  # let the last reply leave at the old rate
+    if uart is None:
+        uart = UART(0, baudrate=rate)
+    else:
+        uart.init(baudrate=rate)
+    link[0] = rate
+
+def link_command(p):
+    if p == ["~B?"]:
+        print("~B RATES", LINK_BASE, *LINK_RATES)
+    elif len(p) == 4 and p[0] == "~B" and p[1] == "SET":
         try:
-            return sys.stdin.read(1)
-        except Exception:
-            return None
-    return None
+            rate = int(p[2])
+        except ValueError:
+            rate = 0                        # garbled: NAK it like any unknown rate
+        if rate != LINK_BASE and rate not in LINK_RATES:
+            print("~B NAK", rate)
+            return
+        print("~B ACK", rate, p[3])
+        link_rate(rate)
+        time.sleep_ms(LINK_SETTLE_MS)
+        if rate == LINK_BASE:
+            link[2] = None
+            print("~B KEPT", rate)
+            return
+        link[1] = time.ticks_add(time.ticks_ms(), LINK_TRIAL_MS)
+        link[2] = p[3]
+        for i in range(LINK_TEST_LINES):
+            pay = ''.join(chr(33 + (i + k) % 94) for k in range(94))
+            print("~B TEST", i, pay, crc16(pay.encode()))
+    elif len(p) == 4 and p[0] == "~B" and p[1] == "KEEP":
+        if p[2] == link[2] and p[3] == crc16(("KEEP " + p[2]).encode()):
+            link[2] = None
+            print("~B KEPT", link[0])
+
+def link_check():
+    if link[2] is not None and time.ticks_diff(time.ticks_ms(), link[1]) >= 0:
+        link[2] = None
+        link_rate(LINK_BASE)
+        print("~B REVERT", LINK_BASE)
 
 print("ESP32 L298N controller ready.")
 print("Controls: Arrow keys or WASD. Space/Enter = STOP, q = quit.")
-stop()
+
+# Only the latest command in a burst of keys is applied, and the pins change
+# before anything is printed. Status lines are at most one per STATUS_MS
+# (the state at the end of the interval), or off with STATUS_MS = None.
+STATUS_MS = 100
+cur = STOP
+drive(STOP)
+shown = -1
+t_status = time.ticks_add(time.ticks_ms(), -(STATUS_MS or 0))
 
 while True:
-    ch = read_char(100)
-    if not ch:
-        continue
-
-    # Handle ANSI escape sequences for arrow keys: ESC [ A/B/C/D
-    if ch == "\x1b":
-        ch1 = read_char(20)
-        ch2 = read_char(20)
-        if ch1 == "[" and ch2:
-            if ch2 == "A":
-                forward()
-            elif ch2 == "B":
-                backward()
-            elif ch2 == "C":
-                right()
-            elif ch2 == "D":
-                left()
-        continue
-
-    # Simple keys fallback (works in most terminals/Thonny input)
-    c = ch.lower()
-    if c == 'w':
-        forward()
-    elif c == 's':
-        backward()
-    elif c == 'a':
-        left()
-    elif c == 'd':
-        right()
-    elif c in (' ', '\r', '\n', 'x'):
-        stop()
-    elif c == 'q':
-        stop()
+    wait = -1
+    if link[2] is not None:
+        wait = 100
+    if STATUS_MS is not None and shown != cur:
+        wait = max(0, STATUS_MS - time.ticks_diff(time.ticks_ms(), t_status))
+    if deadman[0]:
+        left = max(0, deadman[2] - time.ticks_diff(time.ticks_ms(), deadman[1]))
+        wait = left if wait < 0 else min(wait, left)
+    poll.poll(wait)
+
+    cmd = pump()
+    link_check()
+    if cmd == QUIT:
+        drive(STOP)
+        print("STOP")
         print("Exiting control loop. Reboot to run again.")
         break
+    if cmd >= 0 and cmd != cur:
+        drive(cmd)
+        cur = cmd
+    if acks:
+        # Every frame of a burst is acked with the time the burst took effect
+        t = time.ticks_us()
+        for seq in acks:
+            print("~A %x %x" % (seq, t))
+        acks.clear()
+    if deadman[0] and time.ticks_diff(time.ticks_ms(), deadman[1]) >= deadman[2]:
+        deadman[0] = False
+        drive(STOP)
+        cur = STOP
+        print("~X %x" % time.ticks_us())
 
-    # Small debounce
-    time.sleep_ms(10) 
+    if STATUS_MS is not None and shown != cur:
+        now = time.ticks_ms()
+        if time.ticks_diff(now, t_status) >= STATUS_MS:
+            print(NAMES[cur])
+            shown = cur
+            t_status = now
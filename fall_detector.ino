@@ -12,6 +12,15 @@
  *   - Streams accelerometer (g) at 50 Hz
  *   - Detects free-fall (|a| < 0.35 g for >= 60 ms) followed by impact (|a| > 2.2 g) within 1.5 s
  *   - When detected, prints "FALL_DETECTED" and pauses events for 2 s cooldown
+ *   - With STREAM_BINARY, sends every sample and event as COBS/CRC16 frames
+ *     instead (same format as main.py STREAM = "binary"; decode with telemetry.py)
+ *   - With SAMPLER_TASK, sampling and detection run in a FreeRTOS task pinned
+ *     to core 0 and loop() (core 1) only formats and prints, so a host that is
+ *     slow to drain Serial costs counted ring overruns, never missed samples
+ *     (same split as main.py MODE = "thread")
+ *   - Answers the same "~B" link-speed handshake as main.py, so baudlink.py can
+ *     move the link to 921600 or 2000000 after connecting; an unconfirmed rate
+ *     falls back to 115200 after LINK_TRIAL_MS
  */
 
 #include <Wire.h>
@@ -32,6 +41,30 @@ static const uint32_t EVENT_COOLDOWN_MS  = 2000;    // after a detection, ignore
 // Sampling
 static const uint32_t SAMPLE_INTERVAL_MS = 20; // 50 Hz
 
+// Output: false = text lines, true = binary frames for telemetry.py
+static const bool STREAM_BINARY = false;
+static const uint8_t STREAM_BATCH = 25; // samples per frame
+
+// Sampler task: core 0 samples into a ring, loop() on core 1 drains it
+static const bool SAMPLER_TASK = true;
+static const uint16_t RING_SLOTS = 64;         // power of two; 64 = 1.28 s at 50 Hz
+static const uint32_t DRAIN_INTERVAL_MS = 10;
+static const uint32_t STATS_INTERVAL_MS = 10000;
+
+// Link speed negotiation (see main.py LINK_* and baudlink.py)
+static const uint32_t LINK_BASE = 115200;
+static const uint32_t LINK_RATES[] = {921600, 2000000};
+static const uint32_t LINK_TRIAL_MS = 1500;
+static const uint32_t LINK_SETTLE_MS = 50;   // host reopens its port at the new rate meanwhile
+static const uint8_t LINK_TEST_LINES = 8;
+
+// Binary frame types and event codes (see telemetry.py)
+static const uint8_t FRAME_SAMPLES = 0x01;
+static const uint8_t FRAME_EVENT   = 0x02;
+static const uint8_t EV_FREE_FALL         = 1;
+static const uint8_t EV_FALL              = 2;
+static const uint8_t EV_FREE_FALL_TIMEOUT = 3;
+
 // State
 bool inFreeFall = false;
 uint32_t freeFallStartMs = 0;
@@ -39,6 +72,37 @@ uint32_t lastEventMs = 0;
 
 // Raw readings
 int16_t accX = 0, accY = 0, accZ = 0;
+uint8_t accRaw[6]; // last sample as read, big endian
+
+// Sampler -> loop() ring. The task only writes ring[ringHead] and ringHead,
+// loop() only reads ring[ringTail] and advances ringTail.
+struct Sample {
+  uint8_t raw[6];
+  uint32_t t;
+  uint8_t code; // event raised by this sample, 0 if none
+};
+Sample ring[RING_SLOTS];
+volatile uint16_t ringHead = 0, ringTail = 0;
+volatile uint32_t ringOverruns = 0, ringI2cErrors = 0;
+volatile uint16_t ringMaxBacklog = 0;
+// Event whose sample was dropped on overrun, delivered before slot pendSlot
+volatile uint8_t pendCode = 0;
+volatile uint32_t pendT = 0;
+volatile uint16_t pendSlot = 0;
+
+// Link state: '~' command being received, and the rate on trial
+char linkCmd[48];
+uint8_t linkLen = 0;
+uint32_t linkRate = LINK_BASE;
+uint32_t linkDeadline = 0;
+bool linkTrial = false;
+char linkNonce[16];
+
+// Binary stream batch
+uint8_t batchRaw[STREAM_BATCH * 6];
+uint8_t batchCount = 0;
+uint32_t batchT0 = 0, batchT1 = 0;
+uint8_t frameSeq = 0;
 
 bool writeRegister(uint8_t reg, uint8_t value) {
   Wire.beginTransmission(MPU_ADDR);
@@ -69,7 +133,7 @@ bool initMPU() {
 }
 
 bool readAccel() {
-  uint8_t buf[6];
+  uint8_t* buf = accRaw;
   if (!readRegisters(0x3B, 6, buf)) return false; // ACCEL_XOUT_H ... ACCEL_ZOUT_L
   accX = ((int16_t)buf[0] << 8) | buf[1];
   accY = ((int16_t)buf[2] << 8) | buf[3];
@@ -77,11 +141,330 @@ bool readAccel() {
   return true;
 }
 
+uint16_t crc16(const uint8_t* data, size_t len) {
+  // CRC-16/CCITT-FALSE
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (uint16_t)((crc << 1) ^ 0x1021) : (uint16_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+void crcHex(const char* text, char* out) {
+  snprintf(out, 5, "%04x", crc16((const uint8_t*)text, strlen(text)));
+}
+
+void linkSetRate(uint32_t rate) {
+  Serial.flush(); // last reply out at the old rate
+  Serial.updateBaudRate(rate);
+  linkRate = rate;
+}
+
+void linkCommand(char* line) {
+  char* tok[5];
+  uint8_t n = 0;
+  for (char* p = strtok(line, " "); p && n < 5; p = strtok(NULL, " ")) tok[n++] = p;
+
+  if (n == 1 && strcmp(tok[0], "~B?") == 0) {
+    Serial.print("~B RATES "); Serial.print(LINK_BASE);
+    for (uint32_t r : LINK_RATES) { Serial.print(" "); Serial.print(r); }
+    Serial.println();
+  } else if (n == 4 && strcmp(tok[1], "SET") == 0) {
+    const uint32_t rate = strtoul(tok[2], NULL, 10);
+    bool ok = rate == LINK_BASE;
+    for (uint32_t r : LINK_RATES) ok |= rate == r;
+    if (!ok) {
+      Serial.print("~B NAK "); Serial.println(rate);
+      return;
+    }
+    Serial.print("~B ACK "); Serial.print(rate); Serial.print(" "); Serial.println(tok[3]);
+    linkSetRate(rate);
+    delay(LINK_SETTLE_MS);
+    if (rate == LINK_BASE) {
+      linkTrial = false;
+      Serial.print("~B KEPT "); Serial.println(rate);
+      return;
+    }
+    strncpy(linkNonce, tok[3], sizeof(linkNonce) - 1);
+    linkNonce[sizeof(linkNonce) - 1] = 0;
+    linkDeadline = millis() + LINK_TRIAL_MS;
+    linkTrial = true;
+    // Each line is a rotation of every printable character
+    char pay[95], hex[5];
+    for (uint8_t i = 0; i < LINK_TEST_LINES; i++) {
+      for (uint8_t k = 0; k < 94; k++) pay[k] = 33 + (i + k) % 94;
+      pay[94] = 0;
+      crcHex(pay, hex);
+      Serial.print("~B TEST "); Serial.print(i); Serial.print(" ");
+      Serial.print(pay); Serial.print(" "); Serial.println(hex);
+    }
+  } else if (n == 4 && strcmp(tok[1], "KEEP") == 0 && linkTrial) {
+    char expect[24], hex[5];
+    snprintf(expect, sizeof(expect), "KEEP %s", linkNonce);
+    crcHex(expect, hex);
+    if (strcmp(tok[2], linkNonce) == 0 && strcmp(tok[3], hex) == 0) {
+      linkTrial = false;
+      Serial.print("~B KEPT "); Serial.println(linkRate);
+    }
+  }
+}
+
+// Other input is ignored; only '~' lines are commands
+void serviceLink() {
+  while (Serial.available()) {
+    const char c = Serial.read();
+    if (linkLen) {
+      if (c == '\r' || c == '\n') {
+        linkCmd[linkLen] = 0;
+        linkLen = 0;
+        linkCommand(linkCmd);
+      } else if (linkLen < sizeof(linkCmd) - 1) {
+        linkCmd[linkLen++] = c;
+      }
+    } else if (c == '~') {
+      linkCmd[linkLen++] = c;
+    }
+  }
+  if (linkTrial && (int32_t)(millis() - linkDeadline) >= 0) {
+    linkTrial = false;
+    linkSetRate(LINK_BASE);
+    Serial.print("~B REVERT "); Serial.println(LINK_BASE);
+  }
+}
+
+void putU32(uint8_t* p, uint32_t v) {
+  v &= 0x3FFFFFFF; // same 30-bit tick wrap as MicroPython
+  p[0] = v; p[1] = v >> 8; p[2] = v >> 16; p[3] = v >> 24;
+}
+
+// Appends the CRC, COBS-encodes and writes frame[0..len) between 0x00 delimiters.
+// frame must have 2 spare bytes after len.
+void sendFrame(uint8_t* frame, size_t len) {
+  static uint8_t enc[14 + STREAM_BATCH * 6 + 8];
+  const uint16_t crc = crc16(frame, len);
+  frame[len++] = crc & 0xFF;
+  frame[len++] = crc >> 8;
+
+  size_t o = 0;
+  enc[o++] = 0;
+  size_t codeIdx = o++;
+  uint8_t code = 1;
+  for (size_t i = 0; i < len; i++) {
+    if (frame[i] == 0) {
+      enc[codeIdx] = code;
+      codeIdx = o++;
+      code = 1;
+    } else {
+      enc[o++] = frame[i];
+      if (++code == 0xFF) {
+        enc[codeIdx] = code;
+        codeIdx = o++;
+        code = 1;
+      }
+    }
+  }
+  enc[codeIdx] = code;
+  enc[o++] = 0;
+  Serial.write(enc, o);
+  frameSeq++;
+}
+
+void flushSamples() {
+  if (batchCount == 0) return;
+  static uint8_t frame[14 + STREAM_BATCH * 6];
+  frame[0] = FRAME_SAMPLES;
+  frame[1] = frameSeq;
+  putU32(frame + 2, batchT0);
+  putU32(frame + 6, batchT1);
+  frame[10] = batchCount;
+
+  // Delta-encode as int8 when every step fits, otherwise send raw int16
+  uint8_t* body = frame + 12;
+  memcpy(body, batchRaw, 6);
+  size_t size = 6;
+  bool fits = true;
+  for (uint8_t i = 6; i < batchCount * 6 && fits; i += 2) {
+    const int16_t v = ((int16_t)batchRaw[i] << 8) | batchRaw[i + 1];
+    const int16_t p = ((int16_t)batchRaw[i - 6] << 8) | batchRaw[i - 5];
+    const int32_t d = (int32_t)v - p;
+    if (d < -128 || d > 127) fits = false;
+    else body[size++] = (uint8_t)(int8_t)d;
+  }
+  if (fits) {
+    frame[11] = 1;
+  } else {
+    frame[11] = 0;
+    memcpy(body, batchRaw, batchCount * 6);
+    size = batchCount * 6;
+  }
+  batchCount = 0;
+  sendFrame(frame, 12 + size);
+}
+
+void streamSample(const uint8_t* raw, uint32_t now) {
+  if (batchCount == 0) batchT0 = now;
+  batchT1 = now;
+  memcpy(batchRaw + batchCount * 6, raw, 6);
+  if (++batchCount == STREAM_BATCH) flushSamples();
+}
+
+void reportEvent(uint8_t code, uint32_t now, const char* text) {
+  if (!STREAM_BINARY) {
+    Serial.println(text);
+    return;
+  }
+  flushSamples(); // keep samples ahead of the event on the wire
+  uint8_t frame[7 + 2];
+  frame[0] = FRAME_EVENT;
+  frame[1] = frameSeq;
+  putU32(frame + 2, now);
+  frame[6] = code;
+  sendFrame(frame, 7);
+}
+
 float lsbToG(int16_t v) {
   // For +/- 2g: 16384 LSB per g
   return (float)v / 16384.0f;
 }
 
+float magnitude(const uint8_t* raw) {
+  const float ax = lsbToG(((int16_t)raw[0] << 8) | raw[1]);
+  const float ay = lsbToG(((int16_t)raw[2] << 8) | raw[3]);
+  const float az = lsbToG(((int16_t)raw[4] << 8) | raw[5]);
+  return sqrtf(ax*ax + ay*ay + az*az);
+}
+
+const char* eventText(uint8_t code) {
+  switch (code) {
+    case EV_FREE_FALL: return "-- free-fall start --";
+    case EV_FALL: return "FALL_DETECTED";
+    default: return "-- free-fall timeout --";
+  }
+}
+
+// Free-fall -> impact state machine, fed one sample. Returns the event code, 0 if none.
+uint8_t detectStep(float amag, uint32_t now) {
+  // Cooldown handling
+  if (now - lastEventMs < EVENT_COOLDOWN_MS) {
+    inFreeFall = false;
+    return 0;
+  }
+
+  // Free-fall detection (magnitude significantly below 1 g)
+  if (!inFreeFall) {
+    if (amag < FREE_FALL_G_THRESHOLD) {
+      inFreeFall = true;
+      freeFallStartMs = now;
+      return EV_FREE_FALL;
+    }
+    return 0;
+  }
+
+  // If we have been in free-fall long enough, look for impact window
+  if (amag > IMPACT_G_THRESHOLD && (now - freeFallStartMs) <= IMPACT_WINDOW_MS && (now - freeFallStartMs) >= FREE_FALL_MIN_MS) {
+    lastEventMs = now;
+    inFreeFall = false;
+    return EV_FALL;
+  }
+  // Cancel free-fall if it lasts too long without impact
+  if (now - freeFallStartMs > IMPACT_WINDOW_MS) {
+    inFreeFall = false;
+    return EV_FREE_FALL_TIMEOUT;
+  }
+  // Also cancel if magnitude returns close to 1 g quickly
+  if (amag > 0.8f && (now - freeFallStartMs) > FREE_FALL_MIN_MS) {
+    inFreeFall = false;
+  }
+  return 0;
+}
+
+// Print telemetry occasionally, or stream every sample in binary mode
+void emitSample(const uint8_t* raw, uint32_t now) {
+  static uint32_t lastPrintMs = 0;
+  if (STREAM_BINARY) {
+    streamSample(raw, now);
+  } else if (now - lastPrintMs >= 200) {
+    lastPrintMs = now;
+    Serial.print("ACC g: ");
+    Serial.print(lsbToG(((int16_t)raw[0] << 8) | raw[1]), 2); Serial.print(", ");
+    Serial.print(lsbToG(((int16_t)raw[2] << 8) | raw[3]), 2); Serial.print(", ");
+    Serial.print(lsbToG(((int16_t)raw[4] << 8) | raw[5]), 2); Serial.print(" |a|=");
+    Serial.println(magnitude(raw), 2);
+  }
+}
+
+void samplerTask(void*) {
+  TickType_t wake = xTaskGetTickCount();
+  for (;;) {
+    vTaskDelayUntil(&wake, pdMS_TO_TICKS(SAMPLE_INTERVAL_MS));
+    const uint32_t now = millis();
+
+    // The head slot is never read by loop(), so fill it in place
+    const uint16_t h = ringHead;
+    Sample& s = ring[h];
+    if (!readRegisters(0x3B, 6, s.raw)) {
+      ringI2cErrors++;
+      continue;
+    }
+    s.t = now;
+    s.code = detectStep(magnitude(s.raw), now);
+
+    const uint16_t next = (h + 1) & (RING_SLOTS - 1);
+    if (next == ringTail) {
+      // loop() is stuck on Serial: drop the sample, but keep a FALL_DETECTED
+      ringOverruns++;
+      if (s.code && (pendCode == 0 || s.code == EV_FALL)) {
+        pendT = now;
+        pendSlot = h;
+        pendCode = s.code;
+      }
+      continue;
+    }
+    __sync_synchronize(); // slot contents before the new head
+    ringHead = next;
+    const uint16_t backlog = (next - ringTail) & (RING_SLOTS - 1);
+    if (backlog > ringMaxBacklog) ringMaxBacklog = backlog;
+  }
+}
+
+void drainRing() {
+  static uint32_t samples = 0, seenOverruns = 0, seenErrors = 0;
+  static uint32_t lastStatsMs = millis();
+
+  for (;;) {
+    const uint16_t t = ringTail;
+    if (pendCode && pendSlot == t) {
+      reportEvent(pendCode, pendT, eventText(pendCode));
+      pendCode = 0;
+    }
+    if (t == ringHead) break;
+    __sync_synchronize(); // new head before the slot contents
+    const Sample& s = ring[t];
+    emitSample(s.raw, s.t);
+    if (s.code) reportEvent(s.code, s.t, eventText(s.code));
+    __sync_synchronize(); // done with the slot before handing it back
+    ringTail = (t + 1) & (RING_SLOTS - 1);
+    samples++;
+  }
+
+  const uint32_t now = millis();
+  if (now - lastStatsMs >= STATS_INTERVAL_MS) {
+    const uint32_t overruns = ringOverruns, errors = ringI2cErrors;
+    Serial.print("THREAD rate Hz: "); Serial.print(samples * 1000 / (now - lastStatsMs));
+    Serial.print(" overruns: "); Serial.print(overruns - seenOverruns);
+    Serial.print(" i2c errors: "); Serial.print(errors - seenErrors);
+    Serial.print(" max backlog: "); Serial.println(ringMaxBacklog);
+    seenOverruns = overruns;
+    seenErrors = errors;
+    ringMaxBacklog = 0;
+    samples = 0;
+    lastStatsMs = now;
+  }
+}
+
 void setup() {
   Serial.begin(115200);
   while (!Serial) { ; }
@@ -111,9 +494,21 @@ void setup() {
   }
 
   Serial.println("Streaming accel at 50 Hz. Move the board to test.\n");
+
+  if (SAMPLER_TASK) {
+    // loop() runs on core 1, so the sampler gets core 0 to itself
+    xTaskCreatePinnedToCore(samplerTask, "sampler", 4096, NULL, 2, NULL, 0);
+  }
 }
 
 void loop() {
+  serviceLink();
+  if (SAMPLER_TASK) {
+    drainRing();
+    delay(DRAIN_INTERVAL_MS);
+    return;
+  }
+
   static uint32_t lastSampleMs = 0;
   const uint32_t now = millis();
   if (now - lastSampleMs < SAMPLE_INTERVAL_MS) return;
@@ -124,51 +519,7 @@ void loop() {
     return;
   }
 
-  const float ax = lsbToG(accX);
-  const float ay = lsbToG(accY);
-  const float az = lsbToG(accZ);
-  const float amag = sqrtf(ax*ax + ay*ay + az*az);
-
-  // Print telemetry occasionally
-  static uint32_t lastPrintMs = 0;
-  if (now - lastPrintMs >= 200) {
-    lastPrintMs = now;
-    Serial.print("ACC g: ");
-    Serial.print(ax, 2); Serial.print(", ");
-    Serial.print(ay, 2); Serial.print(", ");
-    Serial.print(az, 2); Serial.print(" |a|=");
-    Serial.println(amag, 2);
-  }
-
-  // Cooldown handling
-  if (now - lastEventMs < EVENT_COOLDOWN_MS) {
-    inFreeFall = false;
-    return;
-  }
-
-  // Free-fall detection (magnitude significantly below 1 g)
-  if (!inFreeFall) {
-    if (amag < FREE_FALL_G_THRESHOLD) {
-      inFreeFall = true;
-      freeFallStartMs = now;
-      // Optional debug
-      Serial.println("-- free-fall start --");
-    }
-  } else {
-    // If we have been in free-fall long enough, look for impact window
-    if (amag > IMPACT_G_THRESHOLD && (now - freeFallStartMs) <= IMPACT_WINDOW_MS && (now - freeFallStartMs) >= FREE_FALL_MIN_MS) {
-      Serial.println("FALL_DETECTED");
-      lastEventMs = now;
-      inFreeFall = false;
-    }
-    // Cancel free-fall if it lasts too long without impact
-    if (now - freeFallStartMs > IMPACT_WINDOW_MS) {
-      inFreeFall = false;
-      Serial.println("-- free-fall timeout --");
-    }
-    // Also cancel if magnitude returns close to 1 g quickly
-    if (amag > 0.8f && (now - freeFallStartMs) > FREE_FALL_MIN_MS) {
-      inFreeFall = false;
-    }
-  }
-} 
+  emitSample(accRaw, now);
+  const uint8_t code = detectStep(magnitude(accRaw), now);
+  if (code) reportEvent(code, now, eventText(code));
+}
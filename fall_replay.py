@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Offline replay and threshold sweep for the fall-detection state machine.
+
+Runs the same free-fall -> impact logic as detect() in main.py (and the loop
+in fall_detector.ino) over recorded traces, so FREE / IMP / MIN_MS / WIN_MS /
+COOLDOWN can be tuned without reflashing.
+
+The state machine is sequential, but only per free-fall episode: given where
+an episode starts, where it ends (impact, timeout or recovery) follows from
+"next sample at or after index k where ..." lookups and binary searches. The
+threshold crossings are found with NumPy up front, so the Python loop runs
+once per episode instead of once per sample. reference_detect() is the plain
+per-sample port of detect(); --verify checks both agree sample for sample.
+
+Traces are .npz files with t_ms and xyz (raw LSB, +/-2g), as written by
+telemetry.py --save and mac_fall_alarm.py. Ground-truth falls come from an
+optional fall_t_ms array (or from event_t_ms with --events-as-labels).
+
+Examples:
+    python3 fall_replay.py day1.npz --verify
+    python3 fall_replay.py fall_events/*.npz --free 0.25:0.45:0.05 \\
+        --imp 1.8:2.6:0.1 --min 40,60,80 --win 1000,1500 --top 20
+    python3 fall_replay.py --synthetic 24 --free 0.25:0.45:0.02 --imp 1.6:2.8:0.05
+
+Requires: pip install numpy
+"""
+
+import argparse
+import itertools
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+LSB_PER_G = 16384.0
+RECOVER_G = 0.8   # fixed "back near 1 g" threshold in the device code
+
+Params = namedtuple('Params', 'free imp min_ms win_ms cooldown')
+DEVICE = Params(0.35, 2.20, 60, 1500, 2000)
+
+Trace = namedtuple('Trace', 'name t_ms amag falls')
+
+
+def magnitude(xyz) -> np.ndarray:
+    """|a| in g from raw int16 LSB samples, shape (N, 3)."""
+    g = np.asarray(xyz, dtype=np.float64) / LSB_PER_G
+    return np.sqrt(np.einsum('ij,ij->i', g, g))
+
+
+def load_trace(path, events_as_labels=False) -> Trace:
+    d = np.load(path)
+    t = np.rint(d['t_ms']).astype(np.int64)   # the device works in whole ms
+    if 'fall_t_ms' in d:
+        falls = np.asarray(d['fall_t_ms'], dtype=np.float64)
+    elif events_as_labels and 'event_t_ms' in d:
+        falls = np.atleast_1d(np.asarray(d['event_t_ms'], dtype=np.float64))
+    else:
+        falls = np.empty(0)
+    return Trace(os.path.basename(path), t, magnitude(d['xyz']), falls)
+
+
+def synthetic_trace(hours=1.0, rate_hz=50, falls_per_hour=4, seed=0) -> Trace:
+    """Noisy 1 g with occasional stumbles (short dips) and real falls."""
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 * rate_hz)
+    t = (np.arange(n) * 1000 // rate_hz).astype(np.int64)
+    amag = 1.0 + rng.normal(0, 0.08, n)
+    fall_t = []
+    for _ in range(int(hours * falls_per_hour)):
+        i = int(rng.integers(rate_hz * 5, n - rate_hz * 5))
+        ff = int(rng.uniform(0.1, 0.5) * rate_hz)
+        amag[i:i + ff] = rng.uniform(0.05, 0.3, ff)
+        amag[i + ff:i + ff + 2] = rng.uniform(2.0, 3.3, 2)
+        fall_t.append(t[i + ff])
+    for _ in range(int(hours * falls_per_hour * 5)):
+        i = int(rng.integers(0, n - rate_hz))
+        amag[i:i + 3] = rng.uniform(0.2, 0.5, 3)
+        amag[i + 3] = rng.uniform(1.2, 2.4)
+    return Trace('synthetic', t, np.abs(amag), np.array(fall_t, dtype=np.float64))
+
+
+def reference_detect(t, amag, p, strict=False):
+    """Per-sample port of detect() in main.py.
+
+    Returns (detection indices, ff state after each sample). strict=True uses
+    the Arduino sketch's |a| > IMP instead of IMP <= |a|.
+    """
+    ff = False
+    ff_t0 = 0
+    last_event = None
+    dets = []
+    state = np.zeros(len(t), dtype=bool)
+    for k in range(len(t)):
+        now = int(t[k])
+        a = float(amag[k])
+        if last_event is not None and now - last_event < p.cooldown:
+            state[k] = ff
+            continue
+        if not ff:
+            if a < p.free:
+                ff = True
+                ff_t0 = now
+        else:
+            dt = now - ff_t0
+            hit = a > p.imp if strict else p.imp <= a
+            if hit and p.min_ms <= dt <= p.win_ms:
+                dets.append(k)
+                last_event = now
+                ff = False
+            elif dt > p.win_ms or (a > RECOVER_G and dt > p.min_ms):
+                ff = False
+        state[k] = ff
+    return np.array(dets, dtype=np.int64), state
+
+
+class Crossings:
+    """Sorted indices where a threshold test holds, answering "first at or after k"."""
+
+    def __init__(self, mask):
+        self.idx = np.flatnonzero(mask)
+        self.n = len(mask)
+
+    def next(self, k) -> int:
+        j = int(np.searchsorted(self.idx, k))
+        return int(self.idx[j]) if j < len(self.idx) else self.n
+
+
+def detect(t, amag, p, strict=False, low=None, imp=None, rec=None):
+    """Episode-at-a-time equivalent of reference_detect().
+
+    Returns (detection indices, episode starts, episode ends). An episode
+    covers samples start..end-1 in free-fall; end is the sample that closed
+    it (the detection itself when it was a fall), or len(t) if still open.
+    The Crossings can be passed in to share them across a sweep.
+    """
+    n = len(t)
+    if low is None:
+        low = Crossings(amag < p.free)
+    if imp is None:
+        imp = Crossings(amag > p.imp if strict else amag >= p.imp)
+    if rec is None:
+        rec = Crossings(amag > RECOVER_G)
+
+    dets, starts, ends = [], [], []
+    k = 0
+    while k < n:
+        i = low.next(k)
+        if i >= n:
+            break
+        t0 = t[i]
+        k_min = max(int(np.searchsorted(t, t0 + p.min_ms, 'left')), i + 1)   # dt >= MIN
+        k_gt = max(int(np.searchsorted(t, t0 + p.min_ms, 'right')), i + 1)   # dt > MIN
+        k_win = max(int(np.searchsorted(t, t0 + p.win_ms, 'right')), i + 1)  # dt > WIN
+        hit = imp.next(k_min)
+        end = min(hit, rec.next(k_gt), k_win)
+        starts.append(i)
+        ends.append(end)
+        if end >= n:
+            break
+        if end == hit and end < k_win:
+            dets.append(end)
+            k = max(end + 1, int(np.searchsorted(t, t[end] + p.cooldown, 'left')))
+        else:
+            k = end + 1
+    return (np.array(dets, dtype=np.int64), np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64))
+
+
+def ff_state(n, starts, ends) -> np.ndarray:
+    """Per-sample ff flag (as left after each sample) from detect() episodes."""
+    d = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(d, starts, 1)
+    np.add.at(d, ends, -1)
+    return np.cumsum(d[:n]) > 0
+
+
+def verify(trace, p=DEVICE, strict=False):
+    """True if detect() matches reference_detect() sample for sample."""
+    ref_dets, ref_state = reference_detect(trace.t_ms, trace.amag, p, strict)
+    dets, starts, ends = detect(trace.t_ms, trace.amag, p, strict)
+    return (np.array_equal(ref_dets, dets)
+            and np.array_equal(ref_state, ff_state(len(trace.t_ms), starts, ends)))
+
+
+def score(trace, dets, tolerance_ms):
+    """(tp, fp, fn, latencies) matching detections to labelled fall times."""
+    det_t = trace.t_ms[dets].astype(np.float64)
+    used = np.zeros(len(det_t), dtype=bool)
+    lat = []
+    for f in trace.falls:
+        cand = np.flatnonzero(~used & (np.abs(det_t - f) <= tolerance_ms))
+        if len(cand):
+            used[cand[0]] = True
+            lat.append(det_t[cand[0]] - f)
+    tp = len(lat)
+    return tp, len(det_t) - tp, len(trace.falls) - tp, lat
+
+
+_TRACES = None
+_RECOVER = None
+
+
+def _init_worker(traces):
+    global _TRACES, _RECOVER
+    _TRACES = traces
+    _RECOVER = [Crossings(tr.amag > RECOVER_G) for tr in traces]
+
+
+def _run_group(args):
+    """Every (min, win, cooldown) combo for one (free, imp) pair, sharing crossings."""
+    free, imp, rest, strict, tolerance_ms = args
+    per_trace = [(Crossings(tr.amag < free),
+                  Crossings(tr.amag > imp if strict else tr.amag >= imp))
+                 for tr in _TRACES]
+    hours = sum((tr.t_ms[-1] - tr.t_ms[0]) for tr in _TRACES if len(tr.t_ms)) / 3.6e6
+
+    results = []
+    for min_ms, win_ms, cooldown in rest:
+        p = Params(free, imp, min_ms, win_ms, cooldown)
+        tp = fp = fn = 0
+        lat = []
+        for tr, (lo, hi), rec in zip(_TRACES, per_trace, _RECOVER):
+            dets, _, _ = detect(tr.t_ms, tr.amag, p, strict, lo, hi, rec)
+            a, b, c, d = score(tr, dets, tolerance_ms)
+            tp += a
+            fp += b
+            fn += c
+            lat += d
+        results.append({
+            **p._asdict(),
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'recall': tp / (tp + fn) if tp + fn else float('nan'),
+            'precision': tp / (tp + fp) if tp + fp else float('nan'),
+            'fp_per_hour': fp / hours if hours else float('nan'),
+            'latency_ms_mean': float(np.mean(lat)) if lat else float('nan'),
+            'latency_ms_max': float(np.max(lat)) if lat else float('nan'),
+        })
+    return results
+
+
+def sweep(traces, free, imp, min_ms, win_ms, cooldown, strict=False,
+          tolerance_ms=2000, workers=None):
+    """Score every parameter combination over all traces on a process pool."""
+    rest = list(itertools.product(min_ms, win_ms, cooldown))
+    tasks = [(f, i, rest, strict, tolerance_ms) for f in free for i in imp]
+    if workers == 1:
+        _init_worker(traces)
+        groups = map(_run_group, tasks)
+        return [r for g in groups for r in g]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(traces,)) as pool:
+        return [r for g in pool.map(_run_group, tasks) for r in g]
+
+
+def _values(spec, cast=float):
+    """'0.3' or '0.3,0.35' or '0.25:0.45:0.05' (inclusive range)."""
+    if ':' in spec:
+        lo, hi, step = (float(x) for x in spec.split(':'))
+        return [cast(round(v, 6)) for v in np.arange(lo, hi + step / 2, step)]
+    return [cast(x) for x in spec.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay fall detection over recorded traces')
+    parser.add_argument('traces', nargs='*', help='.npz traces (t_ms, xyz[, fall_t_ms])')
+    parser.add_argument('--synthetic', type=float, metavar='HOURS',
+                        help='Use a synthetic trace of this many hours at 50 Hz')
+    parser.add_argument('--events-as-labels', action='store_true',
+                        help='Treat recorded event_t_ms as ground-truth falls')
+    parser.add_argument('--arduino', action='store_true',
+                        help='Use the sketch\'s strict |a| > IMP impact test')
+    parser.add_argument('--verify', action='store_true',
+                        help='Check the vectorized engine against the per-sample reference')
+    parser.add_argument('--free', default=str(DEVICE.free))
+    parser.add_argument('--imp', default=str(DEVICE.imp))
+    parser.add_argument('--min', default=str(DEVICE.min_ms))
+    parser.add_argument('--win', default=str(DEVICE.win_ms))
+    parser.add_argument('--cooldown', default=str(DEVICE.cooldown))
+    parser.add_argument('--tolerance', type=float, default=2000,
+                        help='Max |detection - label| in ms to count as a hit (default: 2000)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--top', type=int, default=10, help='Rows to print (default: 10)')
+    parser.add_argument('--csv', help='Write every result row to this CSV file')
+    args = parser.parse_args()
+
+    traces = [load_trace(p, args.events_as_labels) for p in args.traces]
+    if args.synthetic:
+        traces.append(synthetic_trace(args.synthetic))
+    if not traces:
+        parser.error('give at least one trace or --synthetic HOURS')
+    n = sum(len(tr.t_ms) for tr in traces)
+    print(f'{len(traces)} trace(s), {n} samples, {sum(len(tr.falls) for tr in traces)} labelled falls')
+
+    if args.verify:
+        for tr in traces:
+            t0 = time.perf_counter()
+            ref = reference_detect(tr.t_ms, tr.amag, DEVICE, args.arduino)
+            t1 = time.perf_counter()
+            vec = detect(tr.t_ms, tr.amag, DEVICE, args.arduino)
+            t2 = time.perf_counter()
+            ok = verify(tr, DEVICE, args.arduino)
+            print(f'{tr.name}: {"MATCH" if ok else "MISMATCH"}  detections={len(ref[0])}  '
+                  f'reference {t1 - t0:.3f}s  vectorized {t2 - t1:.3f}s')
+        return
+
+    grid = dict(free=_values(args.free), imp=_values(args.imp),
+                min_ms=_values(args.min, int), win_ms=_values(args.win, int),
+                cooldown=_values(args.cooldown, int))
+    combos = int(np.prod([len(v) for v in grid.values()]))
+    print(f'Sweeping {combos} parameter combinations...')
+    t0 = time.perf_counter()
+    results = sweep(traces, strict=args.arduino, tolerance_ms=args.tolerance,
+                    workers=args.workers, **grid)
+    el = time.perf_counter() - t0
+    print(f'Done in {el:.2f}s ({combos / el:.0f} combos/s, {combos * n / el / 1e6:.0f}M samples/s)')
+
+    results.sort(key=lambda r: (-np.nan_to_num(r['recall']), r['fp'], np.nan_to_num(r['latency_ms_mean'])))
+    print(f'\n{"free":>5} {"imp":>5} {"min":>4} {"win":>5} {"cool":>5} '
+          f'{"tp":>4} {"fp":>5} {"fn":>4} {"recall":>6} {"fp/h":>6} {"lat ms":>7}')
+    for r in results[:args.top]:
+        print(f'{r["free"]:5.2f} {r["imp"]:5.2f} {r["min_ms"]:4d} {r["win_ms"]:5d} {r["cooldown"]:5d} '
+              f'{r["tp"]:4d} {r["fp"]:5d} {r["fn"]:4d} {r["recall"]:6.2f} {r["fp_per_hour"]:6.2f} '
+              f'{r["latency_ms_mean"]:7.1f}')
+
+    if args.csv:
+        import csv
+        with open(args.csv, 'w', newline='') as f:
+            w = csv.DictWriter(f, fieldnames=list(results[0]))
+            w.writeheader()
+            w.writerows(results)
+        print(f'\nWrote {len(results)} rows to {args.csv}')
+
+
+if __name__ == '__main__':
+    main()
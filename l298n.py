@@ -0,0 +1,306 @@
+"""
+L298N direction control with whole-bank GPIO writes (MicroPython, ESP32)
+
+Upload next to the script that imports it:
+    from l298n import L298N, PINS_MAIN
+    motor = L298N(PINS_MAIN)
+    motor.go("forward")
+
+Every maneuver is precomputed as two masks for the ESP32's GPIO_OUT_W1TC
+(clear) and GPIO_OUT_W1TS (set) registers, so a change of direction is two
+machine.mem32 stores instead of four Pin calls. Clear goes first: the only
+in-between state is "all inputs low" (coast) for the time of one store, where
+four Pin calls pass through states like IN1 = IN2 = 1 (brake on that bridge)
+for tens of microseconds. A level of None leaves that input as it is, so one
+motor can change without touching the other.
+
+Benchmark on the board, motor supply OFF (it reverses as fast as it can):
+    import l298n; l298n.bench()
+or in the simulator (modelled call costs):
+    python3 -m sim l298n.py --duration 10
+
+Test sequences are Pattern objects: a list of (name, levels, ms) steps,
+compiled once into masks and start times and played from a Timer (see
+Pattern below and l298n_test.py, check_power.py, ...).
+"""
+
+from machine import Pin, Timer, mem32
+import time
+
+GPIO_OUT_W1TS = 0x3FF44008
+GPIO_OUT_W1TC = 0x3FF4400C
+GPIO_OUT = 0x3FF44004
+
+# (IN1, IN2, IN3, IN4) pin maps used in this repo
+PINS_MAIN = (18, 19, 22, 23)   # esp32_l298n_main.py
+PINS_D21 = (5, 18, 19, 21)     # l298n_test.py, l298n_simple_test.py, l298n_quick_test.py
+PINS_D23 = (5, 18, 19, 23)     # l298n_test_fixed.py, check_power.py (IN4 moved to D23)
+
+# Motor A is IN1/IN2, motor B is IN3/IN4
+MANEUVERS = {
+    "stop":       (0, 0, 0, 0),
+    "forward":    (1, 0, 1, 0),
+    "backward":   (0, 1, 0, 1),
+    "left":       (0, 1, 1, 0),   # A backward, B forward
+    "right":      (1, 0, 0, 1),   # A forward, B backward
+    "a_forward":  (1, 0, None, None),
+    "a_backward": (0, 1, None, None),
+    "a_stop":     (0, 0, None, None),
+    "b_forward":  (None, None, 1, 0),
+    "b_backward": (None, None, 0, 1),
+    "b_stop":     (None, None, 0, 0),
+}
+
+PATTERN_TIMER = 1   # Timer id Pattern plays on (diffdrive.py and main.py use 0)
+
+
+def compile_levels(pins, levels):
+    """(clear mask, set mask) for one level per pin; None = leave as is."""
+    clr = st = 0
+    for p, v in zip(pins, levels):
+        if v is None:
+            continue
+        if v:
+            st |= 1 << p
+        else:
+            clr |= 1 << p
+    return (clr, st)
+
+
+def _check_bank(pins):
+    for p in pins:
+        if not 0 <= p < 32:
+            raise ValueError("GPIO %d is outside the W1TS/W1TC bank (0-31)" % p)
+
+
+class L298N:
+    def __init__(self, pins=PINS_MAIN):
+        _check_bank(pins)
+        self.pins = pins
+        # Pin() sets the direction and IO_MUX function; after that only the
+        # output registers are written
+        self.io = [Pin(p, Pin.OUT, value=0) for p in pins]
+        self.masks = {}
+        for name, levels in MANEUVERS.items():
+            self.masks[name] = self.compile(levels)
+        self.state = "stop"
+
+    def compile(self, levels):
+        """(clear mask, set mask) for (IN1, IN2, IN3, IN4) levels; None = leave as is."""
+        return compile_levels(self.pins, levels)
+
+    def apply(self, masks):
+        mem32[GPIO_OUT_W1TC] = masks[0]
+        mem32[GPIO_OUT_W1TS] = masks[1]
+
+    def go(self, name):
+        self.apply(self.masks[name])
+        self.state = name
+
+    def levels(self):
+        """(IN1, IN2, IN3, IN4) as currently driven."""
+        out = mem32[GPIO_OUT]
+        return tuple(out >> p & 1 for p in self.pins)
+
+
+# ---------------------------------------------------------------------------
+# Test patterns
+
+class Pattern:
+    """A test sequence compiled once and played from a Timer.
+
+    steps are (name, levels, ms): levels is a MANEUVERS name (for the first
+    four pins) or one level per pin, None leaving that pin as it is. Every
+    step becomes a (clear, set) mask pair and a start time in ms from the
+    start of the run. The Timer callback applies a step's masks, records
+    when it did, and re-arms itself for the next start time measured from
+    the start of the run, so a late callback doesn't push the rest of the
+    run back. Names are printed from the main loop once a step has started.
+    """
+
+    def __init__(self, pins, steps, timer_id=PATTERN_TIMER):
+        _check_bank(pins)
+        self.pins = pins
+        self.io = [Pin(p, Pin.OUT, value=0) for p in pins]
+        pad = (None,) * (len(pins) - 4)
+        self.names = []
+        self.masks = []
+        self.start = [0]            # ms from the start of the run; last = total
+        for name, levels, ms in steps:
+            if isinstance(levels, str):
+                levels = MANEUVERS[levels] + pad
+            self.names.append(name)
+            self.masks.append(compile_levels(pins, levels))
+            self.start.append(self.start[-1] + ms)
+        self.off = compile_levels(pins, (0,) * len(pins))
+        self.late = [0] * len(steps)    # us each step started after its start time
+        self.timer = Timer(timer_id)
+        self.t0 = 0
+        self.k = 0
+        self.count = 0
+        self.cycles = 1
+        self.done = True
+        self.hook = None
+
+    def _fire(self, t):
+        k = self.k
+        m = self.masks[k]
+        mem32[GPIO_OUT_W1TC] = m[0]
+        mem32[GPIO_OUT_W1TS] = m[1]
+        now = time.ticks_diff(time.ticks_us(), self.t0)
+        self.late[k] = now - self.start[k] * 1000
+        self.count += 1
+        if self.hook is not None:
+            self.hook(k)
+        k += 1
+        wait = max(1, (self.start[k] * 1000 - now + 500) // 1000)
+        if k == len(self.masks):
+            self.timer.init(mode=Timer.ONE_SHOT, period=wait, callback=self._end)
+        else:
+            self.k = k
+            self.timer.init(mode=Timer.ONE_SHOT, period=wait, callback=self._fire)
+
+    def _end(self, t):
+        # Last step over: the next cycle, or done
+        if self.cycles and self.count >= self.cycles * len(self.masks):
+            self.done = True
+            return
+        self.t0 = time.ticks_add(self.t0, self.start[-1] * 1000)
+        self.k = 0
+        self._fire(t)
+
+    def play(self, cycles=1, show=True, hook=None, idle=None):
+        """Run the pattern cycles times (0 = until Ctrl+C), printing step names
+        as they start (with the cycle number when repeating). The outputs stay
+        as the last step left them; after Ctrl+C they are all turned off.
+
+        hook(k) is called from the Timer callback right after step k is
+        applied; idle() from the main loop while waiting."""
+        n = len(self.masks)
+        self.cycles = cycles
+        self.hook = hook
+        self.count = 0
+        self.k = 0
+        self.done = False
+        shown = 0
+        try:
+            self.t0 = time.ticks_us()
+            self._fire(None)
+            while True:
+                done = self.done
+                while shown < self.count:
+                    if show:
+                        if cycles == 1:
+                            print(self.names[shown % n])
+                        else:
+                            print("Cycle %d: %s" % (shown // n, self.names[shown % n]))
+                    shown += 1
+                if done:
+                    break
+                if idle is not None:
+                    idle()
+                time.sleep_ms(5)
+        except BaseException:
+            self.timer.deinit()
+            self.hook = None
+            self.apply(self.off)
+            raise
+        self.timer.deinit()
+        self.hook = None
+
+    def apply(self, masks):
+        mem32[GPIO_OUT_W1TC] = masks[0]
+        mem32[GPIO_OUT_W1TS] = masks[1]
+
+    def report(self):
+        """How late each step of the last cycle started, in us."""
+        late = self.late
+        print("%d steps, start error us min/avg/max: %d / %d / %d" % (
+            len(late), min(late), sum(late) // len(late), max(late)))
+
+
+# ---------------------------------------------------------------------------
+# Benchmark: per-pin calls (the old helpers) against bank writes
+
+BENCH_SEQ = ("forward", "backward", "left", "right", "stop")
+
+
+def _both_high(lv):
+    return (lv[0] and lv[1]) or (lv[2] and lv[3])
+
+
+def bench(pins=PINS_MAIN, n=1000):
+    motor = L298N(pins)
+    io = motor.io
+    seq = [MANEUVERS[name] for name in BENCH_SEQ]
+    masks = [motor.masks[name] for name in BENCH_SEQ]
+    mhz = 240
+    try:
+        import machine
+        mhz = machine.freq() // 1000000
+    except Exception:
+        pass
+    print("L298N bench on GPIO", pins, "-", n, "transitions each. Motor supply must be OFF.")
+
+    def per_pin(lv):
+        io[0].value(lv[0]); io[1].value(lv[1])
+        io[2].value(lv[2]); io[3].value(lv[3])
+
+    # Transitions per second
+    t0 = time.ticks_us()
+    for i in range(n):
+        per_pin(seq[i % 5])
+    t_pin = time.ticks_diff(time.ticks_us(), t0)
+    t0 = time.ticks_us()
+    for i in range(n):
+        motor.apply(masks[i % 5])
+    t_bank = time.ticks_diff(time.ticks_us(), t0)
+
+    # Glitch window: from the first output write of a transition to the last,
+    # in CPU cycles, minus the cost of the ticks_cpu() pair itself
+    c0 = time.ticks_cpu()
+    c1 = time.ticks_cpu()
+    base = time.ticks_diff(c1, c0)
+    w_pin = []
+    w_bank = []
+    for i in range(50):
+        lv = seq[i % 5]
+        c0 = time.ticks_cpu()
+        io[0].value(lv[0]); io[1].value(lv[1])
+        io[2].value(lv[2]); io[3].value(lv[3])
+        c1 = time.ticks_cpu()
+        # Only the three calls between the first write and the last count
+        w_pin.append(max(0, time.ticks_diff(c1, c0) - base) * 3 // 4)
+    for i in range(50):
+        m = masks[i % 5]
+        c0 = time.ticks_cpu()
+        mem32[GPIO_OUT_W1TC] = m[0]
+        mem32[GPIO_OUT_W1TS] = m[1]
+        c1 = time.ticks_cpu()
+        w_bank.append(max(0, time.ticks_diff(c1, c0) - base) // 2)
+
+    # Which in-between states actually appear, read back from GPIO_OUT after
+    # every single write of one pass through the sequence
+    bad_pin = bad_bank = 0
+    for k in range(5):
+        lv = seq[k]
+        seen = False
+        for j in range(4):
+            io[j].value(lv[j])
+            seen = seen or (j < 3 and _both_high(motor.levels()))
+        bad_pin += seen
+    for k in range(5):
+        mem32[GPIO_OUT_W1TC] = masks[k][0]
+        if _both_high(motor.levels()):
+            bad_bank += 1
+        mem32[GPIO_OUT_W1TS] = masks[k][1]
+    motor.go("stop")
+
+    for name, t, w, bad in (("per-pin", t_pin, w_pin, bad_pin), ("bank", t_bank, w_bank, bad_bank)):
+        print("%-8s %7d transitions/s  glitch us min/avg/max: %.2f / %.2f / %.2f  "
+              "through IN1=IN2=1 or IN3=IN4=1: %d of 5" % (
+                  name, n * 1000000 // max(1, t), min(w) / mhz, sum(w) / len(w) / mhz, max(w) / mhz, bad))
+
+
+if __name__ == "__main__":
+    bench()
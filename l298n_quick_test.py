@@ -4,60 +4,45 @@ Tests each pin individually with your connections:
 D5, D18, D19, D21
 """
 
-from machine import Pin
-import time
+from l298n import Pattern, PINS_D21
 
 # Your pin configuration
-pins = {
-    'IN1 (D5)': Pin(5, Pin.OUT),
-    'IN2 (D18)': Pin(18, Pin.OUT),
-    'IN3 (D19)': Pin(19, Pin.OUT),
-    'IN4 (D21)': Pin(21, Pin.OUT)
-}
+NAMES = ('IN1 (D5)', 'IN2 (D18)', 'IN3 (D19)', 'IN4 (D21)')
+
+# Each pin on its own: (name, one level per pin, ms)
+steps = []
+for i, name in enumerate(NAMES):
+    steps.append((f"Testing {name}: ON", tuple(1 if j == i else 0 for j in range(4)), 1000))
+    steps.append((f"Testing {name}: OFF", (0, 0, 0, 0), 500))
+SINGLE_PINS = Pattern(PINS_D21, steps)
+
+# Quick motor pattern test
+PATTERNS = Pattern(PINS_D21, (
+    ("Pattern: Motor A Forward", (1, 0, 0, 0), 1500),
+    ("Pattern: Motor A Backward", (0, 1, 0, 0), 1500),
+    ("Pattern: Motor B Forward", (0, 0, 1, 0), 1500),
+    ("Pattern: Motor B Backward", (0, 0, 0, 1), 1500),
+    ("Pattern: Both Forward", (1, 0, 1, 0), 1500),
+    ("Pattern: Both Backward", (0, 1, 0, 1), 1500),
+    ("Pattern: Stop All", (0, 0, 0, 0), 1500),
+))
 
 print("L298N Quick Pin Test")
 print("=" * 30)
 print("Testing each pin individually...")
 print("Watch your motors/LEDs to see which pin controls what\n")
 
-# First, turn everything off
-for name, pin in pins.items():
-    pin.off()
-
-# Test each pin individually
-for name, pin in pins.items():
-    print(f"Testing {name}: ON")
-    pin.on()
-    time.sleep(1)
-    print(f"Testing {name}: OFF")
-    pin.off()
-    time.sleep(0.5)
-    print()
+SINGLE_PINS.play()
 
 print("Individual pin test complete!\n")
 print("Now testing common motor patterns:")
 print("-" * 30)
 
-# Quick motor pattern test
-patterns = [
-    ("Motor A Forward", [(5, 1), (18, 0), (19, 0), (21, 0)]),
-    ("Motor A Backward", [(5, 0), (18, 1), (19, 0), (21, 0)]),
-    ("Motor B Forward", [(5, 0), (18, 0), (19, 1), (21, 0)]),
-    ("Motor B Backward", [(5, 0), (18, 0), (19, 0), (21, 1)]),
-    ("Both Forward", [(5, 1), (18, 0), (19, 1), (21, 0)]),
-    ("Both Backward", [(5, 0), (18, 1), (19, 0), (21, 1)]),
-    ("Stop All", [(5, 0), (18, 0), (19, 0), (21, 0)])
-]
-
-for pattern_name, states in patterns:
-    print(f"Pattern: {pattern_name}")
-    for pin_num, state in states:
-        Pin(pin_num, Pin.OUT).value(state)
-    time.sleep(1.5)
+PATTERNS.play()
+PATTERNS.report()
 
 # Make sure everything is off at the end
 print("\nStopping all motors...")
-for pin in pins.values():
-    pin.off()
+PATTERNS.apply(PATTERNS.off)
 
 print("Quick test complete!") 
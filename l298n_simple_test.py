@@ -4,45 +4,21 @@ Blinks each pin to verify connections
 Pins: D5, D18, D19, D21
 """
 
-from machine import Pin
-import time
+from l298n import Pattern, PINS_D21
 
-# Setup pins
-IN1 = Pin(5, Pin.OUT)   # D5
-IN2 = Pin(18, Pin.OUT)  # D18
-IN3 = Pin(19, Pin.OUT)  # D19
-IN4 = Pin(21, Pin.OUT)  # D21
+# All pins on/off together, played by the pattern engine in l298n.py
+BLINK = Pattern(PINS_D21, (
+    ("All pins ON", (1, 1, 1, 1), 1000),
+    ("All pins OFF", (0, 0, 0, 0), 1000),
+))
 
 print("Simple L298N Test - Pins D5, D18, D19, D21")
 print("Press Ctrl+C to stop")
 print("-" * 40)
 
-# Simple test loop - all pins on/off together
-counter = 0
 try:
-    while True:
-        # All on
-        IN1.on()
-        IN2.on()
-        IN3.on()
-        IN4.on()
-        print(f"Cycle {counter}: All pins ON")
-        time.sleep(1)
-        
-        # All off
-        IN1.off()
-        IN2.off()
-        IN3.off()
-        IN4.off()
-        print(f"Cycle {counter}: All pins OFF")
-        time.sleep(1)
-        
-        counter += 1
+    BLINK.play(cycles=0)
         
 except KeyboardInterrupt:
-    # Clean stop
-    IN1.off()
-    IN2.off()
-    IN3.off()
-    IN4.off()
-    print("\nTest stopped. All pins OFF.") 
+    # Clean stop: the pattern turns every pin off on Ctrl+C
+    print("\nTest stopped. All pins OFF.")
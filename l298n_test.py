@@ -9,17 +9,12 @@ Pin connections:
 Run this in Thonny to test your motor connections
 """
 
-from machine import Pin
 import time
+from l298n import L298N, Pattern, PINS_D21
 
-# Initialize pins for L298N motor driver
-# Motor A control pins
-IN1 = Pin(5, Pin.OUT)   # D5
-IN2 = Pin(18, Pin.OUT)  # D18
-
-# Motor B control pins  
-IN3 = Pin(19, Pin.OUT)  # D19
-IN4 = Pin(21, Pin.OUT)  # D21
+# L298N motor driver on D5/D18 (motor A) and D19/D21 (motor B); each
+# direction change is one register write pair (upload l298n.py too)
+motor = L298N(PINS_D21)
 
 print("L298N Motor Test Starting...")
 print("Pin Configuration:")
@@ -29,123 +24,46 @@ print("  IN3 -> GPIO 19 (D19)")
 print("  IN4 -> GPIO 21 (D21)")
 print("-" * 40)
 
+DELAY_MS = 2000  # between tests
+
+# (name, maneuver from l298n.MANEUVERS, ms)
+SEQUENCE = Pattern(PINS_D21, (
+    ("Test 1: Motor A Forward", "a_forward", DELAY_MS),
+    ("Test 2: Motor A Backward", "a_backward", DELAY_MS),
+    ("Test 3: Motor A Stop", "stop", 1000),
+    ("Test 4: Motor B Forward", "b_forward", DELAY_MS),
+    ("Test 5: Motor B Backward", "b_backward", DELAY_MS),
+    ("Test 6: Motor B Stop", "stop", 1000),
+    ("Test 7: Both Motors Forward", "forward", DELAY_MS),
+    ("Test 8: Both Motors Backward", "backward", DELAY_MS),
+    ("Test 9: Turn Left", "left", DELAY_MS),
+    ("Test 10: Turn Right", "right", DELAY_MS),
+    ("Test 11: Final Stop", "stop", 0),
+))
+
+# Interactive commands: key -> (what it prints, maneuver)
+COMMANDS = {
+    '1': ("Motor A: Forward", "a_forward"),
+    '2': ("Motor A: Backward", "a_backward"),
+    '3': ("Motor B: Forward", "b_forward"),
+    '4': ("Motor B: Backward", "b_backward"),
+    '5': ("Both Motors: Forward", "forward"),
+    '6': ("Both Motors: Backward", "backward"),
+    '7': ("Turning Left", "left"),
+    '8': ("Turning Right", "right"),
+    '0': ("STOP - All motors off", "stop"),
+}
+
 def stop_all():
     """Stop all motors"""
-    IN1.off()
-    IN2.off()
-    IN3.off()
-    IN4.off()
+    motor.go("stop")
     print("STOP - All motors off")
 
-def motor_a_forward():
-    """Motor A forward"""
-    IN1.on()
-    IN2.off()
-    print("Motor A: Forward")
-
-def motor_a_backward():
-    """Motor A backward"""
-    IN1.off()
-    IN2.on()
-    print("Motor A: Backward")
-
-def motor_b_forward():
-    """Motor B forward"""
-    IN3.on()
-    IN4.off()
-    print("Motor B: Forward")
-
-def motor_b_backward():
-    """Motor B backward"""
-    IN3.off()
-    IN4.on()
-    print("Motor B: Backward")
-
-def both_forward():
-    """Both motors forward"""
-    IN1.on()
-    IN2.off()
-    IN3.on()
-    IN4.off()
-    print("Both Motors: Forward")
-
-def both_backward():
-    """Both motors backward"""
-    IN1.off()
-    IN2.on()
-    IN3.off()
-    IN4.on()
-    print("Both Motors: Backward")
-
-def turn_left():
-    """Turn left - Motor A backward, Motor B forward"""
-    IN1.off()
-    IN2.on()
-    IN3.on()
-    IN4.off()
-    print("Turning Left")
-
-def turn_right():
-    """Turn right - Motor A forward, Motor B backward"""
-    IN1.on()
-    IN2.off()
-    IN3.off()
-    IN4.on()
-    print("Turning Right")
-
 def test_sequence():
     """Run a test sequence"""
-    delay = 2  # seconds between tests
-    
     print("\n=== Starting Test Sequence ===\n")
-    
-    # Test Motor A
-    print("Test 1: Motor A Forward")
-    motor_a_forward()
-    time.sleep(delay)
-    
-    print("Test 2: Motor A Backward")
-    motor_a_backward()
-    time.sleep(delay)
-    
-    print("Test 3: Motor A Stop")
-    stop_all()
-    time.sleep(1)
-    
-    # Test Motor B
-    print("\nTest 4: Motor B Forward")
-    motor_b_forward()
-    time.sleep(delay)
-    
-    print("Test 5: Motor B Backward")
-    motor_b_backward()
-    time.sleep(delay)
-    
-    print("Test 6: Motor B Stop")
-    stop_all()
-    time.sleep(1)
-    
-    # Test both motors together
-    print("\nTest 7: Both Motors Forward")
-    both_forward()
-    time.sleep(delay)
-    
-    print("Test 8: Both Motors Backward")
-    both_backward()
-    time.sleep(delay)
-    
-    # Test turning
-    print("\nTest 9: Turn Left")
-    turn_left()
-    time.sleep(delay)
-    
-    print("Test 10: Turn Right")
-    turn_right()
-    time.sleep(delay)
-    
-    print("\nTest 11: Final Stop")
-    stop_all()
-    
+    SEQUENCE.play()
+    SEQUENCE.report()
     print("\n=== Test Sequence Complete ===\n")
 
 def interactive_test():
@@ -168,24 +86,10 @@ def interactive_test():
     while True:
         cmd = input("Enter command: ").strip().lower()
         
-        if cmd == '1':
-            motor_a_forward()
-        elif cmd == '2':
-            motor_a_backward()
-        elif cmd == '3':
-            motor_b_forward()
-        elif cmd == '4':
-            motor_b_backward()
-        elif cmd == '5':
-            both_forward()
-        elif cmd == '6':
-            both_backward()
-        elif cmd == '7':
-            turn_left()
-        elif cmd == '8':
-            turn_right()
-        elif cmd == '0':
-            stop_all()
+        if cmd in COMMANDS:
+            name, maneuver = COMMANDS[cmd]
+            motor.go(maneuver)
+            print(name)
         elif cmd == 't':
             test_sequence()
         elif cmd == 'q':
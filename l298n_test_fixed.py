@@ -3,8 +3,7 @@ L298N Test with Fixed Pin Configuration
 Uses D5, D18, D19, D23 (avoiding D21 I2C conflict)
 """
 
-from machine import Pin
-import time
+from l298n import Pattern, PINS_D23
 
 print("=" * 50)
 print("L298N TEST - FIXED PIN CONFIGURATION")
@@ -12,12 +11,8 @@ print("=" * 50)
 print("\nIMPORTANT: This uses D23 instead of D21")
 print("to avoid conflict with I2C (MPU-6050)\n")
 
-# Fixed pin configuration
-IN1 = Pin(5, Pin.OUT)   # D5
-IN2 = Pin(18, Pin.OUT)  # D18  
-IN3 = Pin(19, Pin.OUT)  # D19
-IN4 = Pin(23, Pin.OUT)  # D23 (changed from D21!)
-
+# Fixed pin configuration: D5, D18, D19, D23 (changed from D21!), played
+# by the pattern engine in l298n.py (upload it too)
 print("Pin Configuration:")
 print("  IN1 → GPIO 5 (D5)")
 print("  IN2 → GPIO 18 (D18)")
@@ -25,64 +20,36 @@ print("  IN3 → GPIO 19 (D19)")
 print("  IN4 → GPIO 23 (D23) ← CHANGED FROM D21!")
 print("-" * 50)
 
-def all_off():
-    IN1.off()
-    IN2.off()
-    IN3.off()
-    IN4.off()
+# First check if any response from L298N
+POWER_CHECK = Pattern(PINS_D23, (
+    ("All pins HIGH (if L298N has power, LEDs should light)", (1, 1, 1, 1), 2000),
+    ("All pins LOW", "stop", 1000),
+))
+
+# Each motor direction
+MOTOR_TEST = Pattern(PINS_D23, (
+    ("Motor A Forward (IN1=HIGH, IN2=LOW)", "a_forward", 2000),
+    ("Motor A Backward (IN1=LOW, IN2=HIGH)", "a_backward", 2000),
+    ("Motor A Stop", "a_stop", 1000),
+    ("Motor B Forward (IN3=HIGH, IN4=LOW)", "b_forward", 2000),
+    ("Motor B Backward (IN3=LOW, IN4=HIGH)", "b_backward", 2000),
+    ("All Stop", "stop", 0),
+))
+
+CONTINUOUS = Pattern(PINS_D23, (
+    ("Both forward", "forward", 2000),
+    ("Both backward", "backward", 2000),
+))
 
 def power_check():
-    """First check if any response from L298N"""
     print("\n### POWER CHECK ###")
-    print("All pins HIGH (if L298N has power, LEDs should light)")
-    IN1.on()
-    IN2.on()
-    IN3.on()
-    IN4.on()
-    time.sleep(2)
-    
-    print("All pins LOW")
-    all_off()
-    time.sleep(1)
+    POWER_CHECK.play()
     print("Power check complete\n")
 
 def motor_test():
-    """Test each motor direction"""
     print("### MOTOR TEST ###")
-    
-    # Motor A Forward
-    print("Motor A Forward (IN1=HIGH, IN2=LOW)")
-    IN1.on()
-    IN2.off()
-    time.sleep(2)
-    
-    # Motor A Backward
-    print("Motor A Backward (IN1=LOW, IN2=HIGH)")
-    IN1.off()
-    IN2.on()
-    time.sleep(2)
-    
-    # Motor A Stop
-    print("Motor A Stop")
-    IN1.off()
-    IN2.off()
-    time.sleep(1)
-    
-    # Motor B Forward
-    print("Motor B Forward (IN3=HIGH, IN4=LOW)")
-    IN3.on()
-    IN4.off()
-    time.sleep(2)
-    
-    # Motor B Backward
-    print("Motor B Backward (IN3=LOW, IN4=HIGH)")
-    IN3.off()
-    IN4.on()
-    time.sleep(2)
-    
-    # Stop all
-    print("All Stop")
-    all_off()
+    MOTOR_TEST.play()
+    MOTOR_TEST.report()
     print("Motor test complete\n")
 
 # Main test
@@ -105,23 +72,10 @@ try:
     print("Motors will run forward/backward continuously")
     print("Press Ctrl+C to stop\n")
     
-    while True:
-        print("Both forward")
-        IN1.on()
-        IN2.off()
-        IN3.on()
-        IN4.off()
-        time.sleep(2)
-        
-        print("Both backward")
-        IN1.off()
-        IN2.on()
-        IN3.off()
-        IN4.on()
-        time.sleep(2)
+    # Runs until Ctrl+C, which also turns every input off
+    CONTINUOUS.play(cycles=0)
         
 except KeyboardInterrupt:
-    all_off()
     print("\n\nTest stopped. All motors OFF.")
     print("\nIf motors didn't work, check:")
     print("1. Power supply (MOST IMPORTANT)")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Rule table for classifying ESP32 / ESP32-CAM serial log lines, shared by
+monitor_esp32cam.py and monitor_cam_upload.py.
+
+Each rule is a matcher plus the tags it sets and, optionally, a field it
+extracts (ip, error, wifi = connected / connecting / lost). RuleSet compiles
+the whole table into one generated classify() function: straight-line
+substring tests (the line is lowercased once for the case-insensitive
+ones), and the only regex (IP address) runs only on lines containing a '.',
+with its match reused for the ip field. Each line is looked at once per rule
+instead of once per monitor and once more for the IP.
+
+Matchers:
+    'text' or ('a', 'b')      substring(s), case-sensitive
+    NoCase('a', 'b')          substring(s), any case
+    Regex(r'...', need='x')   regex search, tried only if 'x' is in the line
+    Line('.')                 the whole line (stripped) equals this
+
+    hit = RULES.classify(line)
+    hit.tags      -> {'camera', 'camera_ready', 'camera_status', 'ip'}
+    hit.fields    -> {'ip': '192.168.1.20'}
+    pick(hit.tags, [('ip', '🌐 >>> {} <<<'), ('error', '❌ {}')])
+
+One combined regex was tried first; CPython's re scans an alternation of
+this size about 10x slower than str.__contains__, so it lost to the code it
+replaced. Compare on ESP32 debug output (Serial.setDebugOutput(true)):
+    python3 log_rules.py --bench
+    python3 log_rules.py --verify     same output as the old if/elif chains
+"""
+
+import re
+from collections import namedtuple
+
+Rule = namedtuple('Rule', 'match tags field')
+Hit = namedtuple('Hit', 'tags fields')
+NoCase = namedtuple('NoCase', 'words')
+Regex = namedtuple('Regex', 'pattern need')
+Line = namedtuple('Line', 'text')
+
+
+def _nocase(*words):
+    return NoCase(tuple(w.lower() for w in words))
+
+
+RULES_TABLE = [
+    Rule(Regex(r'\d+\.\d+\.\d+\.\d+', '.'), ('ip',), 'ip'),
+    Rule('WiFi connected', ('wifi_connected',), ('wifi', 'connected')),
+    Rule(_nocase('WiFi disconnected', 'WiFi lost'), ('wifi_lost',), ('wifi', 'lost')),
+    Rule(('Camera Ready', 'Camera init'), ('camera_status',), None),
+    Rule('Camera Ready', ('camera_ready',), None),
+    Rule('ESP32-CAM', ('board',), None),
+    Rule(_nocase('cam'), ('camera',), None),      # also matches 'Camera'
+    Rule(('IP', '192.168', '10.0'), ('network',), None),
+    Rule(_nocase('error', 'fail'), ('error',), 'error'),
+    Rule('Connecting', ('connecting',), ('wifi', 'connecting')),
+    Rule(Line('.'), ('connecting',), None),
+]
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        env = {}
+        src = ['def classify(line):']
+        if any(isinstance(r.match, NoCase) for r in self.rules):
+            src.append('    low = line.lower()')
+        src.append('    tags = set()')
+        src.append('    fields = {}')
+        for i, r in enumerate(self.rules):
+            env[f'T{i}'] = frozenset(r.tags)
+            m = r.match
+            if isinstance(m, Regex):
+                env[f'R{i}'] = re.compile(m.pattern).search
+                src.append(f'    m = R{i}(line) if {m.need!r} in line else None' if m.need
+                           else f'    m = R{i}(line)')
+                cond = 'm'
+            elif isinstance(m, NoCase):
+                cond = ' or '.join(f'{w!r} in low' for w in m.words)
+            elif isinstance(m, Line):
+                cond = f'line.strip() == {m.text!r}'
+            else:
+                words = (m,) if isinstance(m, str) else m
+                cond = ' or '.join(f'{w!r} in line' for w in words)
+            src.append(f'    if {cond}:')
+            src.append(f'        tags |= T{i}')
+            if isinstance(r.field, tuple):
+                src.append(f'        fields.setdefault({r.field[0]!r}, {r.field[1]!r})')
+            elif r.field == 'error':
+                src.append("        fields.setdefault('error', line)")
+            elif r.field:
+                src.append(f'        fields.setdefault({r.field!r}, m.group())')
+        src.append('    return Hit(tags, fields)')
+        env['Hit'] = Hit
+        self.source = '\n'.join(src)
+        exec(self.source, env)
+        self.classify = env['classify']
+
+
+RULES = RuleSet(RULES_TABLE)
+
+
+# Tag priority for monitor_cam_upload.py's line decoration and
+# monitor_esp32cam.py's one-line notes (first tag present wins).
+HIGHLIGHT = [('ip', '🌐 >>> {} <<<'), ('wifi_connected', '✅ {}'), ('camera_status', '📷 {}'),
+             ('error', '❌ {}'), ('connecting', '⏳ {}'), ('board', '🎯 {}')]
+NOTES = [('camera', '    📷 Camera-related message detected'),
+         ('network', '    🌐 Network information detected'),
+         ('error', '    ⚠️  Error message detected')]
+
+
+def pick(tags, order):
+    """First format string in order whose tag is in tags, or None."""
+    for tag, fmt in order:
+        if tag in tags:
+            return fmt
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Verification and benchmark
+
+
+def _as_regex(m):
+    if isinstance(m, Regex):
+        return m.pattern
+    if isinstance(m, NoCase):
+        return '(?i:' + '|'.join(map(re.escape, m.words)) + ')'
+    if isinstance(m, Line):
+        return r'^\s*' + re.escape(m.text) + r'\s*$'
+    return '|'.join(map(re.escape, (m,) if isinstance(m, str) else m))
+
+
+def _reference(line):
+    """Rule-by-rule re.search, independent of the generated code."""
+    tags = set()
+    for r in RULES_TABLE:
+        if re.search(_as_regex(r.match), line):
+            tags |= set(r.tags)
+    return tags
+
+
+def _old_highlight(text):
+    # monitor_cam_upload.highlight_important() before the rule table
+    if re.search(r'\d+\.\d+\.\d+\.\d+', text):
+        return f"🌐 >>> {text} <<<"
+    elif "WiFi connected" in text:
+        return f"✅ {text}"
+    elif "Camera Ready" in text or "Camera init" in text:
+        return f"📷 {text}"
+    elif "error" in text.lower() or "fail" in text.lower():
+        return f"❌ {text}"
+    elif "Connecting" in text or "." == text.strip():
+        return f"⏳ {text}"
+    elif "ESP32-CAM" in text:
+        return f"🎯 {text}"
+    else:
+        return text
+
+
+def _old_monitor(text):
+    # monitor_cam_upload.py main loop: highlight, then a second scan for the IP
+    out = _old_highlight(text)
+    ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', text)
+    ip = ip_match.group(1) if ip_match and "192.168" in ip_match.group(1) else None
+    # monitor_esp32cam.py keyword checks
+    if "Camera" in text or "cam" in text.lower():
+        note = NOTES[0][1]
+    elif "IP" in text or "192.168" in text or "10.0" in text:
+        note = NOTES[1][1]
+    elif "error" in text.lower() or "fail" in text.lower():
+        note = NOTES[2][1]
+    else:
+        note = None
+    return out, ip, note
+
+
+def _new_monitor(text):
+    hit = RULES.classify(text)
+    out = (pick(hit.tags, HIGHLIGHT) or '{}').format(text)
+    ip = hit.fields.get('ip')
+    ip = ip if ip and '192.168' in ip else None
+    return out, ip, pick(hit.tags, NOTES)
+
+
+def sample_log(n, seed=0):
+    """ESP32-CAM boot plus core debug output, like Serial.setDebugOutput(true)."""
+    import random
+
+    rng = random.Random(seed)
+    templates = [
+        '[D][WiFiGeneric.cpp:374] _eventCallback(): Event: {} - STA_START',
+        '[D][WiFiGeneric.cpp:374] _eventCallback(): Event: 4 - STA_CONNECTED',
+        '[D][WiFiGeneric.cpp:374] _eventCallback(): Event: 7 - STA_GOT_IP',
+        '[D][WiFiGeneric.cpp:419] _eventCallback(): STA IP: 192.168.1.{}, MASK: 255.255.255.0, GW: 192.168.1.1',
+        '[E][camera.c:1113] camera_probe(): Detected camera not supported.',
+        '[E][camera.c:1379] esp_camera_init(): Camera probe failed with error 0x{}',
+        'Camera init failed with error 0x20004',
+        "Camera Ready! Use 'http://192.168.1.{}' to connect",
+        '[I][esp32-hal-psram.c:47] psramInit(): PSRAM enabled, {} bytes free',
+        'WiFi connecting', '.', 'WiFi connected', 'WiFi disconnected, reason {}',
+        'ESP32-CAM booting', 'ets Jun  8 2016 00:22:57', 'rst:0x1 (POWERON_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)',
+        'httpd_start: Starting web server on port: {}', 'MJPG: {}B {}ms ({:.1f}fps)',
+        'load:0x3fff0030,len:{}', 'entry 0x400805e4', 'Connecting to 10.0.0.{}', 'E (345) i2c: timeout',
+    ]
+    out = []
+    for _ in range(n):
+        t = rng.choice(templates)
+        out.append(t.format(*(rng.randint(1, 250) for _ in range(t.count('{}') + t.count('{:')))))
+    return out
+
+
+def verify(n=20000):
+    lines = sample_log(n, seed=1)
+    lines += ['Camera', 'cam', 'SKIP', '10.0.0.1', 'IP', 'x.', ' . ', 'ESP32-CAM error', 'Cam IP fail']
+    bad = 0
+    for line in lines:
+        if RULES.classify(line).tags != _reference(line):
+            bad += 1
+            print('tags differ:', repr(line), RULES.classify(line).tags, _reference(line))
+        if _new_monitor(line) != _old_monitor(line):
+            bad += 1
+            print('output differs:', repr(line), _new_monitor(line), _old_monitor(line))
+    print(f'{len(lines)} lines: {"OK" if not bad else f"{bad} mismatches"}')
+    return bad == 0
+
+
+def bench(n=200000):
+    import time
+
+    lines = sample_log(n)
+    combined = re.compile('|'.join(f'(?P<r{i}>{_as_regex(r.match)})' for i, r in enumerate(RULES_TABLE)))
+    one_regex = lambda line: [m.lastgroup for m in combined.finditer(line)]
+    for name, fn in (('old re.search/.lower() chains', _old_monitor),
+                     ('one combined regex (finditer)', one_regex),
+                     ('rule table (generated)', _new_monitor)):
+        t0 = time.perf_counter()
+        for line in lines:
+            fn(line)
+        dt = time.perf_counter() - t0
+        print(f'{name:32} {n / dt:>10,.0f} lines/s')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serial log rule table')
+    parser.add_argument('--verify', action='store_true', help='Check the table against a rule-by-rule search')
+    parser.add_argument('--bench', action='store_true', help='Lines/sec, old chains vs rule table')
+    args = parser.parse_args()
+    if args.verify:
+        raise SystemExit(0 if verify() else 1)
+    if args.bench:
+        bench()
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,57 @@
 #!/usr/bin/env python3
 """
 Mac Fall Alarm - listens to ESP32 serial and plays a sound on FALL_DETECTED
+
+Understands both the text output of main.py / fall_detector.ino and the
+binary frames (STREAM = "binary"). Pre/post-event snapshots sent after a
+detection are saved to SNAPSHOT_DIR as .npz files (t_ms, xyz in raw LSB,
+event_t_ms) for reviewing and tuning thresholds.
+
+With --mux it attaches to a running serial_mux.py daemon instead of
+opening the port, so other tools can watch the same device. With --fast it
+finds the board's current rate and negotiates the fastest one the link
+carries (baudlink.py), stepping back down if frames start failing CRC.
+
+Alerts never run in the serial read loop. Each FALL_DETECTED is queued
+(bounded, ALERT_QUEUE) for a worker thread that runs the sinks in parallel:
+the sound command, an append-only JSON-lines log (EVENT_LOG) and, with
+--webhook, a POST to http://... or a JSON line to unix:///path. Repeats
+within ALERT_WINDOW_S of an alert are coalesced into it. Every alert logs
+the time from line receipt to completion of each sink, and on exit the
+longest pause in serial reading is printed, to show alerting never stalls it.
+
+For trying the webhook locally:
+    python3 mac_fall_alarm.py --webhook-stub unix:///tmp/fall_alarm.sock
+    python3 mac_fall_alarm.py --webhook unix:///tmp/fall_alarm.sock
+
+Requires: pip install pyserial numpy
 """
+import argparse
+import json
+import os
+import queue
+import socket
 import subprocess
+import threading
 import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
 import serial
 
+import numpy as np
+
+from baudlink import open_link
+from telemetry import StreamDecoder
+
 PORT = '/dev/cu.usbserial-0001'
 BAUD = 115200
+SNAPSHOT_DIR = 'fall_events'
+EVENT_LOG = os.path.join(SNAPSHOT_DIR, 'events.jsonl')
+
+ALERT_QUEUE = 16        # pending alerts; more than this are counted and dropped
+ALERT_WINDOW_S = 5.0    # FALL_DETECTED within this long of an alert joins it
+WEBHOOK_TIMEOUT_S = 2.0
 
 SOUND_CMD = [
   'osascript', '-e',
@@ -15,31 +59,229 @@ SOUND_CMD = [
 ]
 
 
-def play_sound():
-    try:
-        subprocess.run(SOUND_CMD, check=False)
-    except Exception:
-        pass
+def play_sound(alert):
+    subprocess.run(SOUND_CMD, check=False)
+
+
+def log_event(alert):
+    """Append one JSON line per alert; the file is only ever appended to."""
+    os.makedirs(os.path.dirname(EVENT_LOG) or '.', exist_ok=True)
+    with open(EVENT_LOG, 'a') as f:
+        f.write(json.dumps(alert.record()) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def post_webhook(url, body):
+    """POST body (bytes) to http(s)://..., or send it as one line to unix:///path."""
+    if url.startswith('unix://'):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(WEBHOOK_TIMEOUT_S)
+            s.connect(url[len('unix://'):])
+            s.sendall(body + b'\n')
+        return
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=WEBHOOK_TIMEOUT_S) as resp:
+        resp.read()
+
+
+class Alert:
+    def __init__(self, source, device_t_ms=None):
+        self.source = source            # the text line or 'event'
+        self.device_t_ms = device_t_ms
+        self.t_recv = time.monotonic()
+        self.wall = time.time()
+        self.repeats = 0                # coalesced FALL_DETECTED after this one
+        self.latency_ms = {}            # sink -> ms from receipt to completion
+
+    def record(self):
+        return {'event': 'FALL_DETECTED',
+                'received': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.wall))
+                            + f'.{int(self.wall * 1000) % 1000:03d}',
+                'device_t_ms': self.device_t_ms,
+                'source': self.source}
+
+
+class AlertDispatcher:
+    """Bounded queue + worker thread that fans each alert out to the sinks."""
+
+    def __init__(self, sinks):
+        self.sinks = sinks              # name -> f(alert)
+        self.queue = queue.Queue(ALERT_QUEUE)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(sinks)))
+        self.last = None
+        self.alerts = self.coalesced = self.dropped = self.failures = 0
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, source, device_t_ms=None):
+        """Called from the read loop; never blocks."""
+        now = time.monotonic()
+        if self.last and now - self.last.t_recv < ALERT_WINDOW_S:
+            self.last.repeats += 1
+            self.coalesced += 1
+            print(f'(coalesced into the alert {now - self.last.t_recv:.1f} s ago)')
+            return
+        alert = Alert(source, device_t_ms)
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            print('ALERT QUEUE FULL: alert dropped')
+            return
+        self.last = alert
+        self.alerts += 1
+        print('ALERT: FALL DETECTED!')
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            futures = {name: self.pool.submit(self._timed, name, sink, alert)
+                       for name, sink in self.sinks.items()}
+            for name, fut in futures.items():
+                err = fut.result()
+                if err:
+                    self.failures += 1
+                    print(f'Alert sink {name} failed: {err}')
+            total = max(alert.latency_ms.values(), default=0)
+            parts = ', '.join(f'{n} {ms:.0f} ms' for n, ms in alert.latency_ms.items())
+            print(f'Alert done {total:.0f} ms after receipt ({parts})')
+            if 'log' in self.sinks:
+                done = {'event': 'ALERT_DONE', 'device_t_ms': alert.device_t_ms,
+                        'latency_ms': {n: round(ms, 1) for n, ms in alert.latency_ms.items()},
+                        'repeats': alert.repeats}
+                try:
+                    with open(EVENT_LOG, 'a') as f:
+                        f.write(json.dumps(done) + '\n')
+                except OSError as e:
+                    print('Event log error:', e)
+            self.queue.task_done()
+
+    def _timed(self, name, sink, alert):
+        try:
+            sink(alert)
+            err = None
+        except Exception as e:
+            err = e
+        alert.latency_ms[name] = (time.monotonic() - alert.t_recv) * 1000
+        return err
+
+    def close(self, timeout=10.0):
+        """Let queued alerts finish (up to timeout s)."""
+        end = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < end:
+            time.sleep(0.05)
+
+
+def webhook_stub(url):
+    """Print whatever the webhook sink sends to url (unix:///path or http://host:port)."""
+    if url.startswith('unix://'):
+        path = url[len('unix://'):]
+        if os.path.exists(path):
+            os.unlink(path)
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srv.bind(path)
+        srv.listen()
+        print('Webhook stub listening on', url)
+        while True:
+            conn, _ = srv.accept()
+            with conn:
+                print('webhook:', conn.makefile().read().strip())
+    else:
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from urllib.parse import urlparse
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                print('webhook:', body.decode(errors='replace'))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        u = urlparse(url)
+        print('Webhook stub listening on', url)
+        HTTPServer((u.hostname or '127.0.0.1', u.port or 80), Handler).serve_forever()
+
+
+def save_snapshot(snap):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    name = time.strftime('fall_%Y%m%d_%H%M%S') + f'_{int(snap.event_t_ms)}.npz'
+    path = os.path.join(SNAPSHOT_DIR, name)
+    np.savez(path, t_ms=snap.t_ms, xyz=snap.xyz, event_t_ms=snap.event_t_ms,
+             complete=snap.complete)
+    status = '' if snap.complete else ' (incomplete, frames lost)'
+    print(f'Saved {len(snap.t_ms)} samples around the event to {path}{status}')
 
 
 def main():
-    print('Listening on', PORT, 'at', BAUD)
-    print('Will play a sound when FALL_DETECTED is received')
+    parser = argparse.ArgumentParser(description='Play a sound when the ESP32 reports a fall')
+    parser.add_argument('-p', '--port', default=PORT, help=f'Serial port (default: {PORT})')
+    parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
+    parser.add_argument('--fast', action='store_true', help='Negotiate a faster link (baudlink.py)')
+    parser.add_argument('--no-sound', action='store_true', help="Don't run SOUND_CMD")
+    parser.add_argument('--webhook', help='Also notify http://... or unix:///path on each alert')
+    parser.add_argument('--webhook-stub', metavar='URL', help='Only run a local receiver that prints webhook calls')
+    args = parser.parse_args()
+
+    if args.webhook_stub:
+        try:
+            webhook_stub(args.webhook_stub)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    sinks = {'log': log_event}
+    if not args.no_sound:
+        sinks['sound'] = play_sound
+    if args.webhook:
+        sinks['webhook'] = lambda alert: post_webhook(args.webhook, json.dumps(alert.record()).encode())
+    alerts = AlertDispatcher(sinks)
+
+    print('Listening on', args.port, 'via serial_mux' if args.mux else
+          'at the fastest rate the link carries' if args.fast else f'at {BAUD}')
+    print('Will alert on FALL_DETECTED via', ', '.join(sinks))
+    dec = StreamDecoder()
+    max_stall = 0.0     # longest time between two serial reads, outside the read itself
+    link = None
     try:
-        with serial.Serial(PORT, BAUD, timeout=1) as ser:
+        ser, link = open_link(args.port, None if args.fast else BAUD, fast=args.fast,
+                              mux=args.mux, timeout=1)
+        with ser:
             time.sleep(2)
             ser.reset_input_buffer()
             while True:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if not line:
-                    continue
-                print(line)
-                if 'FALL_DETECTED' in line:
-                    print('ALERT: FALL DETECTED!')
-                    play_sound()
-    except serial.SerialException as e:
+                data = ser.read(max(1, ser.in_waiting))
+                dec.feed(data)
+                t_read = time.monotonic()
+                link.count(len(data), dec)
+                link.check()
+                for line in dec.take_text():
+                    print(line)
+                    if 'FALL_DETECTED' in line:
+                        alerts.submit(line)
+                for t_ms, name in dec.take_events():
+                    print(f'[{t_ms:.0f} ms] {name}')
+                    if name == 'FALL_DETECTED':
+                        alerts.submit('event', t_ms)
+                for snap in dec.take_snapshots():
+                    save_snapshot(snap)
+                dec.take_samples()  # binary stream samples aren't used here
+                max_stall = max(max_stall, time.monotonic() - t_read)
+    except (serial.SerialException, ConnectionError) as e:
         print('Serial error:', e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        alerts.close()
+        print(f'\nAlerts: {alerts.alerts}  coalesced: {alerts.coalesced}  '
+              f'dropped: {alerts.dropped}  sink failures: {alerts.failures}  '
+              f'longest read-loop pause: {max_stall * 1000:.1f} ms')
+        if link:
+            print(link.report())
 
 
 if __name__ == '__main__':
-    main() 
+    main()
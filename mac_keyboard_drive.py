@@ -5,11 +5,41 @@ Mac keyboard controller for ESP32 L298N robot.
 - Space/Enter stops
 - q quits
 
+Key events only update the set of held keys; the newest key still held
+decides the motion, and releasing the last one stops. A sender thread looks
+at that state every TICK_S and writes one byte when it changed, plus the
+current state again every KEEPALIVE_S, so OS key-repeat never reaches the
+serial link and overlapping keys don't stop the robot in between. Every
+write is timestamped: on exit it prints key-to-wire latency (key event to
+write() returning) and bytes/sec.
+
+With --framed each command goes out as "~M <seq> <key>" and
+esp32_l298n_main.py acks it with "~A <seq> <ticks_us>" once applied. Frames
+are not held back waiting for acks; a reader thread matches them up and keeps
+rolling RTT and one-way latency histograms (the device clock is lined up with
+ours from the fastest round trip). The board stops the motors by itself if no
+frame arrives within --deadman-ms, so keepalives go out three times as often.
+
+With --pwm it drives diffdrive.py instead: every tick (--rate-hz) carries
+a (left, right) speed setpoint in the setpoint.py encoding, where the newest
+held w/s key sets the speed and the newest a/d key steers. The stream doubles
+as the keepalive; the board ramps to a stop when it ends.
+
+    python3 mac_keyboard_drive.py -p /dev/cu.usbserial-0001
+    python3 mac_keyboard_drive.py --framed --deadman-ms 300
+    python3 mac_keyboard_drive.py --pwm --rate-hz 100 --speed 80
+    python3 mac_keyboard_drive.py --selftest      scripted keys against a pty
+
 Requires: pip install pyserial pynput
 """
+import argparse
+import collections
 import sys
+import threading
 import time
 
+import setpoint
+
 # Lazy import so script can suggest installs clearly
 try:
     import serial
@@ -17,14 +47,20 @@ except Exception:
     print("pyserial not found. Install with: pip3 install pyserial")
     sys.exit(1)
 
-try:
-    from pynput import keyboard
-except Exception:
-    print("pynput not found. Install with: pip3 install pynput")
-    sys.exit(1)
-
 PORT = '/dev/cu.usbserial-0001'  # Adjust if needed
 BAUD = 115200
+TICK_S = 0.01        # sender thread period: worst-case added latency
+KEEPALIVE_S = 0.5    # resend the current state this often when nothing changes
+STOP = ' '
+DEADMAN_MS = 500     # --framed: board stops if no frame arrives for this long
+STATS_S = 5          # --framed: print ack statistics this often
+ACK_TIMEOUT_S = 1.0  # a frame not acked by then counts as lost
+ROLL = 500           # acks kept for the rolling statistics
+HIST_MS = (0.5, 1, 2, 4, 8, 16, 32, 64)
+TICKS_PERIOD = 1 << 30  # MicroPython ticks_us wraps here
+RATE_HZ = 50         # --pwm: setpoints per second
+SPEED = 100          # --pwm: w/s wheel speed, of setpoint.FULL
+TURN = 60            # --pwm: a/d adds this to one wheel and takes it off the other
 
 KEY_TO_CMD = {
     'up': 'w',
@@ -38,36 +74,499 @@ ALT_KEYS = {
     'W': 'w', 'S': 's', 'A': 'a', 'D': 'd',
 }
 
+
+class KeyState:
+    """Direction keys held down, oldest first; the newest one decides the motion."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.held = []
+        self.t_change = time.monotonic()
+
+    def press(self, cmd: str, t: float) -> None:
+        with self.lock:
+            if cmd in self.held:
+                return              # OS key repeat
+            self.held.append(cmd)
+            self.t_change = t
+
+    def release(self, cmd: str, t: float) -> None:
+        with self.lock:
+            if cmd in self.held:
+                self.held.remove(cmd)
+                self.t_change = t
+
+    def stop(self, t: float) -> None:
+        with self.lock:
+            self.held.clear()
+            self.t_change = t
+
+    def desired(self):
+        """(command byte, time of the key event that made it so)."""
+        with self.lock:
+            return (self.held[-1] if self.held else STOP), self.t_change
+
+    def wheels(self, speed: int, turn: int):
+        """((left, right) speeds, time of the key event that made it so):
+        the newest of w/s drives, the newest of a/d steers."""
+        v = w = 0
+        with self.lock:
+            for cmd in self.held:       # oldest first, so the newest wins
+                if cmd in 'ws':
+                    v = 1 if cmd == 'w' else -1
+                else:
+                    w = 1 if cmd == 'd' else -1
+            t = self.t_change
+        return (v * speed + w * turn, v * speed - w * turn), t
+
+
+class SendStats:
+    def __init__(self) -> None:
+        self.t0 = time.monotonic()
+        self.bytes = 0
+        self.changes = 0
+        self.keepalives = 0
+        self.latency = []           # key event -> write() returned, for changes
+        self.log = []               # (t_wire, byte, kind)
+
+    def record(self, data: str, kind: str, t_key: float, t_wire: float) -> None:
+        self.bytes += len(data)
+        self.log.append((t_wire, data, kind))
+        if kind == 'change':
+            self.changes += 1
+            self.latency.append(t_wire - t_key)
+        else:
+            self.keepalives += 1
+
+    def report(self) -> str:
+        el = max(1e-9, time.monotonic() - self.t0)
+        out = (f"{self.changes} changes + {self.keepalives} keepalives, "
+               f"{self.bytes} B in {el:.1f} s ({self.bytes / el:.1f} B/s)")
+        if self.latency:
+            lat = sorted(self.latency)
+            out += (f"\nkey-to-wire ms min/avg/p95/max: {lat[0] * 1000:.2f} / "
+                    f"{sum(lat) / len(lat) * 1000:.2f} / {lat[int(len(lat) * 0.95)] * 1000:.2f} / "
+                    f"{lat[-1] * 1000:.2f}")
+        return out
+
+
+def _hist(name: str, xs) -> str:
+    xs = sorted(xs)
+    pct = ' / '.join(f"{xs[min(len(xs) - 1, int(len(xs) * q))] * 1000:.2f}" for q in (0.5, 0.95, 0.99))
+    counts = [0] * (len(HIST_MS) + 1)
+    for x in xs:
+        i = 0
+        while i < len(HIST_MS) and x * 1000 >= HIST_MS[i]:
+            i += 1
+        counts[i] += 1
+    bins = ' '.join(f"<{edge:g}:{n}" for edge, n in zip(HIST_MS, counts)) + f" >={HIST_MS[-1]:g}:{counts[-1]}"
+    return f"{name:>7} ms p50/p95/p99/max: {pct} / {xs[-1] * 1000:.2f}  [{bins}]"
+
+
+class AckStats:
+    """Frames in flight and the acks that came back for them."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.inflight = {}          # seq -> time the frame was written
+        self.rtt = collections.deque(maxlen=ROLL)
+        self.oneway = collections.deque(maxlen=ROLL)
+        self.acked = 0
+        self.lost = 0
+        self.deadman = 0
+        self.max_inflight = 0
+        self.best = None            # (rtt, device clock - ours) of the fastest round trip
+        self.dev = None             # [last ticks_us, unwrapped s]
+
+    def sent(self, seq: int, t: float) -> None:
+        with self.lock:
+            for old, t0 in list(self.inflight.items()):
+                if t - t0 > ACK_TIMEOUT_S:
+                    del self.inflight[old]
+                    self.lost += 1
+            self.inflight[seq] = t
+            self.max_inflight = max(self.max_inflight, len(self.inflight))
+
+    def _device_s(self, ticks: int) -> float:
+        if self.dev is None:
+            self.dev = [ticks, ticks / 1e6]
+        else:
+            self.dev[1] += ((ticks - self.dev[0]) % TICKS_PERIOD) / 1e6
+            self.dev[0] = ticks
+        return self.dev[1]
+
+    def line(self, p: list, t: float) -> None:
+        """Handle one line from the board, received at t."""
+        if len(p) == 3 and p[0] == '~A':
+            try:
+                seq, ticks = int(p[1], 16), int(p[2], 16)
+            except ValueError:
+                return
+            with self.lock:
+                t0 = self.inflight.pop(seq, None)
+                if t0 is None:
+                    return
+                dev = self._device_s(ticks)
+                rtt = t - t0
+                # Offset between the clocks from the fastest round trip,
+                # taking its two legs as equal
+                if self.best is None or rtt < self.best[0]:
+                    self.best = (rtt, dev - (t0 + rtt / 2))
+                self.acked += 1
+                self.rtt.append(rtt)
+                self.oneway.append(dev - self.best[1] - t0)
+        elif p and p[0] == '~X':
+            self.deadman += 1
+
+    def report(self) -> str:
+        with self.lock:
+            out = (f"{self.acked} acked, {self.lost} lost, {len(self.inflight)} in flight "
+                   f"(max {self.max_inflight}), {self.deadman} deadman stops")
+            if self.rtt:
+                out += '\n' + _hist('rtt', self.rtt) + '\n' + _hist('one-way', self.oneway)
+        return out
+
+
 class Controller:
-    def __init__(self, port: str, baud: int) -> None:
+    def __init__(self, port: str, baud: int, tick: float = TICK_S, keepalive: float = KEEPALIVE_S,
+                 framed: bool = False, deadman_ms: int = DEADMAN_MS,
+                 pwm: bool = False, speed: int = SPEED, turn: int = TURN) -> None:
         self.port = port
         self.baud = baud
+        self.tick = tick
+        self.framed = framed
+        self.deadman_ms = deadman_ms
+        self.keepalive = min(keepalive, deadman_ms / 3000) if framed and deadman_ms else keepalive
+        self.pwm = pwm
+        self.speed = speed
+        self.turn = turn
+        if pwm:
+            self.keepalive = 0          # a setpoint every tick
         self.ser = None
+        self.keys = KeyState()
+        self.stats = SendStats()
+        self.acks = AckStats()
+        self.seq = 0
+        self.sent = None
+        self.t_sent = 0.0
+        self._quit = threading.Event()      # sender
+        self._done = threading.Event()      # ack reader
+        self._thread = None
+        self._reader = None
 
-    def open(self) -> None:
+    def open(self, settle: float = 2.0) -> None:
         print(f"Connecting to {self.port} @ {self.baud}...")
-        self.ser = serial.Serial(self.port, self.baud, timeout=0)
-        time.sleep(2)
+        self.ser = serial.Serial(self.port, self.baud, timeout=0.05)
+        time.sleep(settle)
+        self.stats = SendStats()
+        if self.framed:
+            self.ser.reset_input_buffer()
+            self.ser.write(f"~D {self.deadman_ms}\n".encode())
+            self._reader = threading.Thread(target=self._read, name='acks', daemon=True)
+            self._reader.start()
+        self._thread = threading.Thread(target=self._run, name='sender', daemon=True)
+        self._thread.start()
         print("Connected. Use arrow keys (or WASD). Space=STOP, q=quit.")
 
-    def send(self, s: str) -> None:
+    def _read(self) -> None:
+        buf = b''
+        while not self._done.is_set():
+            try:
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError):
+                return
+            if not chunk:
+                continue
+            t = time.monotonic()
+            *lines, buf = (buf + chunk).split(b'\n')
+            for ln in lines:
+                self.acks.line(ln.decode('ascii', 'replace').split(), t)
+
+    def _run(self) -> None:
+        nxt = time.monotonic()
+        while not self._quit.is_set():
+            self._tick(time.monotonic())
+            nxt += self.tick
+            delay = nxt - time.monotonic()
+            if delay > 0:
+                self._quit.wait(delay)
+            else:
+                nxt = time.monotonic()  # fell behind: skip the missed ticks
+
+    def _tick(self, now: float) -> None:
+        if self.pwm:
+            cmd, t_key = self.keys.wheels(self.speed, self.turn)
+        else:
+            cmd, t_key = self.keys.desired()
+        if cmd != self.sent:
+            self.send(cmd, 'change', t_key)
+        elif now - self.t_sent >= self.keepalive:
+            self.send(cmd, 'keepalive', now)
+
+    def send(self, s, kind: str = 'change', t_key: float = None) -> None:
+        """Write a command byte, or a (left, right) setpoint with --pwm."""
         if not self.ser:
             return
+        data = s
+        if self.pwm:
+            data = setpoint.encode(*s)
+        elif self.framed:
+            self.seq = (self.seq + 1) & 0xFFFF
+            data = f"~M {self.seq:x} {'x' if s == STOP else s}\n"
         try:
-            self.ser.write(s.encode('utf-8'))
+            self.ser.write(data.encode('utf-8'))
         except serial.SerialException as e:
             print(f"Serial error: {e}")
-
-    def stop(self) -> None:
-        self.send(' ')
+            return
+        t = time.monotonic()
+        if self.framed:
+            self.acks.sent(self.seq, t)
+        self.stats.record(data, kind, t if t_key is None else t_key, t)
+        self.sent = s
+        self.t_sent = t
 
     def close(self) -> None:
+        self._quit.set()
+        if self._thread:
+            self._thread.join()
         if self.ser and self.ser.is_open:
+            self.send((0, 0) if self.pwm else STOP, 'change')     # never leave the robot driving
+            if self._reader:
+                time.sleep(0.1)             # the last acks
+                self._done.set()
+                self._reader.join()
             self.ser.close()
 
 
+def key_cmd(key, keyboard):
+    """Direction byte for a pynput key, or None."""
+    for name in KEY_TO_CMD:
+        if key == getattr(keyboard.Key, name):
+            return KEY_TO_CMD[name]
+    return ALT_KEYS.get(getattr(key, 'char', None))
+
+
+def selftest() -> bool:
+    """Scripted key events with 30 Hz OS repeat against a pty stand-in for the ESP32."""
+    import os
+    import pty
+    import select
+    import tty
+
+    print("-- raw bytes")
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    got = []
+
+    def esp32():
+        while not done.is_set():
+            try:
+                if select.select([master], [], [], 0.05)[0]:
+                    t = time.monotonic()
+                    got.extend((t, chr(b)) for b in os.read(master, 256))
+            except OSError:
+                return
+
+    done = threading.Event()
+    board = threading.Thread(target=esp32, daemon=True)
+    board.start()
+    ctl = Controller(os.ttyname(slave), BAUD)
+    ctl.open(settle=0)
+
+    # (t, event, cmd): hold w, press d while w is still down, let go of w,
+    # then d; macOS repeats a held key every 33 ms after a 250 ms delay.
+    # The sender opens with a stop before any key is pressed.
+    script = []
+    for t0, t1, cmd in ((0.0, 1.0, 'w'), (0.6, 1.5, 'd')):
+        script.append((t0, 'press', cmd))
+        t = t0 + 0.25
+        while t < t1:
+            script.append((t, 'press', cmd))
+            t += 1 / 30
+        script.append((t1, 'release', cmd))
+    script.sort()
+    legacy = sum(1 for _, ev, _ in script if ev == 'press') + sum(1 for _, ev, _ in script if ev == 'release')
+
+    t_start = time.monotonic()
+    for t, ev, cmd in script:
+        time.sleep(max(0.0, t_start + t - time.monotonic()))
+        getattr(ctl.keys, ev)(cmd, time.monotonic())
+    time.sleep(1.2)                 # idle: stop keepalives only
+    ctl.close()
+    time.sleep(0.1)
+    done.set()
+    board.join()
+    os.close(master)
+
+    stream = ''.join(c for _, c in got)
+    moves = [c for i, c in enumerate(stream) if i == 0 or c != stream[i - 1]]
+    print(f"{len(script)} key events (old code: {legacy} bytes)")
+    print(f"wire: {stream!r}")
+    print(ctl.stats.report())
+    ok = moves == [STOP, 'w', 'd', STOP] and len(stream) == ctl.stats.bytes
+    ok &= max(ctl.stats.latency) < TICK_S + 0.01
+    ok &= ctl.stats.bytes < legacy / 4
+    print("OK" if ok else "FAILED")
+    ok &= selftest_framed()
+    ok &= selftest_pwm()
+    return ok
+
+
+def selftest_framed() -> bool:
+    """--framed against a pty board that acks 30 ms late and has a deadman."""
+    import os
+    import pty
+    import select
+    import tty
+
+    print("-- framed")
+    ack_delay = 0.03                # e.g. a status line queued ahead of the ack
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    # Device clock starts 0.5 s before ticks_us wraps
+    base = time.monotonic() - (TICKS_PERIOD - 500000) / 1e6
+    stops = []
+
+    def esp32():
+        buf = b''
+        window = DEADMAN_MS
+        armed = False
+        t_frame = 0.0
+        due = []                    # (time to send, ack line)
+        while not done.is_set():
+            try:
+                r = select.select([master], [], [], 0.001)[0]
+                now = time.monotonic()
+                if r:
+                    *lines, buf = (buf + os.read(master, 256)).split(b'\n')
+                    for ln in lines:
+                        p = ln.decode().split() or ['']
+                        if p[0] == '~D':
+                            window = int(p[1])
+                        elif p[0] == '~M':
+                            armed, t_frame = window > 0, now
+                            ticks = int((now - base) * 1e6) % TICKS_PERIOD
+                            due.append((now + ack_delay, f"~A {p[1]} {ticks:x}\n"))
+                while due and due[0][0] <= now:
+                    os.write(master, due.pop(0)[1].encode())
+                if armed and now - t_frame >= window / 1000:
+                    armed = False
+                    stops.append(now)
+                    os.write(master, f"~X {int((now - base) * 1e6) % TICKS_PERIOD:x}\n".encode())
+            except OSError:
+                return
+
+    done = threading.Event()
+    board = threading.Thread(target=esp32, daemon=True)
+    board.start()
+    ctl = Controller(os.ttyname(slave), BAUD, framed=True, deadman_ms=200)
+    ctl.open(settle=0)
+    t = time.monotonic()
+    for cmd in 'wdas':              # four changes inside one ack delay
+        ctl.keys.press(cmd, time.monotonic())
+        time.sleep(0.012)
+    time.sleep(0.5)
+    with ctl.keys.lock:             # host hangs with s held: no keepalives
+        time.sleep(0.4)
+    time.sleep(0.3)
+    ctl.keys.stop(time.monotonic())
+    time.sleep(0.2)
+    ctl.close()
+    done.set()
+    board.join()
+    os.close(master)
+
+    frames = ctl.stats.changes + ctl.stats.keepalives
+    a = ctl.acks
+    print(f"{frames} frames, {ctl.stats.bytes} B")
+    print(a.report())
+    ok = a.acked == frames and a.lost == 0 and a.deadman == len(stops) == 1
+    ok &= a.max_inflight >= 2 and ack_delay <= min(a.rtt) < ack_delay + 0.02
+    ok &= all(0 <= x <= r for x, r in zip(a.oneway, a.rtt))
+    print("OK" if ok else "FAILED")
+    return ok
+
+
+def selftest_pwm() -> bool:
+    """--pwm against a pty board that decodes setpoints like diffdrive.py."""
+    import os
+    import pty
+    import select
+    import tty
+
+    print("-- pwm setpoints")
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    got = []                        # (time, decoded setpoint or None)
+
+    def esp32():
+        buf = b''
+        while not done.is_set():
+            try:
+                if select.select([master], [], [], 0.05)[0]:
+                    t = time.monotonic()
+                    *lines, buf = (buf + os.read(master, 256)).split(b'\n')
+                    for ln in lines:
+                        got.append((t, setpoint.decode(ln.decode()[1:])))
+            except OSError:
+                return
+
+    done = threading.Event()
+    board = threading.Thread(target=esp32, daemon=True)
+    board.start()
+    ctl = Controller(os.ttyname(slave), BAUD, 1 / RATE_HZ, pwm=True)
+    ctl.open(settle=0)
+    for t, ev, cmd in ((0.3, 'press', 'w'), (0.6, 'press', 'a'), (0.9, 'release', 'w'),
+                       (1.2, 'release', 'a')):
+        time.sleep(t - (time.monotonic() - ctl.stats.t0))
+        getattr(ctl.keys, ev)(cmd, time.monotonic())
+    time.sleep(0.3)
+    ctl.close()
+    time.sleep(0.1)
+    done.set()
+    board.join()
+    os.close(master)
+
+    sps = [sp for _, sp in got]
+    seq = [sp for i, sp in enumerate(sps) if i == 0 or sp != sps[i - 1]]
+    span = got[-2][0] - got[0][0]   # the last one is the stop from close()
+    rate = (len(got) - 2) / span
+    print(f"{len(got)} setpoints at {rate:.1f}/s, {ctl.stats.bytes} B: {seq}")
+    print(ctl.stats.report())
+    ok = None not in sps and seq == [(0, 0), (SPEED, SPEED), (SPEED - TURN, 127), (-TURN, TURN), (0, 0)]
+    ok &= abs(rate - RATE_HZ) < RATE_HZ * 0.1 and ctl.stats.bytes == len(got) * setpoint.SIZE
+    ok &= max(ctl.stats.latency) < 1 / RATE_HZ + 0.01
+    print("OK" if ok else "FAILED")
+    return ok
+
+
 def main() -> None:
-    ctl = Controller(PORT, BAUD)
+    parser = argparse.ArgumentParser(description='Drive the L298N robot from the keyboard')
+    parser.add_argument('-p', '--port', default=PORT, help=f'Serial port (default: {PORT})')
+    parser.add_argument('-b', '--baud', type=int, default=BAUD, help=f'Baud rate (default: {BAUD})')
+    parser.add_argument('--tick-ms', type=float, default=TICK_S * 1000, help='Sender period (default: %(default)s)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--framed', action='store_true', help='Sequence-numbered frames, acked by the board')
+    mode.add_argument('--pwm', action='store_true', help='Stream speed setpoints to diffdrive.py')
+    parser.add_argument('--deadman-ms', type=int, default=DEADMAN_MS,
+                        help='--framed: board stops without a frame for this long, 0 = off (default: %(default)s)')
+    parser.add_argument('--rate-hz', type=float, default=RATE_HZ, help='--pwm: setpoints per second (default: %(default)s)')
+    parser.add_argument('--speed', type=int, default=SPEED, help='--pwm: driving speed, of 127 (default: %(default)s)')
+    parser.add_argument('--turn', type=int, default=TURN, help='--pwm: steering difference, of 127 (default: %(default)s)')
+    parser.add_argument('--selftest', action='store_true', help='Scripted keys against a pty, no keyboard needed')
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+
+    try:
+        from pynput import keyboard
+    except Exception:
+        print("pynput not found. Install with: pip3 install pynput")
+        sys.exit(1)
+
+    tick = 1 / args.rate_hz if args.pwm else args.tick_ms / 1000
+    ctl = Controller(args.port, args.baud, tick, framed=args.framed, deadman_ms=args.deadman_ms,
+                     pwm=args.pwm, speed=args.speed, turn=args.turn)
     try:
         ctl.open()
     except Exception as e:
@@ -77,39 +576,34 @@ def main() -> None:
 
     def on_press(key):
         try:
-            if key == keyboard.Key.up:
-                ctl.send(KEY_TO_CMD['up'])
-            elif key == keyboard.Key.down:
-                ctl.send(KEY_TO_CMD['down'])
-            elif key == keyboard.Key.left:
-                ctl.send(KEY_TO_CMD['left'])
-            elif key == keyboard.Key.right:
-                ctl.send(KEY_TO_CMD['right'])
-            elif key == keyboard.Key.space or key == keyboard.Key.enter:
-                ctl.stop()
-            elif hasattr(key, 'char') and key.char in ALT_KEYS:
-                ctl.send(ALT_KEYS[key.char])
-            elif key == keyboard.Key.esc:
+            cmd = key_cmd(key, keyboard)
+            if cmd:
+                ctl.keys.press(cmd, time.monotonic())
+            elif key in (keyboard.Key.space, keyboard.Key.enter, keyboard.Key.esc):
                 # ESC behaves like stop
-                ctl.stop()
+                ctl.keys.stop(time.monotonic())
         except Exception:
             pass
 
     def on_release(key):
-        # Optional: stop on key release for tap-to-move style
-        # Comment this out if you want continuous motion until next command
-        if key in (keyboard.Key.up, keyboard.Key.down, keyboard.Key.left, keyboard.Key.right):
-            ctl.stop()
-        if hasattr(key, 'char') and key.char in ('w','a','s','d','W','A','S','D'):
-            ctl.stop()
+        # Letting go of the last held direction key stops (tap-to-move style)
+        cmd = key_cmd(key, keyboard)
+        if cmd:
+            ctl.keys.release(cmd, time.monotonic())
         if key == keyboard.KeyCode.from_char('q'):
             return False
 
     with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
         try:
-            listener.join()
+            while listener.is_alive():
+                listener.join(STATS_S)
+                if args.framed and listener.is_alive():
+                    print(ctl.acks.report())
         finally:
             ctl.close()
+            print(ctl.stats.report())
+            if args.framed:
+                print(ctl.acks.report())
 
 if __name__ == '__main__':
-    main() 
+    main()
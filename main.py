@@ -1,11 +1,95 @@
-from machine import I2C, Pin
-import time, math
+from machine import I2C, Pin, Timer, idle, lightsleep
+import sys, time, math, gc, micropython, uselect, struct
+from array import array
 
 # I2C pins for your ESP32
 SDA_PIN = 21
 SCL_PIN = 22
 MPU_ADDR = 0x68
 
+# Sampling mode:
+#   "poll" - one 6-byte read per sample, ~50 Hz
+#   "fifo" - MPU-6050 paces samples into its FIFO, drained in bursts
+#   "fast" - polling with a viper core: integer |a|^2 compare, no float or sqrt
+#   "wake" - sleep until the MPU-6050 free-fall/motion interrupt fires
+#   "thread" - a _thread sampler reads + detects on the PERIOD_US grid, the main
+#              thread formats and prints, so a slow serial link can't stall sampling
+MODE = "poll"
+
+# Pacing for "poll" mode:
+#   "sleep"    - sleep_ms(20) after each sample, so the period grows with the work
+#   "deadline" - samples land on a fixed ticks_us grid (sleep, then spin the last ms)
+#   "timer"    - machine.Timer ticks the grid, the sample runs via micropython.schedule
+# With "deadline"/"timer", send '?' over serial for jitter stats and 'r' to reset them.
+PACING = "sleep"
+PERIOD_US = 20000
+
+# Output format:
+#   "text"   - human-readable "ACC g: ..." every 200 ms plus event lines
+#   "binary" - every sample, COBS-framed + CRC16, decoded on the host by telemetry.py
+STREAM = "text"
+STREAM_BATCH = 25      # samples per binary frame
+
+# Pre-event snapshot: the last SNAP_RING_MS of raw samples are kept in RAM, and
+# on FALL_DETECTED the SNAP_PRE_MS before / SNAP_POST_MS after are sent to the
+# host as FRAME_SNAPSHOT frames (mac_fall_alarm.py saves them). Binary STREAM only:
+# the frames would be garbage in a text console.
+SNAPSHOT = True
+SNAP_RING_MS = 6000    # must exceed PRE + POST so the dump can't be overwritten
+SNAP_PRE_MS = 3000
+SNAP_POST_MS = 1000
+SNAP_CHUNK = 40        # samples per frame; one frame goes out per new sample
+
+# FIFO burst mode
+FIFO_RATE_HZ = 500     # 1 kHz / (1 + SMPLRT_DIV), so 1000, 500, 333, 250, 200, ...
+FIFO_BURST = 32        # max samples per readfrom_mem_into (6 bytes each)
+FIFO_REPORT_MS = 2000  # how often to print the effective sample rate
+
+# Fast mode
+FAST_PERIOD_MS = 20     # same pacing as "poll"
+FAST_REPORT_MS = 5000   # how often to print loop timing and heap drift
+
+# Interrupt wake mode
+INT_PIN = 32            # MPU-6050 INT -> RTC-capable GPIO (needed for light-sleep wake)
+WAKE_FF_MG = 350        # FF_THR: every axis below this raises free-fall (2 mg/LSB)
+WAKE_FF_DUR_MS = 20     # FF_DUR: how long free-fall must last before INT fires
+WAKE_MOT_MG = 300       # MOT_THR: high-passed motion above this raises INT (2 mg/LSB)
+WAKE_PERIOD_MS = 5      # full-rate polling while awake (200 Hz)
+WAKE_HOLD_MS = 3000     # go back to sleep after this long without motion
+WAKE_LIGHTSLEEP = True  # False: machine.idle() instead (keeps the USB REPL usable)
+WAKE_REPORT_MS = 60000  # how often to print duty-cycle and wake-latency stats
+
+# Two-thread mode
+THREAD_RING = 64           # sampler -> reporter slots (power of two); 64 = 1.28 s at 50 Hz
+THREAD_DRAIN_MS = 10       # reporter wakes this often to empty the ring
+THREAD_REPORT_MS = 10000   # how often to print ring overruns and backlog
+
+# Link speed: after connecting, a host tool (baudlink.py) may move the serial
+# link to a faster rate. "~B SET <rate> <nonce>" is acknowledged at the old
+# rate, then the UART switches and sends LINK_TEST_LINES CRC-checked lines;
+# unless the host answers "~B KEEP <nonce> <crc>" within LINK_TRIAL_MS, the
+# link drops back to LINK_BASE, so a rate the cable can't carry never sticks.
+LINK_BASE = 115200
+LINK_RATES = (921600, 2000000)
+LINK_TRIAL_MS = 1500
+LINK_SETTLE_MS = 50        # host reopens its port at the new rate meanwhile
+LINK_TEST_LINES = 8
+
+# MPU-6050 registers used by the FIFO and wake modes
+FF_THR = 0x1D
+FF_DUR = 0x1E
+MOT_THR = 0x1F
+MOT_DUR = 0x20
+INT_PIN_CFG = 0x37
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+FIFO_EN = 0x23
+INT_ENABLE = 0x38
+INT_STATUS = 0x3A
+USER_CTRL = 0x6A
+FIFO_COUNT_H = 0x72
+FIFO_R_W = 0x74
+
 i2c = I2C(0, sda=Pin(SDA_PIN), scl=Pin(SCL_PIN), freq=400000)
 
 # Helpers
@@ -29,50 +113,1061 @@ ff = False
 ff_t0 = 0
 last_event = -COOLDOWN
 
-print("MicroPython Fall Detector running at 50 Hz")
+# Nominal sample rate, for the banner and the snapshot ring size
+if MODE == "fifo":
+    SAMPLE_HZ = FIFO_RATE_HZ
+elif MODE == "fast":
+    SAMPLE_HZ = 1000 // FAST_PERIOD_MS
+elif MODE == "wake":
+    SAMPLE_HZ = 1000 // WAKE_PERIOD_MS      # while awake
+elif MODE == "poll" and PACING == "sleep":
+    SAMPLE_HZ = 50                          # sleep_ms(20) per sample, a bit less with the work
+else:
+    SAMPLE_HZ = 1000000 // PERIOD_US
+
+print("MicroPython Fall Detector running at", SAMPLE_HZ, "Hz")
 print("I2C: SDA=", SDA_PIN, " SCL=", SCL_PIN)
 
 
 def lsb2g(v):
     return v / 16384.0
 
+
+# Binary telemetry (see telemetry.py for the host side). Each frame is
+#   0x00, COBS(type, seq, body..., crc16 LE), 0x00
+# with CRC-16/CCITT-FALSE over type..body. Bodies (little endian):
+#   FRAME_SAMPLES: t0_ms u32, t1_ms u32, n u8, enc u8, samples
+#     enc 0: n * (x, y, z) int16 big endian, as read from the MPU-6050
+#     enc 1: first sample as in enc 0, then (n-1) * (dx, dy, dz) int8
+#   FRAME_EVENT:   t_ms u32, code u8
+#   FRAME_SNAPSHOT: event t_ms u32, offset u16, total u16, n u8,
+#     n * (dt_ms, x, y, z) int16 big endian, dt_ms relative to the event
+# Times are ticks_ms masked to 30 bits.
+FRAME_SAMPLES = 0x01
+FRAME_EVENT = 0x02
+FRAME_SNAPSHOT = 0x03
+EV_FREE_FALL = 1
+EV_FALL = 2
+EV_FREE_FALL_TIMEOUT = 3
+EV_TEXT = {EV_FREE_FALL: "-- free-fall start --", EV_FALL: "FALL_DETECTED",
+           EV_FREE_FALL_TIMEOUT: None}     # binary stream only
+
+
+@micropython.viper
+def _copy6(dst: ptr8, doff: int, src: ptr8, soff: int):
+    for i in range(6):
+        dst[doff + i] = src[soff + i]
+
+
+@micropython.viper
+def _delta8(raw: ptr8, n: int, dst: ptr8) -> int:
+    """Write raw[0:6] then int8 deltas of the other n-1 samples. -1 if a delta overflows."""
+    for i in range(6):
+        dst[i] = raw[i]
+    o = 6
+    for i in range(6, n * 6, 2):
+        v = (int(raw[i]) << 8) | int(raw[i + 1])
+        p = (int(raw[i - 6]) << 8) | int(raw[i - 5])
+        if v & 0x8000:
+            v -= 0x10000
+        if p & 0x8000:
+            p -= 0x10000
+        d = v - p
+        if d < -128 or d > 127:
+            return -1
+        dst[o] = d & 0xFF
+        o += 1
+    return o
+
+
+@micropython.viper
+def _crc16(buf: ptr8, n: int) -> int:
+    crc = 0xFFFF
+    for i in range(n):
+        crc ^= int(buf[i]) << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+@micropython.viper
+def _cobs(src: ptr8, n: int, dst: ptr8) -> int:
+    """COBS-encode src[0:n] into dst[1:], between 0x00 delimiters. Returns bytes used."""
+    dst[0] = 0
+    code_i = 1
+    code = 1
+    o = 2
+    for i in range(n):
+        c = src[i]
+        if c == 0:
+            dst[code_i] = code
+            code_i = o
+            o += 1
+            code = 1
+        else:
+            dst[o] = c
+            o += 1
+            code += 1
+            if code == 0xFF:
+                dst[code_i] = code
+                code_i = o
+                o += 1
+                code = 1
+    dst[code_i] = code
+    dst[o] = 0
+    return o + 1
+
+
+class FrameWriter:
+    """CRC + COBS + write for frames built in place; frame[1] gets the sequence number."""
+
+    def __init__(self, size):
+        self.enc = bytearray(size + size // 254 + 4)
+        self.seq = 0
+        self.out = sys.stdout.buffer
+
+    def send(self, frame, size):
+        frame[1] = self.seq
+        crc = _crc16(frame, size)
+        frame[size] = crc & 0xFF
+        frame[size + 1] = crc >> 8
+        n = _cobs(frame, size + 2, self.enc)
+        self.out.write(memoryview(self.enc)[:n])
+        self.seq = (self.seq + 1) & 0xFF
+
+
+class Telemetry:
+    """Batches raw samples into binary frames and writes them to stdout."""
+
+    def __init__(self, batch, writer):
+        self.batch = batch
+        self.raw = bytearray(6 * batch)
+        self.n = 0
+        self.t0 = 0
+        self.t1 = 0
+        self.frame = bytearray(14 + 6 * batch)
+        self.writer = writer
+
+    def sample(self, buf, off, now):
+        if self.n == 0:
+            self.t0 = now
+        self.t1 = now
+        _copy6(self.raw, self.n * 6, buf, off)
+        self.n += 1
+        if self.n == self.batch:
+            self.flush()
+
+    def flush(self):
+        n = self.n
+        if not n:
+            return
+        f = self.frame
+        f[0] = FRAME_SAMPLES
+        _put32(f, 2, self.t0)
+        _put32(f, 6, self.t1)
+        f[10] = n
+        body = memoryview(f)[12:]
+        size = _delta8(self.raw, n, body)
+        if size < 0:
+            f[11] = 0
+            _copy(body, self.raw, 6 * n)
+            size = 6 * n
+        else:
+            f[11] = 1
+        self.n = 0
+        self.writer.send(f, 12 + size)
+
+    def event(self, code, now):
+        # Pending samples go first so the host sees them in order
+        self.flush()
+        f = self.frame
+        f[0] = FRAME_EVENT
+        _put32(f, 2, now)
+        f[6] = code
+        self.writer.send(f, 7)
+
+
+@micropython.viper
+def _store3(dst: ptr16, k: int, src: ptr8, off: int):
+    """Store the big-endian XYZ sample at src[off:off+6] into int16 slots dst[3k:3k+3]."""
+    for i in range(3):
+        v = (int(src[off + 2 * i]) << 8) | int(src[off + 2 * i + 1])
+        if v & 0x8000:
+            v -= 0x10000
+        dst[3 * k + i] = v
+
+
+class EventRing:
+    """Preallocated ring of recent raw samples, dumped around FALL_DETECTED.
+
+    add() never blocks: once the post-event window is complete, each call
+    also sends at most one SNAP_CHUNK frame of the frozen window.
+    """
+
+    def __init__(self, n, writer):
+        self.n = n
+        self.xyz = array('h', bytes(6 * n))
+        self.t = array('i', bytes(4 * n))
+        self.w = 0              # samples written so far (ring index is w % n)
+        self.ev_t = None        # event time while a snapshot is pending
+        self.start = self.pos = 0
+        self.end = None         # set once the post-event window is complete
+        self.frame = bytearray(15 + 8 * SNAP_CHUNK)
+        self.writer = writer
+
+    def add(self, buf, off, now):
+        k = self.w % self.n
+        _store3(self.xyz, k, buf, off)
+        self.t[k] = now
+        self.w += 1
+        if self.ev_t is None:
+            return
+        if self.end is None:
+            if time.ticks_diff(now, self.ev_t) >= SNAP_POST_MS:
+                self.end = self.w
+            return
+        self.pump()
+
+    def trigger(self, now):
+        if self.ev_t is not None:
+            return              # still sending the previous one
+        # Walk back to the first sample inside the pre-event window
+        first = self.w - 1
+        lo = max(0, self.w - self.n)
+        while first > lo and time.ticks_diff(now, self.t[(first - 1) % self.n]) <= SNAP_PRE_MS:
+            first -= 1
+        self.ev_t = now
+        self.pos = self.start = first
+        self.end = None
+
+    def pump(self):
+        if self.pos < self.w - self.n:
+            # Overwritten before it went out (ring too small for the rate)
+            print("snapshot lost: ring overrun")
+            self.ev_t = None
+            return
+        m = min(SNAP_CHUNK, self.end - self.pos)
+        f = self.frame
+        f[0] = FRAME_SNAPSHOT
+        _put32(f, 2, self.ev_t)
+        off = self.pos - self.start
+        total = self.end - self.start
+        f[6] = off & 0xFF
+        f[7] = off >> 8
+        f[8] = total & 0xFF
+        f[9] = total >> 8
+        f[10] = m
+        o = 11
+        xyz = self.xyz
+        for j in range(self.pos, self.pos + m):
+            k = j % self.n
+            dt = max(-32768, min(32767, time.ticks_diff(self.t[k], self.ev_t)))
+            struct.pack_into('>hhhh', f, o, dt, xyz[3 * k], xyz[3 * k + 1], xyz[3 * k + 2])
+            o += 8
+        self.pos += m
+        self.writer.send(f, o)
+        if self.pos >= self.end:
+            self.ev_t = None
+
+
+def _put32(buf, off, v):
+    v &= 0x3FFFFFFF
+    buf[off] = v & 0xFF
+    buf[off + 1] = (v >> 8) & 0xFF
+    buf[off + 2] = (v >> 16) & 0xFF
+    buf[off + 3] = v >> 24
+
+
+@micropython.viper
+def _copy(dst: ptr8, src: ptr8, n: int):
+    for i in range(n):
+        dst[i] = src[i]
+
+
+writer = FrameWriter(max(14 + 6 * STREAM_BATCH, 15 + 8 * SNAP_CHUNK))
+tele = Telemetry(STREAM_BATCH, writer) if STREAM == "binary" else None
+ring = EventRing(SNAP_RING_MS * SAMPLE_HZ // 1000, writer) if SNAPSHOT and STREAM == "binary" else None
+
+
+def record(buf, off, now):
+    """Hand one raw sample to the snapshot ring and the binary stream."""
+    if ring:
+        ring.add(buf, off, now)
+    if tele:
+        tele.sample(buf, off, now)
+
+
+def event(code, now, text):
+    """Report a detector event as a typed frame or, if it has one, a text line."""
+    if tele:
+        tele.event(code, now)
+    elif text:
+        print(text)
+    if code == EV_FALL and ring:
+        ring.trigger(now)
+
+
+def detect(amag, now):
+    """Free-fall -> impact state machine, fed one |a| sample (g) at time now (ms)."""
+    global ff, ff_t0, last_event
+    if time.ticks_diff(now, last_event) < COOLDOWN:
+        return
+
+    if not ff:
+        if amag < FREE:
+            ff = True
+            ff_t0 = now
+            event(EV_FREE_FALL, now, "-- free-fall start --")
+    else:
+        dt = time.ticks_diff(now, ff_t0)
+        if IMP <= amag and MIN_MS <= dt <= WIN_MS:
+            event(EV_FALL, now, "FALL_DETECTED")
+            last_event = now
+            ff = False
+        elif dt > WIN_MS:
+            ff = False
+            event(EV_FREE_FALL_TIMEOUT, now, None)  # frame only: no new text line
+        elif amag > 0.8 and dt > MIN_MS:
+            ff = False
+
+
 last_print = 0
 
-while True:
+
+def poll_sample(now):
+    """Read and process one sample stamped with time now (ms). False on I2C error."""
+    global last_print
     try:
         b = r(0x3B, 6)
     except Exception as e:
         print("I2C read error:", e)
-        time.sleep_ms(100)
-        continue
+        return False
 
     ax = lsb2g(int.from_bytes(b[0:2], 'big', signed=True))
     ay = lsb2g(int.from_bytes(b[2:4], 'big', signed=True))
     az = lsb2g(int.from_bytes(b[4:6], 'big', signed=True))
     amag = math.sqrt(ax*ax + ay*ay + az*az)
 
-    now = time.ticks_ms()
-
-    if time.ticks_diff(now, last_print) >= 200:
+    record(b, 0, now)
+    if not tele and time.ticks_diff(now, last_print) >= 200:
         last_print = now
         print("ACC g:", round(ax,2), round(ay,2), round(az,2), "|a|=", round(amag,2))
 
-    if time.ticks_diff(now, last_event) < COOLDOWN:
+    detect(amag, now)
+    return True
+
+
+class Jitter:
+    """Running lateness of samples against their grid slots, plus missed slots."""
+
+    def __init__(self, period_us):
+        self.period_us = period_us
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.missed = 0
+        self.errors = 0
+        self.late_min = self.late_max = self.late_sum = self.late_sq = 0
+        self.per_min = self.per_max = self.period_us
+        self.t_prev = None
+
+    def add(self, t_us, late_us):
+        if self.n == 0 or late_us < self.late_min:
+            self.late_min = late_us
+        if late_us > self.late_max:
+            self.late_max = late_us
+        self.late_sum += late_us
+        self.late_sq += late_us * late_us
+        self.n += 1
+        if self.t_prev is not None:
+            per = time.ticks_diff(t_us, self.t_prev)
+            if per < self.per_min:
+                self.per_min = per
+            if per > self.per_max:
+                self.per_max = per
+        self.t_prev = t_us
+
+    def report(self):
+        n = self.n or 1
+        mean = self.late_sum / n
+        sd = math.sqrt(max(0, self.late_sq / n - mean * mean))
+        print("JITTER n:", self.n,
+              "late us min/avg/max/sd:", self.late_min, int(mean), self.late_max, int(sd),
+              "period us min/max:", self.per_min, self.per_max,
+              "missed:", self.missed, "i2c errors:", self.errors)
+
+
+_stdin = uselect.poll()
+_stdin.register(sys.stdin, uselect.POLLIN)
+
+
+# '~' command line being received, and [rate, trial deadline, nonce or None while kept]
+_cmd = []
+_link = [LINK_BASE, 0, None]
+_uart = None
+
+
+def _ready():
+    # ipoll: no result list is allocated, so "fast" mode can call this every pass
+    for _ in _stdin.ipoll(0):
+        return True
+    return False
+
+
+def check_query(stats=None):
+    """Answer '?' (print stats) and 'r' (reset stats) sent over serial, and '~' link commands."""
+    while _ready():
+        c = sys.stdin.read(1)
+        if _cmd:
+            if c == '\r' or c == '\n':
+                link_command(''.join(_cmd).split())
+                _cmd.clear()
+            elif len(_cmd) < 48:
+                _cmd.append(c)
+        elif c == '~':
+            _cmd.append(c)
+        elif stats is None:
+            pass
+        elif c == '?':
+            stats.report()
+        elif c == 'r':
+            stats.reset()
+            print("JITTER reset")
+    if _link[2] is not None and time.ticks_diff(time.ticks_ms(), _link[1]) >= 0:
+        _link[2] = None
+        link_rate(LINK_BASE)
+        print("~B REVERT", LINK_BASE)
+
+
+def link_rate(rate):
+    global _uart
+    from machine import UART
+    time.sleep_ms(5)        # let the last reply leave at the old rate
+    if _uart is None:
+        _uart = UART(0, baudrate=rate)
+    else:
+        _uart.init(baudrate=rate)
+    _link[0] = rate
+
+
+def _crc_hex(text):
+    b = text.encode()
+    return "%04x" % _crc16(b, len(b))
+
+
+def link_command(p):
+    if p == ["~B?"]:
+        print("~B RATES", LINK_BASE, *LINK_RATES)
+    elif len(p) == 4 and p[0] == "~B" and p[1] == "SET":
+        try:
+            rate = int(p[2])
+        except ValueError:
+            rate = 0                        # garbled: NAK it like any unknown rate
+        if rate != LINK_BASE and rate not in LINK_RATES:
+            print("~B NAK", rate)
+            return
+        print("~B ACK", rate, p[3])
+        link_rate(rate)
+        time.sleep_ms(LINK_SETTLE_MS)
+        if rate == LINK_BASE:
+            _link[2] = None
+            print("~B KEPT", rate)
+            return
+        _link[1] = time.ticks_add(time.ticks_ms(), LINK_TRIAL_MS)
+        _link[2] = p[3]
+        # Each line is a rotation of every printable character
+        for i in range(LINK_TEST_LINES):
+            pay = ''.join(chr(33 + (i + k) % 94) for k in range(94))
+            print("~B TEST", i, pay, _crc_hex(pay))
+    elif len(p) == 4 and p[0] == "~B" and p[1] == "KEEP":
+        if p[2] == _link[2] and p[3] == _crc_hex("KEEP " + p[2]):
+            _link[2] = None
+            print("~B KEPT", _link[0])
+
+
+class GridClock:
+    """Millisecond timestamps for evenly spaced samples, free of read-time noise."""
+
+    def __init__(self, period_us):
+        self.period_us = period_us
+        self.now = time.ticks_ms()
+        self.frac_us = 0
+
+    def skip(self, n):
+        self.frac_us += n * self.period_us
+        self.now = time.ticks_add(self.now, self.frac_us // 1000)
+        self.frac_us %= 1000
+        return self.now
+
+
+def run_deadline():
+    stats = Jitter(PERIOD_US)
+    clock = GridClock(PERIOD_US)
+    nxt = time.ticks_add(time.ticks_us(), PERIOD_US)
+
+    while True:
+        d = time.ticks_diff(nxt, time.ticks_us())
+        if d > 1500:
+            time.sleep_ms((d - 1000) // 1000)
+        while time.ticks_diff(nxt, time.ticks_us()) > 0:
+            pass
+
+        t = time.ticks_us()
+        late = time.ticks_diff(t, nxt)
+        slots = 1
+        if late >= PERIOD_US:
+            # Overran whole periods: skip those slots but stay on the grid
+            skipped = late // PERIOD_US
+            stats.missed += skipped
+            slots += skipped
+            nxt = time.ticks_add(nxt, skipped * PERIOD_US)
+            late -= skipped * PERIOD_US
+        stats.add(t, late)
+
+        if not poll_sample(clock.skip(slots)):
+            stats.errors += 1
+        check_query(stats)
+        nxt = time.ticks_add(nxt, PERIOD_US)
+
+
+def run_timer():
+    stats = Jitter(PERIOD_US)
+    clock = GridClock(PERIOD_US)
+    # [ticks_us of the first tick, ticks fired, slots sampled, sample pending];
+    # the tick count places each sample on the grid even if it ran late.
+    st = [0, 0, 0, False]
+
+    def sample(_):
+        st[3] = False
+        t = time.ticks_us()
+        late = time.ticks_diff(t, time.ticks_add(st[0], (st[1] - 1) * PERIOD_US))
+        slots = st[1] - st[2]
+        if slots > 1:
+            stats.missed += slots - 1
+        st[2] = st[1]
+        stats.add(t, late)
+        if not poll_sample(clock.skip(slots)):
+            stats.errors += 1
+
+    def tick(_):
+        if st[1] == 0:
+            st[0] = time.ticks_us()
+        st[1] += 1
+        # While a sample is still queued, this slot is folded into it
+        if not st[3]:
+            try:
+                micropython.schedule(sample, None)
+                st[3] = True
+            except RuntimeError:
+                pass
+
+    tim = Timer(0)
+    tim.init(mode=Timer.PERIODIC, period=PERIOD_US // 1000, callback=tick)
+    try:
+        while True:
+            check_query(stats)
+            time.sleep_ms(50)
+    finally:
+        tim.deinit()
+
+
+def run_poll():
+    if PACING == "deadline":
+        run_deadline()
+        return
+    if PACING == "timer":
+        run_timer()
+        return
+
+    while True:
+        if not poll_sample(time.ticks_ms()):
+            time.sleep_ms(100)
+            continue
+
+        check_query()
         time.sleep_ms(20)
-        continue
+
+
+def fifo_reset():
+    w(USER_CTRL, 0x04)   # FIFO_RESET (also clears FIFO_EN)
+    w(USER_CTRL, 0x40)   # FIFO_EN
+
+
+def fifo_setup(rate_hz):
+    """Let the sensor pace accel samples into its 1 KB FIFO. Returns the actual rate."""
+    div = max(0, min(255, 1000 // rate_hz - 1))
+    w(CONFIG, 1)         # DLPF on -> 1 kHz internal sample clock
+    w(SMPLRT_DIV, div)
+    w(FIFO_EN, 0x08)     # ACCEL_FIFO_EN only: 6 bytes per sample
+    w(INT_ENABLE, 0x10)  # FIFO_OFLOW_EN, latched in INT_STATUS
+    fifo_reset()
+    return 1000 // (1 + div)
+
+
+def run_fifo():
+    try:
+        rate = fifo_setup(FIFO_RATE_HZ)
+    except Exception as e:
+        print("FIFO setup error:", e)
+        return
+    print("FIFO mode:", rate, "Hz, up to", FIFO_BURST, "samples per burst")
+
+    period_us = 1000000 // rate
+    buf = bytearray(FIFO_BURST * 6)
+    mv = memoryview(buf)
+    cnt = bytearray(2)
+    st = bytearray(1)
+    nap_ms = max(1, FIFO_BURST * 500 // rate)  # let the FIFO fill about halfway
+
+    # Sample clock: the FIFO is evenly spaced, so timestamps are derived from
+    # the sample count instead of from when the burst happened to be read.
+    now = time.ticks_ms()
+    frac_us = 0
+    last_print = now
+
+    samples = bursts = overflows = 0
+    t_report = time.ticks_ms()
+
+    while True:
+        try:
+            i2c.readfrom_mem_into(MPU_ADDR, INT_STATUS, st)
+            if st[0] & 0x10:
+                # Overflowed: the byte stream is no longer 6-byte aligned
+                overflows += 1
+                fifo_reset()
+                now = time.ticks_ms()
+                frac_us = 0
+                continue
+            i2c.readfrom_mem_into(MPU_ADDR, FIFO_COUNT_H, cnt)
+            n = ((cnt[0] << 8) | cnt[1]) // 6
+            if n > FIFO_BURST:
+                n = FIFO_BURST
+            if n:
+                i2c.readfrom_mem_into(MPU_ADDR, FIFO_R_W, mv[:n * 6])
+        except Exception as e:
+            print("I2C read error:", e)
+            time.sleep_ms(100)
+            continue
+
+        if n:
+            bursts += 1
+            samples += n
+        for i in range(0, n * 6, 6):
+            ax = lsb2g(int.from_bytes(buf[i:i+2], 'big', signed=True))
+            ay = lsb2g(int.from_bytes(buf[i+2:i+4], 'big', signed=True))
+            az = lsb2g(int.from_bytes(buf[i+4:i+6], 'big', signed=True))
+            amag = math.sqrt(ax*ax + ay*ay + az*az)
+
+            frac_us += period_us
+            now = time.ticks_add(now, frac_us // 1000)
+            frac_us %= 1000
+
+            record(buf, i, now)
+            if not tele and time.ticks_diff(now, last_print) >= 200:
+                last_print = now
+                print("ACC g:", round(ax,2), round(ay,2), round(az,2), "|a|=", round(amag,2))
+
+            detect(amag, now)
+
+        t = time.ticks_ms()
+        el = time.ticks_diff(t, t_report)
+        if el >= FIFO_REPORT_MS:
+            print("FIFO rate Hz:", samples * 1000 // el,
+                  "bursts:", bursts,
+                  "samples/burst:", samples // bursts if bursts else 0,
+                  "overflows:", overflows)
+            samples = bursts = overflows = 0
+            t_report = t
+
+        check_query()
+        # A full burst means we are falling behind: drain again right away
+        if n < FIFO_BURST:
+            time.sleep_ms(nap_ms)
+
+
+# Squared-magnitude thresholds in (LSB/4)^2: at +/-2g the largest |a|^2 is
+# 3 * 8192^2, which still fits a small int, so the fast path never boxes.
+_Q = 16384 // 4
+# [FREE^2, 0.8g^2, IMP^2, ax, ay, az, |a|^2] - the last four are written by classify()
+fast_st = array('i', [int((FREE * _Q) ** 2), int((0.8 * _Q) ** 2), int((IMP * _Q) ** 2), 0, 0, 0, 0])
+
+
+@micropython.viper
+def classify(buf: ptr8, off: int, st: ptr32) -> int:
+    """Classify one big-endian XYZ sample at buf[off:off+6] against the fast_st thresholds.
+
+    0: |a| < FREE, 1: FREE <= |a| <= 0.8 g, 2: 0.8 g < |a| < IMP, 3: |a| >= IMP
+    """
+    x = (int(buf[off]) << 8) | int(buf[off + 1])
+    if x & 0x8000:
+        x -= 0x10000
+    y = (int(buf[off + 2]) << 8) | int(buf[off + 3])
+    if y & 0x8000:
+        y -= 0x10000
+    z = (int(buf[off + 4]) << 8) | int(buf[off + 5])
+    if z & 0x8000:
+        z -= 0x10000
+    st[3] = x
+    st[4] = y
+    st[5] = z
+    x = x >> 2
+    y = y >> 2
+    z = z >> 2
+    m = x * x + y * y + z * z
+    st[6] = m
+    if m < st[0]:
+        return 0
+    if m <= st[1]:
+        return 1
+    if m < st[2]:
+        return 2
+    return 3
+
+
+@micropython.native
+def step(cls, now):
+    """detect() driven by a classify() code. Returns the event code (0: none)."""
+    global ff, ff_t0, last_event
+    if time.ticks_diff(now, last_event) < COOLDOWN:
+        return 0
 
     if not ff:
-        if amag < FREE:
+        if cls == 0:
             ff = True
             ff_t0 = now
-            print("-- free-fall start --")
+            return EV_FREE_FALL
     else:
         dt = time.ticks_diff(now, ff_t0)
-        if IMP <= amag and MIN_MS <= dt <= WIN_MS:
-            print("FALL_DETECTED")
+        if cls == 3 and MIN_MS <= dt <= WIN_MS:
             last_event = now
             ff = False
-        elif dt > WIN_MS or (amag > 0.8 and dt > MIN_MS):
+            return EV_FALL
+        elif dt > WIN_MS:
             ff = False
+            return EV_FREE_FALL_TIMEOUT
+        elif cls >= 2 and dt > MIN_MS:
+            ff = False
+    return 0
+
+
+def detect_fast(cls, now):
+    code = step(cls, now)
+    if code:
+        event(code, now, EV_TEXT[code])
+
+
+@micropython.native
+def run_fast():
+    buf = bytearray(6)
+    st = fast_st
+    last_print = 0
+
+    # Loop counters, reset every FAST_REPORT_MS. mem drift is how much the
+    # free heap shrank over the window. Reading, classify() and step() allocate
+    # nothing; the 200 ms text line, event output and the binary stream or
+    # snapshot frames (when on) do, and show up here.
+    n = 0
+    it_min = 1 << 30
+    it_max = 0
+    it_sum = 0
+    gc.collect()
+    t_report = time.ticks_ms()
+    free0 = gc.mem_free()
+
+    while True:
+        t0 = time.ticks_us()
+        try:
+            i2c.readfrom_mem_into(MPU_ADDR, 0x3B, buf)
+        except Exception as e:
+            print("I2C read error:", e)
+            time.sleep_ms(100)
+            continue
+
+        cls = classify(buf, 0, st)
+        now = time.ticks_ms()
+
+        record(buf, 0, now)
+        if not tele and time.ticks_diff(now, last_print) >= 200:
+            last_print = now
+            print("ACC lsb:", st[3], st[4], st[5], "|a|^2/16=", st[6])
+
+        detect_fast(cls, now)
+
+        el = time.ticks_diff(time.ticks_us(), t0)
+        n += 1
+        it_sum += el
+        if el < it_min:
+            it_min = el
+        if el > it_max:
+            it_max = el
+
+        if time.ticks_diff(now, t_report) >= FAST_REPORT_MS:
+            print("LOOP us min/avg/max:", it_min, it_sum // n, it_max,
+                  "iters:", n, "mem drift:", free0 - gc.mem_free())
+            n = 0
+            it_min = 1 << 30
+            it_max = 0
+            it_sum = 0
+            gc.collect()
+            t_report = time.ticks_ms()
+            free0 = gc.mem_free()
+
+        check_query()
+        time.sleep_ms(FAST_PERIOD_MS)
+
+
+# [ticks_us of the last INT rising edge, edge count], written from the hard IRQ
+irq_t = array('i', [0, 0])
+
+
+def _on_int(p):
+    irq_t[0] = time.ticks_us()
+    irq_t[1] += 1
+
+
+def wake_setup():
+    """Arm the sensor's own free-fall and motion detectors on the INT pin."""
+    w(0x1C, 0x01)                   # +/-2g, 5 Hz high-pass for motion detect only
+    w(FF_THR, WAKE_FF_MG // 2)
+    w(FF_DUR, WAKE_FF_DUR_MS)
+    w(MOT_THR, WAKE_MOT_MG // 2)
+    w(MOT_DUR, 1)
+    w(INT_PIN_CFG, 0x20)            # active high, push-pull, latched until INT_STATUS is read
+    w(INT_ENABLE, 0xC0)             # FF_EN | MOT_EN
+    r(INT_STATUS, 1)                # drop anything already pending
+
+
+def run_wake():
+    global ff, ff_t0
+    try:
+        wake_setup()
+    except Exception as e:
+        print("Wake setup error:", e)
+        return
+
+    int_pin = Pin(INT_PIN, Pin.IN)
+    int_pin.irq(trigger=Pin.IRQ_RISING, handler=_on_int, hard=True)
+    if WAKE_LIGHTSLEEP:
+        import esp32
+        esp32.wake_on_ext0(pin=int_pin, level=esp32.WAKEUP_ANY_HIGH)
+    print("Wake mode: INT on GPIO", INT_PIN, "lightsleep" if WAKE_LIGHTSLEEP else "idle")
+
+    wakes = 0
+    awake_us = 0
+    lat_min = lat_max = lat_sum = 0
+    t_report = time.ticks_ms()
+
+    while True:
+        edges = irq_t[1]
+        while not int_pin.value():
+            if WAKE_LIGHTSLEEP:
+                lightsleep()
+            else:
+                idle()
+        t_woke = time.ticks_us()
+        # Wake latency is measured from the INT edge when the IRQ saw it,
+        # otherwise from when the CPU came back out of sleep.
+        t_int = irq_t[0] if irq_t[1] != edges else t_woke
+
+        try:
+            src = r(INT_STATUS, 1)[0]   # also releases the latched INT line
+        except Exception as e:
+            print("I2C read error:", e)
+            time.sleep_ms(100)
+            continue
+
+        wakes += 1
+        now = time.ticks_ms()
+        if src & 0x80 and not ff and time.ticks_diff(now, last_event) >= COOLDOWN:
+            # The sensor already timed FF_DUR of free-fall before raising INT
+            ff = True
+            ff_t0 = time.ticks_add(now, -(time.ticks_diff(t_woke, t_int) // 1000 + WAKE_FF_DUR_MS))
+            event(EV_FREE_FALL, ff_t0, "-- free-fall start --")
+
+        first = True
+        last_motion = now
+        last_print = now
+        while True:
+            try:
+                b = r(0x3B, 6)
+            except Exception as e:
+                print("I2C read error:", e)
+                time.sleep_ms(100)
+                continue
+
+            ax = lsb2g(int.from_bytes(b[0:2], 'big', signed=True))
+            ay = lsb2g(int.from_bytes(b[2:4], 'big', signed=True))
+            az = lsb2g(int.from_bytes(b[4:6], 'big', signed=True))
+            amag = math.sqrt(ax*ax + ay*ay + az*az)
+
+            now = time.ticks_ms()
+            if first:
+                first = False
+                lat = time.ticks_diff(time.ticks_us(), t_int)
+                lat_sum += lat
+                if wakes == 1 or lat < lat_min:
+                    lat_min = lat
+                if lat > lat_max:
+                    lat_max = lat
+
+            record(b, 0, now)
+            if not tele and time.ticks_diff(now, last_print) >= 200:
+                last_print = now
+                print("ACC g:", round(ax,2), round(ay,2), round(az,2), "|a|=", round(amag,2))
+
+            detect(amag, now)
+
+            if ff or amag < 0.8 or amag > 1.2:
+                last_motion = now
+            elif time.ticks_diff(now, last_motion) >= WAKE_HOLD_MS:
+                break
+
+            check_query()
+            time.sleep_ms(WAKE_PERIOD_MS)
+
+        awake_us += time.ticks_diff(time.ticks_us(), t_woke)
+        try:
+            r(INT_STATUS, 1)            # motion latched while awake must not re-wake us
+        except Exception:
+            pass
+
+        el = time.ticks_diff(now, t_report)
+        if el >= WAKE_REPORT_MS:
+            print("WAKE wakes:", wakes,
+                  "duty %:", awake_us // (el * 10),
+                  "latency us min/avg/max:", lat_min, lat_sum // wakes, lat_max)
+            wakes = 0
+            awake_us = 0
+            lat_min = lat_max = lat_sum = 0
+            t_report = now
+
+
+# Two-thread mode. The sampler thread owns the I2C bus and the detector and
+# only ever writes th_raw/th_t/th_code[head] and th[0]; the reporter (main
+# thread) only reads the slot at th[1] and advances it. A print() blocked on
+# the UART releases the GIL, so the sampler keeps its grid; when the ring is
+# full the sample is dropped and counted instead of waited for.
+TH_MASK = THREAD_RING - 1
+th_raw = bytearray(6 * THREAD_RING)
+th_t = array('i', bytes(4 * THREAD_RING))
+th_code = bytearray(THREAD_RING)
+# [head, tail, overruns, i2c errors, missed slots, max backlog]
+th = array('i', [0, 0, 0, 0, 0, 0])
+# Event whose sample was dropped: [code, t_ms, slot it goes before]
+th_pend = array('i', [0, 0, 0])
+
+
+def sampler():
+    slots = [memoryview(th_raw)[6 * k:6 * k + 6] for k in range(THREAD_RING)]
+    st = fast_st
+    clock = GridClock(PERIOD_US)
+    nxt = time.ticks_add(time.ticks_us(), PERIOD_US)
+
+    while True:
+        d = time.ticks_diff(nxt, time.ticks_us())
+        if d > 1500:
+            time.sleep_ms((d - 1000) // 1000)
+        while time.ticks_diff(nxt, time.ticks_us()) > 0:
+            pass
+
+        late = time.ticks_diff(time.ticks_us(), nxt)
+        n = 1
+        if late >= PERIOD_US:
+            n += late // PERIOD_US
+            th[4] += n - 1
+            nxt = time.ticks_add(nxt, (n - 1) * PERIOD_US)
+        nxt = time.ticks_add(nxt, PERIOD_US)
+        now = clock.skip(n)
+
+        # The head slot is never visible to the reporter, so read straight into it
+        h = th[0]
+        try:
+            i2c.readfrom_mem_into(MPU_ADDR, 0x3B, slots[h])
+        except OSError:
+            th[3] += 1
+            continue
+        code = step(classify(th_raw, 6 * h, st), now)
+
+        nh = (h + 1) & TH_MASK
+        if nh == th[1]:
+            th[2] += 1
+            # Keep the event; FALL_DETECTED wins over any other unsent one
+            if code and (code == EV_FALL or th_pend[0] != EV_FALL):
+                th_pend[1] = now
+                th_pend[2] = h
+                th_pend[0] = code
+            continue
+        th_t[h] = now
+        th_code[h] = code
+        th[0] = nh
+        backlog = (nh - th[1]) & TH_MASK
+        if backlog > th[5]:
+            th[5] = backlog
+
+
+def run_thread():
+    import _thread
+    print("Thread mode:", 1000000 // PERIOD_US, "Hz sampler,", THREAD_RING, "slot ring")
+    _thread.start_new_thread(sampler, ())
+
+    last_print = 0
+    samples = 0
+    # The sampler owns the counters; report what changed since last time
+    seen = array('i', [0, 0, 0])
+    t_report = time.ticks_ms()
+
+    while True:
+        while True:
+            t = th[1]
+            if th_pend[0] and th_pend[2] == t:
+                event(th_pend[0], th_pend[1], EV_TEXT[th_pend[0]])
+                th_pend[0] = 0
+            if t == th[0]:
+                break
+            now = th_t[t]
+            record(th_raw, 6 * t, now)
+            if not tele and time.ticks_diff(now, last_print) >= 200:
+                last_print = now
+                o = 6 * t
+                ax = lsb2g(int.from_bytes(th_raw[o:o+2], 'big', signed=True))
+                ay = lsb2g(int.from_bytes(th_raw[o+2:o+4], 'big', signed=True))
+                az = lsb2g(int.from_bytes(th_raw[o+4:o+6], 'big', signed=True))
+                amag = math.sqrt(ax*ax + ay*ay + az*az)
+                print("ACC g:", round(ax,2), round(ay,2), round(az,2), "|a|=", round(amag,2))
+            if th_code[t]:
+                event(th_code[t], now, EV_TEXT[th_code[t]])
+            th[1] = (t + 1) & TH_MASK
+            samples += 1
+
+        t = time.ticks_ms()
+        el = time.ticks_diff(t, t_report)
+        if el >= THREAD_REPORT_MS:
+            over, errs, missed = th[2], th[3], th[4]
+            print("THREAD rate Hz:", samples * 1000 // el,
+                  "overruns:", over - seen[0], "missed slots:", missed - seen[2],
+                  "i2c errors:", errs - seen[1], "max backlog:", th[5])
+            seen[0] = over
+            seen[1] = errs
+            seen[2] = missed
+            samples = 0
+            th[5] = 0
+            t_report = t
+
+        check_query()
+        time.sleep_ms(THREAD_DRAIN_MS)
+
 
-    time.sleep_ms(20) 
+if MODE == "fifo":
+    run_fifo()
+elif MODE == "fast":
+    run_fast()
+elif MODE == "wake":
+    run_wake()
+elif MODE == "thread":
+    run_thread()
+else:
+    run_poll()
@@ -4,30 +4,24 @@ ESP32-CAM Upload & Boot Monitor
 Specially designed for ESP32-CAM with MB Base Board
 """
 
+import argparse
 import serial
 import time
-import re
+
+from log_rules import HIGHLIGHT, RULES, pick
+from serial_mux import open_serial
+from serial_reader import LineReader
 
 PORT = '/dev/cu.usbserial-230'
 BAUD = 115200
 
-def highlight_important(text):
-    """Highlight important messages"""
-    # WiFi and IP patterns
-    if re.search(r'\d+\.\d+\.\d+\.\d+', text):
-        return f"🌐 >>> {text} <<<"
-    elif "WiFi connected" in text:
-        return f"✅ {text}"
-    elif "Camera Ready" in text or "Camera init" in text:
-        return f"📷 {text}"
-    elif "error" in text.lower() or "fail" in text.lower():
-        return f"❌ {text}"
-    elif "Connecting" in text or "." == text.strip():
-        return f"⏳ {text}"
-    elif "ESP32-CAM" in text:
-        return f"🎯 {text}"
-    else:
-        return text
+parser = argparse.ArgumentParser(description='ESP32-CAM upload & boot monitor')
+parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
+args = parser.parse_args()
+
+def highlight_important(text, tags):
+    """Highlight important messages (tags from log_rules.RULES.classify)"""
+    return (pick(tags, HIGHLIGHT) or '{}').format(text)
 
 print("=" * 60)
 print("📷 ESP32-CAM Monitor (with MB Base Board)")
@@ -44,7 +38,7 @@ print("4. Press Ctrl+C to exit\n")
 print("-" * 60)
 
 try:
-    ser = serial.Serial(PORT, BAUD, timeout=0.1)
+    ser = open_serial(PORT, BAUD, mux=args.mux, timeout=0.1)
     print("✅ Connected to ESP32-CAM\n")
     print("Waiting for data... (Press RESET on ESP32-CAM if needed)\n")
     
@@ -54,52 +48,49 @@ try:
     wifi_connected = False
     camera_ready = False
     
+    reader = LineReader(ser)
     while True:
-        if ser.in_waiting:
-            try:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    # Display with highlighting
-                    print(highlight_important(line))
-                    
-                    # Extract IP address
-                    ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', line)
-                    if ip_match and "192.168" in ip_match.group(1):
-                        ip_address = ip_match.group(1)
-                        wifi_connected = True
-                    
-                    # Check for camera ready
-                    if "Camera Ready" in line:
-                        camera_ready = True
-                    
-                    # Show summary when ready
-                    if camera_ready and ip_address:
-                        print("\n" + "=" * 60)
-                        print("🎉 ESP32-CAM READY!")
-                        print("=" * 60)
-                        print(f"📱 Camera Stream URL: http://{ip_address}")
-                        print(f"🎮 Control Panel: http://{ip_address}")
-                        print("\nFeatures available at the web interface:")
-                        print("  • Live video stream")
-                        print("  • Capture photos")
-                        print("  • Change resolution")
-                        print("  • Adjust camera settings")
-                        print("  • Face detection (if enabled)")
-                        print("=" * 60)
-                        print("\n(Monitor continues... Press Ctrl+C to exit)")
-                        camera_ready = False  # Reset to avoid repeating
-                        
-            except Exception as e:
-                if "utf-8" not in str(e).lower():
-                    print(f"Error: {e}")
-        
-        time.sleep(0.01)
+        for line in reader.read_lines():
+            line = line.strip()
+            if not line:
+                continue
+            # One pass over the line for highlighting, IP and camera state
+            hit = RULES.classify(line)
+            print(highlight_important(line, hit.tags))
+            
+            # Extract IP address
+            ip = hit.fields.get('ip')
+            if ip and "192.168" in ip:
+                ip_address = ip
+                wifi_connected = True
+            
+            # Check for camera ready
+            if 'camera_ready' in hit.tags:
+                camera_ready = True
+            
+            # Show summary when ready
+            if camera_ready and ip_address:
+                print("\n" + "=" * 60)
+                print("🎉 ESP32-CAM READY!")
+                print("=" * 60)
+                print(f"📱 Camera Stream URL: http://{ip_address}")
+                print(f"🎮 Control Panel: http://{ip_address}")
+                print("\nFeatures available at the web interface:")
+                print("  • Live video stream")
+                print("  • Capture photos")
+                print("  • Change resolution")
+                print("  • Adjust camera settings")
+                print("  • Face detection (if enabled)")
+                print("=" * 60)
+                print("\n(Monitor continues... Press Ctrl+C to exit)")
+                camera_ready = False  # Reset to avoid repeating
         
-except serial.SerialException as e:
+except (serial.SerialException, OSError) as e:
     print(f"\n❌ Serial Error: {e}")
     if "Resource busy" in str(e):
         print("\n💡 Port is busy. Close Arduino Serial Monitor first!")
         print("   Or run: pkill -f 'serial|screen'")
+        print("   Or share it: python3 serial_mux.py", PORT, "and rerun with --mux")
         
 except KeyboardInterrupt:
     print("\n\n✅ Monitor stopped")
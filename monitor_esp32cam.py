@@ -9,6 +9,11 @@ import serial.tools.list_ports
 import time
 import sys
 
+from log_rules import NOTES, RULES, pick
+from port_discovery import is_esp32_port
+from serial_mux import open_serial
+from serial_reader import LineReader
+
 def find_esp32_port():
     """Find ESP32-CAM port automatically"""
     ports = serial.tools.list_ports.comports()
@@ -19,11 +24,7 @@ def find_esp32_port():
     esp_ports = []
     for port in ports:
         print(f"Found: {port.device} - {port.description}")
-        # Common ESP32-CAM USB-to-Serial chips
-        if any(x in port.description.lower() for x in ['cp210', 'ch340', 'uart', 'serial', 'usb']):
-            esp_ports.append(port.device)
-        # Also check device names
-        elif 'usbserial' in port.device.lower() or 'slab' in port.device.lower():
+        if is_esp32_port(port):
             esp_ports.append(port.device)
     
     print("-" * 40)
@@ -39,7 +40,7 @@ def find_esp32_port():
         print(f"✅ Found ESP32-CAM on: {esp_ports[0]}")
         return esp_ports[0]
     else:
-        print("Multiple serial devices found:")
+        print("Multiple serial devices found (multi_monitor.py watches them all):")
         for i, port in enumerate(esp_ports, 1):
             print(f"  {i}. {port}")
         
@@ -57,8 +58,8 @@ def find_esp32_port():
         print("Invalid selection, using first port")
         return esp_ports[0]
 
-def monitor_esp32(port=None, baud_rate=115200):
-    """Monitor ESP32-CAM serial output"""
+def monitor_esp32(port=None, baud_rate=115200, mux=False):
+    """Monitor ESP32-CAM serial output (through serial_mux.py if mux)"""
     
     if port is None:
         port = find_esp32_port()
@@ -71,9 +72,10 @@ def monitor_esp32(port=None, baud_rate=115200):
     
     try:
         # Open serial connection
-        ser = serial.Serial(
+        ser = open_serial(
             port=port,
             baudrate=baud_rate,
+            mux=mux,
             timeout=0.1,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
@@ -86,54 +88,35 @@ def monitor_esp32(port=None, baud_rate=115200):
         print("✅ Connected! Waiting for data...\n")
         print("💡 TIP: Press RESET button on ESP32-CAM to see boot messages\n")
         
-        empty_reads = 0
+        # Blocks on the port until data arrives; undecodable bytes show as <xx>
+        reader = LineReader(ser)
         while True:
-            if ser.in_waiting:
-                empty_reads = 0
-                try:
-                    # Read and decode line
-                    line = ser.readline()
-                    
-                    # Try different decodings
-                    try:
-                        text = line.decode('utf-8').rstrip()
-                    except UnicodeDecodeError:
-                        try:
-                            text = line.decode('ascii', errors='ignore').rstrip()
-                        except:
-                            # Show as hex if can't decode
-                            text = f"[HEX] {line.hex()}"
-                    
-                    if text:
-                        # Add timestamp for each line
-                        timestamp = time.strftime('%H:%M:%S')
-                        print(f"[{timestamp}] {text}")
-                        
-                        # Check for common ESP32-CAM messages
-                        if "Camera" in text or "cam" in text.lower():
-                            print("    📷 Camera-related message detected")
-                        elif "IP" in text or "192.168" in text or "10.0" in text:
-                            print("    🌐 Network information detected")
-                        elif "error" in text.lower() or "fail" in text.lower():
-                            print("    ⚠️  Error message detected")
-                
-                except Exception as e:
-                    print(f"Error reading line: {e}")
-            else:
-                empty_reads += 1
-                if empty_reads == 50:  # After 5 seconds of no data
-                    print("💤 No data received. Try:")
-                    print("   - Press RESET button on ESP32-CAM")
-                    print("   - Check if ESP32-CAM has code uploaded")
-                    print("   - Verify baud rate (typically 115200)")
-                    empty_reads = 0
+            lines = reader.read_lines(timeout=5.0)
+            if not lines:
+                print("💤 No data received. Try:")
+                print("   - Press RESET button on ESP32-CAM")
+                print("   - Check if ESP32-CAM has code uploaded")
+                print("   - Verify baud rate (typically 115200)")
+                continue
+
+            # One timestamp per burst: these lines arrived together
+            timestamp = time.strftime('%H:%M:%S')
+            for text in lines:
+                text = text.rstrip()
+                if not text:
+                    continue
+                print(f"[{timestamp}] {text}")
                 
-                time.sleep(0.1)
+                # Check for common ESP32-CAM messages
+                note = pick(RULES.classify(text).tags, NOTES)
+                if note:
+                    print(note)
     
-    except serial.SerialException as e:
+    except (serial.SerialException, OSError) as e:
         print(f"\n❌ Serial Error: {e}")
         print("\nTroubleshooting:")
         print("1. Check if another program is using the port")
+        print("   (to share it, run serial_mux.py and add --mux here)")
         print("2. Try: sudo chmod 666", port)
         print("3. Disconnect and reconnect ESP32-CAM")
         
@@ -167,9 +150,10 @@ def main():
     parser = argparse.ArgumentParser(description='Monitor ESP32-CAM serial output')
     parser.add_argument('-p', '--port', help='Serial port (e.g., /dev/cu.usbserial-0001)')
     parser.add_argument('-b', '--baud', type=int, default=115200, help='Baud rate (default: 115200)')
+    parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
     args = parser.parse_args()
     
-    monitor_esp32(args.port, args.baud)
+    monitor_esp32(args.port, args.baud, args.mux)
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Watch every ESP32 board on this host at once.
+
+monitor_esp32cam.py asks which port to use when there are several, and the
+other tools follow one board each. This one attaches to every port that
+looks like an ESP32 (port_discovery: known bridge VID/PID, else the CP210x /
+CH340 / usbserial name test), picks up boards as they are plugged in
+(port_discovery.PortWatcher) and prints all of them as one stream:
+
+    14:02:11.204 [cam-0001    ] Camera Ready! Use 'http://192.168.1.20' to connect
+    14:02:11.219 [wear-A94F   ] FALL_DETECTED (device 51022 ms)
+
+Each record is stamped with its receive time and tagged with a device ID:
+the USB serial number when the bridge has one (it survives replugging into
+another port), otherwise the port name. Text lines and the fall detector's
+binary frames are both understood (telemetry.StreamDecoder); binary samples
+are counted, events are printed.
+
+Everything runs in one asyncio loop. Ports are opened non-blocking in a
+worker thread of their own, so an open that hangs only holds up that device
+(it is waited for again, not resubmitted), and each port's fd is registered
+with the loop (add_reader). An idle device costs nothing until bytes arrive,
+and a device that stops sending cannot block the others. Records go into one
+queue in the order the loop read them, which is the order of their
+timestamps, so the merged output is time-ordered. If a port disappears it is
+retried every REOPEN_S, and the reconnect is counted.
+
+Per-device counters (lines/s, samples/s, bytes, errors, reconnects) are
+printed every --stats seconds and on exit.
+
+    python3 multi_monitor.py                      all ESP32-looking ports
+    python3 multi_monitor.py -p /dev/cu.usbserial-0001 -p /dev/cu.usbserial-230
+    python3 multi_monitor.py --mux                through serial_mux.py
+    python3 multi_monitor.py --json               one JSON object per record
+    python3 multi_monitor.py --demo               ptys: busy, idle, unplugged
+
+Requires: pip install pyserial numpy
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import StreamDecoder
+
+BAUD = 115200
+READ_SIZE = 65536
+REOPEN_S = 1.0          # retry a lost or busy port this often
+OPEN_TIMEOUT_S = 5.0    # give up on an open() that hangs and try again later
+MERGE_QUEUE = 10000     # records waiting to be printed; beyond this they are dropped
+
+
+def _close_opened(fut):
+    """Done callback for an open() nobody is waiting for any more."""
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
+
+
+class Device:
+    """One board: keeps its port open and turns its bytes into records."""
+
+    def __init__(self, dev_id, port, baud, emit, mux=False):
+        self.id = dev_id
+        self.port = port
+        self.baud = baud
+        self.emit = emit                # f(device, t, kind, text)
+        self.mux = mux
+        self.ser = None
+        self.pool = ThreadPoolExecutor(1)       # this device's opens only
+        self.opening = None             # concurrent Future of an open() still running
+        self.dec = StreamDecoder()
+        self.lines = self.samples = self.events = self.bytes = 0
+        self.read_errors = self.open_errors = self.reconnects = 0
+        self.opened = 0                 # successful opens; every one after the first is a reconnect
+        self.seen = (0, 0, time.monotonic())   # lines, samples at the last stats()
+
+    @property
+    def errors(self):
+        return self.dec.crc_errors + self.dec.dropped_frames + self.read_errors
+
+    def _open(self):
+        from serial_mux import open_serial
+
+        return open_serial(self.port, self.baud, mux=self.mux, timeout=0)
+
+    async def run(self):
+        try:
+            await self._run()
+        finally:
+            # An open still hanging when we are cancelled closes whatever it opens
+            if self.opening is not None:
+                self.opening.add_done_callback(_close_opened)
+            self.pool.shutdown(wait=False)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.opening is None:
+                self.opening = self.pool.submit(self._open)
+            try:
+                # shield: after a timeout the open keeps running and the next
+                # attempt waits for the same one
+                self.ser = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.opening)),
+                                                  OPEN_TIMEOUT_S)
+                self.opening = None
+            except Exception as e:      # SerialException, ConnectionError, timeout
+                if self.opening.done():
+                    self.opening = None
+                if self.open_errors == 0:
+                    print(f'{self.id}: {self.port}: {str(e) or type(e).__name__}; retrying', file=sys.stderr)
+                self.open_errors += 1
+                await asyncio.sleep(REOPEN_S)
+                continue
+            self.opened += 1
+            if self.opened > 1:
+                self.reconnects += 1
+                print(f'{self.id}: reconnected on {self.port}', file=sys.stderr)
+            self.open_errors = 0
+            closed = loop.create_future()
+            fd = self.ser.fileno()
+            loop.add_reader(fd, self.readable, fd, closed)
+            try:
+                await closed
+            finally:
+                loop.remove_reader(fd)
+                self.ser.close()
+                self.ser = None
+            print(f'{self.id}: {self.port} lost', file=sys.stderr)
+            await asyncio.sleep(REOPEN_S)
+
+    def readable(self, fd, closed):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.read_errors += 1
+            data = b''
+        if not data:
+            # Readable with nothing to read: unplugged, or the mux daemon went away
+            if not closed.done():
+                closed.set_result(None)
+            return
+        t = time.time()
+        self.bytes += len(data)
+        dec = self.dec
+        dec.feed(data)
+        for line in dec.take_text():
+            self.lines += 1
+            self.emit(self, t, 'line', line)
+        for t_ms, name in dec.take_events():
+            self.events += 1
+            self.emit(self, t, 'event', f'{name} (device {t_ms:.0f} ms)')
+        for snap in dec.take_snapshots():
+            self.emit(self, t, 'event', f'snapshot of {len(snap.t_ms)} samples')
+        t_s, _ = dec.take_samples()
+        self.samples += len(t_s)
+
+    def stats(self):
+        """Counters, with rates since the previous call."""
+        now = time.monotonic()
+        lines0, samples0, t0 = self.seen
+        dt = max(now - t0, 1e-9)
+        self.seen = (self.lines, self.samples, now)
+        return {'id': self.id, 'port': self.port, 'open': self.ser is not None,
+                'lines_s': round((self.lines - lines0) / dt, 1),
+                'samples_s': round((self.samples - samples0) / dt, 1),
+                'lines': self.lines, 'events': self.events, 'bytes': self.bytes,
+                'errors': self.errors, 'reconnects': self.reconnects}
+
+
+def device_id(info):
+    """Stable name for a discovered port: USB serial number, else the port name."""
+    if getattr(info, 'serial_number', None):
+        return info.serial_number
+    return os.path.basename(info.device)
+
+
+class MultiMonitor:
+    def __init__(self, baud=BAUD, mux=False, as_json=False):
+        self.baud = baud
+        self.mux = mux
+        self.as_json = as_json
+        self.devices = {}               # id -> Device
+        self.tasks = []
+        self.queue = asyncio.Queue(MERGE_QUEUE)
+        self.dropped = 0
+
+    def emit(self, dev, t, kind, text):
+        try:
+            self.queue.put_nowait((t, dev.id, kind, text))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def add(self, dev_id, port):
+        dev = self.devices.get(dev_id)
+        if dev is not None:
+            # Same board on a new port (replugged): move it there
+            if dev.port != port and dev.ser is None:
+                dev.port = port
+            return
+        dev = self.devices[dev_id] = Device(dev_id, port, self.baud, self.emit, self.mux)
+        print(f'{dev_id}: watching {port}', file=sys.stderr)
+        self.tasks.append(asyncio.ensure_future(dev.run()))
+
+    async def discover(self):
+        from port_discovery import PortWatcher
+
+        loop = asyncio.get_running_loop()
+        found = lambda p: loop.call_soon_threadsafe(self.add, device_id(p), p.device)
+        watcher = PortWatcher(on_add=found)
+        await loop.run_in_executor(None, watcher.start)
+        for p in watcher.ports.values():
+            self.add(device_id(p), p.device)
+        try:
+            await loop.create_future()      # until cancelled
+        finally:
+            watcher.stop()
+
+    async def printer(self):
+        out = sys.stdout
+        width = 12
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            lines = []
+            for t, dev_id, kind, text in batch:
+                if self.as_json:
+                    lines.append(json.dumps({'t': round(t, 3), 'device': dev_id, 'kind': kind,
+                                             'text': text}))
+                else:
+                    width = max(width, len(dev_id))
+                    stamp = time.strftime('%H:%M:%S', time.localtime(t)) + f'.{int(t * 1000) % 1000:03d}'
+                    lines.append(f'{stamp} [{dev_id:<{width}}] {text}')
+            out.write('\n'.join(lines) + '\n')
+            out.flush()
+
+    def print_stats(self):
+        print(f'{"device":16} {"port":24} {"open":>4} {"lines/s":>8} {"samp/s":>7} {"lines":>8} '
+              f'{"events":>6} {"bytes":>10} {"errors":>6} {"reconn":>6}', file=sys.stderr)
+        for dev in self.devices.values():
+            s = dev.stats()
+            print(f'{s["id"]:16} {s["port"]:24} {"yes" if s["open"] else "no":>4} {s["lines_s"]:>8} '
+                  f'{s["samples_s"]:>7} {s["lines"]:>8} {s["events"]:>6} {s["bytes"]:>10} '
+                  f'{s["errors"]:>6} {s["reconnects"]:>6}', file=sys.stderr)
+        if self.dropped:
+            print(f'{self.dropped} records dropped (output too slow)', file=sys.stderr)
+
+    async def run(self, ports=(), stats_s=30.0, duration=None):
+        printer = asyncio.ensure_future(self.printer())
+        for port in ports:
+            self.add(os.path.basename(port), port)
+        if not ports:
+            self.tasks.append(asyncio.ensure_future(self.discover()))
+        t_end = None if duration is None else time.monotonic() + duration
+        try:
+            while t_end is None or time.monotonic() < t_end:
+                wait = stats_s if t_end is None else min(stats_s, t_end - time.monotonic())
+                await asyncio.sleep(max(0.0, wait))
+                if t_end is None or time.monotonic() < t_end:
+                    self.print_stats()
+        finally:
+            while not self.queue.empty():
+                await asyncio.sleep(0.01)
+            printer.cancel()
+            self.print_stats()
+            for task in self.tasks:
+                task.cancel()
+
+
+def demo(seconds=10.0):
+    """Four ptys: two busy boards, one silent, one unplugged and replugged midway."""
+    import pty
+    import threading
+    import tty
+
+    def board(master, rate, name, stop):
+        n = 0
+        while not stop.is_set():
+            n += 1
+            try:
+                os.write(master, f'{name} line {n}\n'.encode())
+            except OSError:
+                return
+            stop.wait(1.0 / rate)
+
+    ptys = []
+    for _ in range(4):
+        m, s = pty.openpty()
+        tty.setraw(s)
+        ptys.append((m, s))
+    names = [os.ttyname(s) for _, s in ptys]
+    stop = threading.Event()
+    threads = [threading.Thread(target=board, args=(ptys[0][0], 100, 'busy-A', stop), daemon=True),
+               threading.Thread(target=board, args=(ptys[1][0], 20, 'busy-B', stop), daemon=True),
+               threading.Thread(target=board, args=(ptys[3][0], 5, 'flaky', stop), daemon=True)]
+    for th in threads:
+        th.start()
+
+    async def unplug():
+        # Close the pty master: the reader sees EOF/EIO like a pulled USB cable
+        await asyncio.sleep(seconds / 3)
+        os.close(ptys[3][0])
+        await asyncio.sleep(seconds / 6)
+        ptys[3] = pty.openpty()
+        tty.setraw(ptys[3][1])
+        mon.devices[os.path.basename(names[3])].port = os.ttyname(ptys[3][1])
+        threading.Thread(target=board, args=(ptys[3][0], 5, 'flaky', stop), daemon=True).start()
+
+    async def main():
+        asyncio.ensure_future(unplug())
+        cpu0 = time.process_time()
+        await mon.run(names, stats_s=seconds / 2, duration=seconds)
+        return time.process_time() - cpu0
+
+    mon = MultiMonitor()
+    sys.stdout = open(os.devnull, 'w')
+    cpu = asyncio.run(main())
+    sys.stdout = sys.__stdout__
+    stop.set()
+    print(f'\nCPU {100 * cpu / seconds:.1f} % of one core for {sum(d.lines for d in mon.devices.values())} '
+          f'lines in {seconds:g} s', file=sys.stderr)
+
+    # Idle cost: only silent ports open, nothing arriving
+    mon = MultiMonitor()
+    idle = []
+    for _ in range(8):
+        m, s = pty.openpty()
+        tty.setraw(s)
+        idle.append((m, s))
+
+    async def idle_main():
+        cpu0 = time.process_time()
+        await mon.run([os.ttyname(s) for _, s in idle], stats_s=seconds, duration=seconds / 2)
+        return time.process_time() - cpu0
+
+    stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+    cpu = asyncio.run(idle_main())
+    sys.stderr = stderr
+    print(f'8 idle ports: CPU {100 * cpu / (seconds / 2):.2f} % of one core', file=sys.stderr)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Monitor every ESP32 on this host at once')
+    parser.add_argument('-p', '--port', action='append', default=[],
+                        help='Port to watch (repeatable; default: discover ESP32-looking ports)')
+    parser.add_argument('-b', '--baud', type=int, default=BAUD, help=f'Baud rate (default: {BAUD})')
+    parser.add_argument('--mux', action='store_true', help='Attach through serial_mux.py instead of the ports')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per record')
+    parser.add_argument('--stats', type=float, default=30.0, help='Seconds between counter tables (default: 30)')
+    parser.add_argument('--demo', action='store_true', help='Run against local ptys and report CPU use')
+    args = parser.parse_args()
+
+    if args.demo:
+        demo()
+        return
+    mon = MultiMonitor(args.baud, args.mux, args.json)
+    try:
+        asyncio.run(mon.run(args.port, args.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Serial port discovery without subprocesses.
+
+On Linux the port list comes straight from sysfs: every /sys/class/tty/<name>
+with a `device` link is hardware, and walking up from that device to the
+first directory with idVendor gives the USB bridge's VID/PID, serial number,
+manufacturer and product. Nothing is spawned (system_profiler, ls) and
+nothing is parsed. Startup target: the full list in under 10 ms, under 2 ms
+from the cache when nothing changed, on a host with a few hundred tty
+entries (--selftest checks both). Results are cached per port and keyed by
+the USB device node, so a replugged board is read again and everything else
+is not. Elsewhere (macOS) it falls back to pyserial's list_ports, which
+talks to IOKit directly.
+
+Ports are pyserial-style records (device, name, description, vid, pid,
+serial_number, manufacturer, product, location, chip), so
+is_esp32_port() works on them and on pyserial's comports() entries alike.
+
+PortWatcher calls back on add / remove / reconnect (a board seen before
+coming back, possibly under another name). It waits on inotify for /dev, or
+on kernel uevents over netlink when inotify is unavailable, or polls every
+POLL_S as a last resort. The callbacks run on the watcher's thread.
+
+    for p in list_ports(esp32_only=True):
+        print(p.device, p.chip, p.serial_number)
+
+    w = PortWatcher(on_reconnect=lambda p: print('back on', p.device))
+    w.start()
+
+    python3 port_discovery.py              list ports (and how long it took)
+    python3 port_discovery.py --watch      print hotplug events
+    python3 port_discovery.py --selftest   fake sysfs tree: scan, cache, hotplug, timing
+"""
+
+import ctypes
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+SYS_ROOT = '/sys'
+DEV_ROOT = '/dev'
+POLL_S = 1.0            # polling fallback interval
+SETTLE_S = 0.05         # collect a burst of hotplug events before rescanning
+STARTUP_TARGET_MS = 10  # cold list_ports() budget, checked by --selftest
+
+# USB-to-serial bridges (and native USB) found on ESP32 boards
+BRIDGES = {
+    (0x10C4, 0xEA60): 'CP210x',
+    (0x1A86, 0x7523): 'CH340',
+    (0x1A86, 0x55D4): 'CH9102',
+    (0x0403, 0x6001): 'FT232R',
+    (0x0403, 0x6010): 'FT2232',
+    (0x303A, 0x1001): 'ESP32-S3/C3 USB',
+    (0x303A, 0x0002): 'ESP32-S2 USB',
+}
+
+Port = namedtuple('Port', 'device name description vid pid serial_number manufacturer '
+                          'product location chip')
+
+_cache = {}             # tty name -> (key, Port)
+_virtual = set()        # tty names under devices/virtual (vt, console, ptmx): never hardware
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _usb_dir(dev, sys_root):
+    """First directory at or above dev with idVendor (the USB device), or None."""
+    stop = os.path.join(sys_root, 'devices')
+    d = dev
+    for _ in range(6):
+        if os.path.exists(os.path.join(d, 'idVendor')):
+            return d
+        if d == stop or len(d) <= len(stop):
+            return None
+        d = os.path.dirname(d)
+    return None
+
+
+def _port(name, dev, usb, sys_root, dev_root):
+    vid = pid = serial = manufacturer = product = location = None
+    if usb:
+        vid = int(_read(os.path.join(usb, 'idVendor')) or '0', 16)
+        pid = int(_read(os.path.join(usb, 'idProduct')) or '0', 16)
+        serial = _read(os.path.join(usb, 'serial'))
+        manufacturer = _read(os.path.join(usb, 'manufacturer'))
+        product = _read(os.path.join(usb, 'product'))
+        iface = os.path.basename(dev if ':' in os.path.basename(dev) else os.path.dirname(dev))
+        location = iface if ':' in iface else os.path.basename(usb)
+    chip = BRIDGES.get((vid, pid)) if usb else None
+    description = product or (f'{chip} USB serial' if chip else None) or \
+        (f'USB serial {vid:04x}:{pid:04x}' if usb else name)
+    return Port(os.path.join(dev_root, name), name, description, vid, pid, serial,
+                manufacturer, product, location, chip)
+
+
+def scan(sys_root=SYS_ROOT, dev_root=DEV_ROOT):
+    """Hardware serial ports from sysfs, using the per-port cache."""
+    class_dir = os.path.join(sys_root, 'class', 'tty')
+    ports = []
+    seen = set()
+    for entry in os.scandir(class_dir):
+        if entry.name in _virtual:
+            continue
+        try:
+            if '/virtual/' in os.readlink(entry.path):
+                _virtual.add(entry.name)
+                continue
+        except OSError:
+            pass
+        link = os.path.join(entry.path, 'device')
+        try:
+            os.readlink(link)
+        except OSError:
+            continue            # virtual tty (console, pty, vt): no device link
+        dev = os.path.realpath(link)
+        usb = _usb_dir(dev, sys_root)
+        try:
+            key = (dev, os.stat(usb).st_ino if usb else None)
+        except OSError:
+            continue            # unplugged while scanning
+        if not os.path.exists(os.path.join(dev_root, entry.name)):
+            continue            # sysfs is there, /dev node not yet
+        seen.add(entry.name)
+        hit = _cache.get(entry.name)
+        if hit is None or hit[0] != key:
+            hit = _cache[entry.name] = (key, _port(entry.name, dev, usb, sys_root, dev_root))
+        ports.append(hit[1])
+    for name in set(_cache) - seen:
+        del _cache[name]
+    ports.sort(key=lambda p: p.name)
+    return ports
+
+
+def _pyserial_ports():
+    from serial.tools import list_ports
+
+    out = []
+    for p in list_ports.comports():
+        chip = BRIDGES.get((p.vid, p.pid))
+        out.append(Port(p.device, p.name, p.description, p.vid, p.pid, p.serial_number,
+                        p.manufacturer, p.product, p.location, chip))
+    return out
+
+
+def is_esp32_port(port):
+    """True for the USB-to-serial bridges ESP32 boards use, by name/description"""
+    # Common ESP32-CAM USB-to-Serial chips
+    if any(x in port.description.lower() for x in ['cp210', 'ch340', 'uart', 'serial', 'usb']):
+        return True
+    # Also check device names
+    return 'usbserial' in port.device.lower() or 'slab' in port.device.lower()
+
+
+def is_esp32(port):
+    """Known bridge by VID/PID, else a USB port that passes is_esp32_port()."""
+    if port.chip:
+        return True
+    return port.vid is not None and is_esp32_port(port)
+
+
+def list_ports(esp32_only=False, sys_root=SYS_ROOT, dev_root=DEV_ROOT):
+    """Serial ports on this host (sysfs on Linux, pyserial elsewhere)."""
+    if os.path.isdir(os.path.join(sys_root, 'class', 'tty')):
+        ports = scan(sys_root, dev_root)
+    else:
+        ports = _pyserial_ports()
+    return [p for p in ports if is_esp32(p)] if esp32_only else ports
+
+
+def identity(port):
+    """What stays the same across a replug: the USB serial number, else VID/PID + location."""
+    return port.serial_number or (port.vid, port.pid, port.location)
+
+
+# ---------------------------------------------------------------------------
+# Hotplug
+
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_EVENTS = 0x100 | 0x200 | 0x4 | 0x40 | 0x80   # CREATE, DELETE, ATTRIB, MOVED_FROM, MOVED_TO
+_NETLINK_KOBJECT_UEVENT = 15
+
+
+def _inotify(path):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError('no inotify')
+    fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), 'inotify_init1')
+    if libc.inotify_add_watch(fd, os.fsencode(path), _IN_EVENTS) < 0:
+        err = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(err, 'inotify_add_watch')
+    return fd
+
+
+def _netlink():
+    s = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, _NETLINK_KOBJECT_UEVENT)
+    s.bind((0, 1))          # group 1: kernel uevents
+    s.setblocking(False)
+    return s
+
+
+class PortWatcher:
+    """Background thread that diffs the port list whenever /dev or the kernel says so."""
+
+    def __init__(self, on_add=None, on_remove=None, on_reconnect=None, esp32_only=True,
+                 sys_root=SYS_ROOT, dev_root=DEV_ROOT, mode=None):
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.on_reconnect = on_reconnect
+        self.esp32_only = esp32_only
+        self.sys_root = sys_root
+        self.dev_root = dev_root
+        self.ports = {}             # device -> Port
+        self.gone = set()           # identities of removed boards
+        self.mode = mode            # 'inotify', 'netlink' or 'poll'; None: best available
+        self.events = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = self._sock = None
+
+    def start(self):
+        """Take the initial list (callbacks not called for it) and start watching."""
+        self._open()
+        self.ports = {p.device: p for p in self._list()}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+        if self._sock is not None:
+            self._sock.close()
+
+    def _list(self):
+        return list_ports(self.esp32_only, self.sys_root, self.dev_root)
+
+    def _open(self):
+        modes = [self.mode] if self.mode else ['inotify', 'netlink', 'poll']
+        for mode in modes:
+            try:
+                if mode == 'inotify':
+                    self._fd = _inotify(self.dev_root)
+                elif mode == 'netlink':
+                    self._sock = _netlink()
+                self.mode = mode
+                return
+            except (OSError, AttributeError):
+                continue
+        self.mode = 'poll'
+
+    def _wait(self):
+        """Block until something may have changed (or POLL_S passed); False to stop."""
+        if self.mode == 'poll':
+            return not self._stop.wait(POLL_S)
+        fd = self._fd if self._fd is not None else self._sock.fileno()
+        while not self._stop.is_set():
+            r, _, _ = select.select([fd], [], [], 0.5)
+            if not r:
+                continue
+            # Drain this burst (a replug is several events), then scan once
+            time.sleep(SETTLE_S)
+            relevant = self._drain()
+            if relevant:
+                return True
+        return False
+
+    def _drain(self):
+        relevant = False
+        try:
+            if self._fd is not None:
+                data = os.read(self._fd, 65536)
+                i = 0
+                while i < len(data):
+                    _, _, _, n = struct.unpack_from('iIII', data, i)
+                    name = data[i + 16:i + 16 + n].split(b'\0', 1)[0]
+                    relevant |= name.startswith(b'tty') or name.startswith(b'cu.')
+                    i += 16 + n
+            else:
+                while True:
+                    msg = self._sock.recv(65536)
+                    relevant |= b'SUBSYSTEM=tty' in msg or b'SUBSYSTEM=usb' in msg
+        except BlockingIOError:
+            pass
+        return relevant
+
+    def _run(self):
+        while self._wait():
+            self.rescan()
+
+    def rescan(self):
+        """Diff against the last list and call back. Also usable without start()."""
+        now = {p.device: p for p in self._list()}
+        for dev in set(self.ports) - set(now):
+            port = self.ports[dev]
+            self.gone.add(identity(port))
+            self.events += 1
+            if self.on_remove:
+                self.on_remove(port)
+        for dev in set(now) - set(self.ports):
+            port = now[dev]
+            self.events += 1
+            if self.on_add:
+                self.on_add(port)
+            if identity(port) in self.gone:
+                self.gone.discard(identity(port))
+                if self.on_reconnect:
+                    self.on_reconnect(port)
+        self.ports = now
+
+
+# ---------------------------------------------------------------------------
+# Self-test on a fake sysfs tree
+
+
+def _fake_usb(root, busdev, iface, tty, vid, pid, serial=None, product=None, usb_serial_dir=True):
+    """Create sysfs + /dev entries for one USB serial port under root."""
+    usb = os.path.join(root, 'sys', 'devices', 'pci0000:00', '0000:00:14.0', 'usb1', busdev)
+    os.makedirs(usb, exist_ok=True)
+    for attr, val in (('idVendor', f'{vid:04x}'), ('idProduct', f'{pid:04x}'),
+                      ('serial', serial), ('product', product), ('manufacturer', 'Test')):
+        if val is not None:
+            with open(os.path.join(usb, attr), 'w') as f:
+                f.write(val + '\n')
+    dev = os.path.join(usb, f'{busdev}:{iface}')
+    if usb_serial_dir:              # ttyUSB: the port has its own dir under the interface
+        dev = os.path.join(dev, tty)
+    os.makedirs(os.path.join(dev, 'tty', tty), exist_ok=True)
+    cls = os.path.join(root, 'sys', 'class', 'tty', tty)
+    os.symlink(os.path.join(dev, 'tty', tty), cls)
+    os.symlink(dev, os.path.join(dev, 'tty', tty, 'device'))
+    open(os.path.join(root, 'dev', tty), 'w').close()
+    return usb
+
+
+def _unplug(root, usb, tty):
+    import shutil
+
+    os.unlink(os.path.join(root, 'dev', tty))
+    os.unlink(os.path.join(root, 'sys', 'class', 'tty', tty))
+    shutil.rmtree(usb)
+
+
+def selftest():
+    import shutil
+    import tempfile
+
+    root = tempfile.mkdtemp(prefix='fake_sysfs_')
+    sys_root, dev_root = os.path.join(root, 'sys'), os.path.join(root, 'dev')
+    ok = True
+
+    def check(cond, what):
+        nonlocal ok
+        ok &= bool(cond)
+        print(f'  {"ok  " if cond else "FAIL"} {what}')
+
+    try:
+        os.makedirs(os.path.join(sys_root, 'class', 'tty'))
+        os.makedirs(os.path.join(sys_root, 'devices', 'platform', 'serial8250', 'tty', 'ttyS0'))
+        os.makedirs(dev_root)
+        # 300 virtual ttys (vt, pty) without a device link, like a real /sys/class/tty
+        for i in range(300):
+            d = os.path.join(sys_root, 'devices', 'virtual', 'tty', f'tty{i}')
+            os.makedirs(d)
+            os.symlink(d, os.path.join(sys_root, 'class', 'tty', f'tty{i}'))
+            open(os.path.join(dev_root, f'tty{i}'), 'w').close()
+        s0 = os.path.join(sys_root, 'devices', 'platform', 'serial8250', 'tty', 'ttyS0')
+        os.symlink(s0, os.path.join(sys_root, 'class', 'tty', 'ttyS0'))
+        os.symlink(os.path.dirname(os.path.dirname(s0)), os.path.join(s0, 'device'))
+        open(os.path.join(dev_root, 'ttyS0'), 'w').close()
+        cp = _fake_usb(root, '1-1', '1.0', 'ttyUSB0', 0x10C4, 0xEA60, '0001',
+                       'CP2102 USB to UART Bridge Controller')
+        _fake_usb(root, '1-2', '1.0', 'ttyUSB1', 0x1A86, 0x7523, None, 'USB Serial')
+        _fake_usb(root, '1-3', '1.0', 'ttyACM0', 0x303A, 0x1001, 'F4:12:FA:00:11:22',
+                  'USB JTAG/serial debug unit', usb_serial_dir=False)
+        _fake_usb(root, '1-4', '1.0', 'ttyACM1', 0x046D, 0xC52B, None, 'Unifying Receiver',
+                  usb_serial_dir=False)
+
+        print('scan:')
+        _cache.clear()
+        _virtual.clear()
+        t0 = time.perf_counter()
+        ports = list_ports(sys_root=sys_root, dev_root=dev_root)
+        cold = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        for _ in range(20):
+            list_ports(sys_root=sys_root, dev_root=dev_root)
+        warm = (time.perf_counter() - t0) * 1000 / 20
+        for p in ports:
+            print(f'    {p.device:28} {p.vid or 0:04x}:{p.pid or 0:04x} {p.chip or "-":16} '
+                  f'{p.serial_number or "-":18} {p.description}')
+        by = {p.name: p for p in ports}
+        check(sorted(by) == ['ttyACM0', 'ttyACM1', 'ttyS0', 'ttyUSB0', 'ttyUSB1'],
+              'hardware ttys only (300 virtual skipped)')
+        check(by['ttyUSB0'].chip == 'CP210x' and by['ttyUSB0'].serial_number == '0001'
+              and by['ttyUSB0'].location == '1-1:1.0', 'CP2102 VID/PID, serial, location')
+        check(by['ttyACM0'].chip and by['ttyACM0'].location == '1-3:1.0', 'native USB (ttyACM) walk-up')
+        check(by['ttyS0'].vid is None, 'platform UART has no USB ids')
+        esp = [p.name for p in list_ports(True, sys_root, dev_root)]
+        check(esp == ['ttyACM0', 'ttyUSB0', 'ttyUSB1'], f'esp32_only: {esp}')
+        check(cold < STARTUP_TARGET_MS, f'cold list {cold:.2f} ms < {STARTUP_TARGET_MS} ms target')
+        check(warm < 2, f'cached list {warm:.2f} ms < 2 ms')
+
+        for mode in ('inotify', 'poll'):
+            print(f'hotplug ({mode}):')
+            events = []
+            t_mark = [0.0]
+            got = threading.Event()
+
+            def cb(kind):
+                def f(p):
+                    events.append((kind, p.name, time.perf_counter() - t_mark[0]))
+                    got.set()
+                return f
+
+            w = PortWatcher(cb('add'), cb('remove'), cb('reconnect'),
+                            sys_root=sys_root, dev_root=dev_root, mode=mode).start()
+            check(w.mode == mode, f'watching with {w.mode}')
+            got.clear()
+            t_mark[0] = time.perf_counter()
+            _unplug(root, cp, 'ttyUSB0')
+            got.wait(3)
+            time.sleep(SETTLE_S * 2)
+            got.clear()
+            t_mark[0] = time.perf_counter()
+            # Replugged: same board, new name
+            cp = _fake_usb(root, '1-1', '1.0', 'ttyUSB2', 0x10C4, 0xEA60, '0001',
+                           'CP2102 USB to UART Bridge Controller')
+            got.wait(3)
+            time.sleep(SETTLE_S * 2)
+            w.stop()
+            for kind, name, dt in events:
+                print(f'    {kind:9} {name:8} {dt * 1000:7.1f} ms after the change')
+            kinds = [(k, n) for k, n, _ in events]
+            check(kinds == [('remove', 'ttyUSB0'), ('add', 'ttyUSB2'), ('reconnect', 'ttyUSB2')],
+                  'remove, add, reconnect under the new name')
+            # Put it back where it was for the next mode
+            _unplug(root, cp, 'ttyUSB2')
+            cp = _fake_usb(root, '1-1', '1.0', 'ttyUSB0', 0x10C4, 0xEA60, '0001',
+                           'CP2102 USB to UART Bridge Controller')
+        try:
+            _netlink().close()
+            print('netlink uevent socket: available')
+        except OSError as e:
+            print(f'netlink uevent socket: unavailable here ({e})')
+    finally:
+        shutil.rmtree(root)
+    print('OK' if ok else 'FAILED')
+    return ok
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List and watch serial ports')
+    parser.add_argument('--all', action='store_true', help='All hardware serial ports, not only ESP32 bridges')
+    parser.add_argument('--watch', action='store_true', help='Print add/remove/reconnect events')
+    parser.add_argument('--selftest', action='store_true', help='Check against a fake sysfs tree')
+    args = parser.parse_args()
+
+    if args.selftest:
+        raise SystemExit(0 if selftest() else 1)
+    t0 = time.perf_counter()
+    ports = list_ports(esp32_only=not args.all)
+    ms = (time.perf_counter() - t0) * 1000
+    for p in ports:
+        ids = f'{p.vid:04x}:{p.pid:04x}' if p.vid is not None else '-'
+        print(f'{p.device:28} {ids:10} {p.chip or "-":16} {p.serial_number or "-":18} {p.description}')
+    print(f'{len(ports)} port(s) in {ms:.1f} ms')
+    if args.watch:
+        w = PortWatcher(lambda p: print('added     ', p.device, p.description),
+                        lambda p: print('removed   ', p.device),
+                        lambda p: print('reconnect ', p.device, p.serial_number or ''),
+                        esp32_only=not args.all).start()
+        print(f'Watching ({w.mode}), Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            w.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,19 @@ Quick Serial Monitor for ESP32 Sensors
 This script connects to the ESP32 and displays sensor data
 """
 
+import argparse
 import serial
 import sys
 import time
 
+from serial_mux import open_serial
+from serial_reader import LineReader
+
 def main():
+    parser = argparse.ArgumentParser(description='Quick serial monitor for ESP32 sensors')
+    parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
+    args = parser.parse_args()
+
     port = '/dev/cu.usbserial-0001'
     baudrate = 115200
     
@@ -20,7 +28,7 @@ def main():
     
     try:
         # Open serial connection
-        ser = serial.Serial(port, baudrate, timeout=1)
+        ser = open_serial(port, baudrate, mux=args.mux, timeout=1)
         time.sleep(2)  # Wait for connection to establish
         
         # Clear any existing data
@@ -30,16 +38,12 @@ def main():
         print("Press Ctrl+C to exit\n")
         print("=" * 50)
         
+        reader = LineReader(ser)
         while True:
-            if ser.in_waiting > 0:
-                try:
-                    line = ser.readline().decode('utf-8').rstrip()
-                    print(line)
-                except UnicodeDecodeError:
-                    # Handle any decoding errors
-                    pass
+            for line in reader.read_lines():
+                print(line.rstrip())
                     
-    except serial.SerialException as e:
+    except (serial.SerialException, OSError) as e:
         print(f"\nError: Could not open port {port}")
         print(f"Details: {e}")
         print("\nMake sure:")
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Serial port multiplexer: one daemon owns the ESP32 port(s), any number of
+host tools attach to it at once.
+
+Without it every tool opens the device exclusively, so the fall alarm and a
+logger can't run together ("Resource busy"). The daemon reads each port in
+bulk, splits the stream once into records (text lines ending in \\n, binary
+frames ending in 0x00) and fans every record out to the subscribers of that
+port over a Unix socket:
+
+    <MUX_DIR>/<port name>.sock    e.g. /tmp/esp32-mux/cu.usbserial-0001.sock
+
+Subscribers get the device's byte stream unchanged, whole records at a time,
+and anything they send is written to the device (commands). Each subscriber
+has its own bounded queue; a subscriber that falls behind loses whole
+records (counted) instead of slowing the daemon or the other subscribers.
+If the device goes away the daemon keeps the subscribers and reopens it.
+
+Start the daemon:
+    python3 serial_mux.py /dev/cu.usbserial-0001 [/dev/cu.usbserial-230 ...] [-b 115200]
+
+With -b auto it finds the rate each board is at, and with --fast it also
+negotiates the fastest rate the link carries (baudlink.py) every time it
+opens a port, so attached tools get the faster link without doing anything.
+
+Attach the existing tools with --mux:
+    python3 mac_fall_alarm.py --mux
+    python3 monitor_esp32cam.py -p /dev/cu.usbserial-0001 --mux
+    ./auto_monitor.sh --mux
+
+Other commands:
+    python3 serial_mux.py --status                    per-subscriber queue/drop counters
+    python3 serial_mux.py --attach /dev/cu.usbserial-0001   like cat, plus stdin -> device
+
+From Python, open_serial() returns a pyserial Serial or, with mux=True, a
+MuxSerial with the same read/readline/in_waiting/write interface.
+
+Requires: pip install pyserial
+"""
+
+import asyncio
+import json
+import os
+import re
+import selectors
+import socket
+import sys
+import time
+
+MUX_DIR = os.environ.get('ESP32_MUX_DIR', '/tmp/esp32-mux')
+STATUS_SOCKET = 'mux.status'
+QUEUE_RECORDS = 4096        # per-subscriber backlog before records are dropped
+MAX_RECORD = 4096           # longest run without a delimiter passed on as one record
+READ_SIZE = 65536
+REOPEN_S = 1.0
+PARTIAL_FLUSH_S = 0.1       # pass on an unterminated line (progress dots) after this long
+
+_RECORD = re.compile(rb'[^\n\x00]*[\n\x00]')
+
+
+def socket_path(port, mux_dir=MUX_DIR):
+    return os.path.join(mux_dir, os.path.basename(port) + '.sock')
+
+
+def split_records(buf):
+    """Split buf into complete records (delimiter kept). Returns (records, rest)."""
+    records = _RECORD.findall(buf)
+    used = sum(map(len, records))
+    rest = buf[used:]
+    if len(rest) > MAX_RECORD:
+        records.append(bytes(rest))
+        rest = b''
+    return records, rest
+
+
+class Subscriber:
+    def __init__(self, sid, writer):
+        self.id = sid
+        self.writer = writer
+        self.queue = asyncio.Queue(QUEUE_RECORDS)
+        self.sent = 0
+        self.dropped = 0
+        self.t0 = time.time()
+
+    def offer(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def pump(self):
+        """Send queued records, batching whatever has piled up into one write."""
+        q = self.queue
+        while True:
+            batch = [await q.get()]
+            while not q.empty():
+                batch.append(q.get_nowait())
+            self.writer.write(b''.join(batch))
+            await self.writer.drain()
+            self.sent += len(batch)
+
+    def status(self):
+        return {'id': self.id, 'queued': self.queue.qsize(), 'sent': self.sent,
+                'dropped': self.dropped, 'connected_s': round(time.time() - self.t0, 1)}
+
+
+class PortMux:
+    """Owns one serial port and its subscribers."""
+
+    def __init__(self, port, baud, mux_dir, fast=False):
+        self.port = port
+        self.baud = baud                # None: detect
+        self.fast = fast
+        self.rate = baud
+        self.path = socket_path(port, mux_dir)
+        self.ser = None
+        self.rest = b''
+        self.flush_timer = None
+        self.subs = {}
+        self.next_id = 1
+        self.bytes_in = self.records = self.bytes_out = self.reopens = 0
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.client, self.path)
+        print(f'{self.port}: serving on {self.path}')
+        async with server:
+            await self.keep_open()
+
+    async def keep_open(self):
+        import serial
+
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.ser = serial.Serial(self.port, self.baud or 115200, timeout=0)
+            except (serial.SerialException, OSError) as e:
+                if self.reopens == 0:
+                    print(f'{self.port}: {e}; retrying every {REOPEN_S:.0f} s')
+                self.reopens += 1
+                await asyncio.sleep(REOPEN_S)
+                continue
+            self.reopens = 0
+            if self.fast or self.baud is None:
+                from baudlink import connect
+                link = await loop.run_in_executor(
+                    None, lambda: connect(self.ser, auto=self.baud is None, fast=self.fast))
+                self.rate = link.rate
+            print(f'{self.port}: open at {self.rate}')
+            closed = loop.create_future()
+            loop.add_reader(self.ser.fileno(), self.readable, closed)
+            await closed
+            loop.remove_reader(self.ser.fileno())
+            self.ser.close()
+            self.ser = None
+            self.rest = b''
+            print(f'{self.port}: lost, reopening')
+
+    def readable(self, closed):
+        try:
+            data = os.read(self.ser.fileno(), READ_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            # Readable with nothing to read: the device was unplugged
+            if not closed.done():
+                closed.set_result(None)
+            return
+        self.bytes_in += len(data)
+        records, self.rest = split_records(self.rest + data)
+        self.fan_out(records)
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.rest:
+            self.flush_timer = asyncio.get_running_loop().call_later(PARTIAL_FLUSH_S, self.flush_partial)
+
+    def flush_partial(self):
+        self.flush_timer = None
+        records, self.rest = [self.rest], b''
+        self.fan_out(records)
+
+    def fan_out(self, records):
+        self.records += len(records)
+        for sub in self.subs.values():
+            for rec in records:
+                sub.offer(rec)
+
+    async def client(self, reader, writer):
+        sub = Subscriber(self.next_id, writer)
+        self.next_id += 1
+        self.subs[sub.id] = sub
+        pump = asyncio.ensure_future(sub.pump())
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                # Commands from subscribers go to the device as-is
+                if self.ser is not None:
+                    self.ser.write(data)
+                    self.bytes_out += len(data)
+        except ConnectionError:
+            pass
+        finally:
+            pump.cancel()
+            del self.subs[sub.id]
+            if sub.dropped:
+                print(f'{self.port}: subscriber {sub.id} left, {sub.dropped} records dropped')
+            writer.close()
+
+    def status(self):
+        return {'open': self.ser is not None, 'baud': self.rate, 'bytes_in': self.bytes_in,
+                'records': self.records, 'bytes_out': self.bytes_out,
+                'subscribers': [s.status() for s in self.subs.values()]}
+
+
+async def run_daemon(ports, baud, mux_dir, fast=False):
+    os.makedirs(mux_dir, exist_ok=True)
+    muxes = [PortMux(p, baud, mux_dir, fast) for p in ports]
+
+    async def status(reader, writer):
+        writer.write(json.dumps({m.port: m.status() for m in muxes}).encode() + b'\n')
+        await writer.drain()
+        writer.close()
+
+    path = os.path.join(mux_dir, STATUS_SOCKET)
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(status, path)
+    async with server:
+        await asyncio.gather(*(m.serve() for m in muxes))
+
+
+class MuxSerial:
+    """The part of serial.Serial the host tools use, backed by a daemon socket."""
+
+    def __init__(self, port, baudrate=None, timeout=None, mux_dir=MUX_DIR, **kwargs):
+        self.port = port
+        self.baudrate = baudrate        # set by the daemon; kept for printing
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path(port, mux_dir))
+        except OSError as e:
+            self.sock.close()
+            raise ConnectionError(f'no serial_mux.py daemon for {port} ({e})') from e
+        self.buf = bytearray()
+        self.is_open = True
+
+    def _fill(self, timeout):
+        """Wait up to timeout (None: forever) for data; False if none came."""
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(READ_SIZE)
+        except (socket.timeout, BlockingIOError):
+            return False
+        if not data:
+            raise ConnectionError('serial_mux.py daemon went away')
+        self.buf += data
+        return True
+
+    def _wait(self, deadline):
+        left = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return self._fill(left)
+
+    @property
+    def in_waiting(self):
+        self._fill(0)
+        return len(self.buf)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(self.buf) < size and self._wait(deadline):
+            pass
+        out = bytes(self.buf[:size])
+        del self.buf[:size]
+        return out
+
+    def readline(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while b'\n' not in self.buf and self._wait(deadline):
+            pass
+        i = self.buf.find(b'\n') + 1 or len(self.buf)
+        out = bytes(self.buf[:i])
+        del self.buf[:i]
+        return out
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def fileno(self):
+        # For serial_reader.LineReader; anything already in self.buf is not seen there
+        return self.sock.fileno()
+
+    def reset_input_buffer(self):
+        while self._fill(0):
+            pass
+        self.buf.clear()
+
+    def setDTR(self, value=True):
+        pass                            # the daemon owns the control lines
+
+    def setRTS(self, value=True):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.sock.close()
+            self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_serial(port, baudrate=115200, mux=False, **kwargs):
+    """serial.Serial(port, baudrate, **kwargs), or the daemon's copy of it if mux."""
+    if mux:
+        return MuxSerial(port, baudrate, **kwargs)
+    import serial
+    return serial.Serial(port, baudrate, **kwargs)
+
+
+def attach(port, mux_dir):
+    """cat for the daemon: device -> stdout, stdin -> device."""
+    ser = MuxSerial(port, mux_dir=mux_dir)
+    out = sys.stdout.buffer
+    sel = selectors.DefaultSelector()
+    sel.register(ser.sock, selectors.EVENT_READ)
+    sel.register(sys.stdin.fileno(), selectors.EVENT_READ)
+    try:
+        while True:
+            for key, _ in sel.select():
+                if key.fileobj is ser.sock:
+                    ser._fill(None)
+                    out.write(ser.buf)
+                    out.flush()
+                    ser.buf.clear()
+                else:
+                    data = os.read(sys.stdin.fileno(), 4096)
+                    if not data:
+                        sel.unregister(sys.stdin.fileno())
+                    else:
+                        ser.write(data)
+    except (KeyboardInterrupt, ConnectionError):
+        pass
+    finally:
+        ser.close()
+
+
+def status(mux_dir):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(os.path.join(mux_dir, STATUS_SOCKET))
+    except OSError as e:
+        print(f'No daemon in {mux_dir}: {e}')
+        return
+    data = b''
+    while True:
+        chunk = s.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    for port, st in json.loads(data).items():
+        print(f"{port}: {'open' if st['open'] else 'closed'} at {st.get('baud')}  in={st['bytes_in']} B  "
+              f"records={st['records']}  out={st['bytes_out']} B")
+        for sub in st['subscribers']:
+            print(f"  subscriber {sub['id']}: sent={sub['sent']} queued={sub['queued']} "
+                  f"dropped={sub['dropped']} up {sub['connected_s']} s")
+
+
+def main():
+    import argparse
+
+    from baudlink import baud_arg
+
+    parser = argparse.ArgumentParser(description='Share ESP32 serial ports between host tools')
+    parser.add_argument('ports', nargs='*', help='Serial ports to own (e.g., /dev/cu.usbserial-0001)')
+    parser.add_argument('-b', '--baud', type=baud_arg, default=115200,
+                        help="Baud rate, or 'auto' to detect it (default: 115200)")
+    parser.add_argument('--fast', action='store_true', help='Negotiate a faster link on each open (baudlink.py)')
+    parser.add_argument('--dir', default=MUX_DIR, help=f'Socket directory (default: {MUX_DIR})')
+    parser.add_argument('--status', action='store_true', help='Show counters of a running daemon')
+    parser.add_argument('--attach', metavar='PORT', help='Pipe a port through a running daemon')
+    args = parser.parse_args()
+
+    if args.status:
+        status(args.dir)
+    elif args.attach:
+        attach(args.attach, args.dir)
+    elif args.ports:
+        try:
+            asyncio.run(run_daemon(args.ports, args.baud, args.dir, args.fast))
+        except KeyboardInterrupt:
+            pass
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Line reader for the serial monitors.
+
+Replaces the `if ser.in_waiting: ser.readline()` + sleep loops: LineReader
+blocks on the port's file descriptor with selectors (no CPU while idle, no
+sleep-sized latency while busy), reads whatever is available straight into
+one reusable bytearray, finds line ends on a memoryview of it and decodes
+complete lines with a single incremental UTF-8 decoder. Bytes that are not
+valid UTF-8 (baud mismatch, boot ROM noise) come out as <xx> hex instead of
+failing the line.
+
+    ser = serial.Serial(port, 115200)        # or serial_mux.MuxSerial
+    reader = LineReader(ser)
+    while True:
+        for line in reader.read_lines(timeout=5.0):
+            print(line)
+
+A line with no newline yet (Serial.print(".") while WiFi connects) is
+returned once it has sat for flush_s, like readline() with a timeout did.
+
+Benchmark against a pty stand-in for the port:
+    python3 serial_reader.py --bench [--seconds 5]
+
+Requires: pip install pyserial
+"""
+
+import codecs
+import os
+import selectors
+import time
+
+READ_SIZE = 65536
+
+
+def _hex_fallback(err):
+    bad = err.object[err.start:err.end]
+    return ''.join(f'<{b:02x}>' for b in bad), err.end
+
+
+codecs.register_error('serial_hex', _hex_fallback)
+
+
+class LineReader:
+    def __init__(self, src, bufsize=READ_SIZE, flush_s=0.1):
+        """src: an open serial.Serial, MuxSerial or anything with fileno()."""
+        self.fd = src if isinstance(src, int) else src.fileno()
+        self.buf = bytearray(bufsize)
+        self.mv = memoryview(self.buf)
+        self.start = self.end = 0           # unconsumed bytes are buf[start:end]
+        self.decoder = codecs.getincrementaldecoder('utf-8')('serial_hex')
+        self.flush_s = flush_s
+        self.t_partial = None               # when the current partial line began
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.fd, selectors.EVENT_READ)
+        self.bytes_read = 0
+        self.closed = False
+
+    def _fill(self, timeout):
+        """Wait up to timeout for data and read all of it. False on timeout."""
+        if not self.sel.select(timeout):
+            return False
+        if self.start:
+            # Move the partial line to the front so reads always append
+            n = self.end - self.start
+            self.buf[:n] = self.mv[self.start:self.end]
+            self.start, self.end = 0, n
+        if self.end == len(self.buf):
+            return True                     # full of one line; read_lines() flushes it
+        n = os.readv(self.fd, [self.mv[self.end:]])
+        if n == 0:
+            self.closed = True              # device unplugged / daemon gone
+            return False
+        self.end += n
+        self.bytes_read += n
+        return True
+
+    def _emit_partial_into(self, out):
+        text = self.decoder.decode(self.mv[self.start:self.end])
+        if text:
+            out.append(text.rstrip('\r'))
+        self.start = self.end = 0
+        self.t_partial = None
+
+    def read_lines(self, timeout=None):
+        """Complete lines (str, without line ending) received within timeout s."""
+        out = []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not out:
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self.t_partial is not None:
+                left = self.t_partial + self.flush_s - time.monotonic()
+                wait = left if wait is None else min(wait, left)
+            got = self._fill(max(0.0, wait) if wait is not None else None)
+            if self.closed:
+                raise ConnectionError('serial port closed')
+            if got:
+                # Everything currently readable, so a burst costs one decode
+                while self.end < len(self.buf) and self._fill(0):
+                    pass
+                last = self.buf.rfind(b'\n', self.start, self.end)
+                if last >= 0:
+                    text = self.decoder.decode(self.mv[self.start:last + 1])
+                    self.start = last + 1
+                    lines = text.split('\n')
+                    lines.pop()                         # '' after the final \n
+                    out.extend(line.rstrip('\r') for line in lines)
+                    self.t_partial = None
+                if self.end - self.start == len(self.buf):
+                    # One line longer than the whole buffer: hand it out as is
+                    self._emit_partial_into(out)
+                elif self.start < self.end and self.t_partial is None:
+                    self.t_partial = time.monotonic()
+            if (self.t_partial is not None
+                    and time.monotonic() - self.t_partial >= self.flush_s):
+                self._emit_partial_into(out)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if self.start == self.end:
+            self.start = self.end = 0
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+
+
+def _writer(fd, baud, seconds, line_len):
+    """Child process playing the device: timestamped lines at the UART byte rate of baud."""
+    bytes_per_s = baud / 10
+    t0 = time.monotonic()
+    sent = 0
+    pad = 'x' * line_len
+    while True:
+        now = time.monotonic()
+        if now - t0 >= seconds:
+            break
+        due = int((now - t0) * bytes_per_s) - sent
+        if due <= 0:
+            time.sleep(0.0005)
+            continue
+        chunk = bytearray()
+        while len(chunk) < due:
+            chunk += f'{time.monotonic():.6f} {pad}\n'.encode()
+        os.write(fd, chunk)
+        sent += len(chunk)
+    os.write(fd, b'END\n')
+    os.close(fd)
+
+
+def _old_loop(ser, idle_sleep):
+    """The replaced pattern: poll in_waiting, readline(), sleep when idle."""
+    while True:
+        if ser.in_waiting:
+            yield [ser.readline().decode('utf-8', errors='ignore').rstrip()]
+        else:
+            time.sleep(idle_sleep)
+
+
+def _new_loop(ser):
+    reader = LineReader(ser)
+    while True:
+        yield reader.read_lines()
+
+
+def bench(seconds):
+    import multiprocessing
+    import pty
+    import tty
+
+    import serial
+
+    # fork, so the child inherits the pty master (the "device" end)
+    ctx = multiprocessing.get_context('fork')
+
+    print(f'{"reader":28} {"baud":>7} {"lines/s":>9} {"KB/s":>7} '
+          f'{"lat p50 ms":>10} {"lat p99 ms":>10} {"CPU %":>6}')
+    for baud in (115200, 921600):
+        for name, idle in (('in_waiting+readline 0.1 s', 0.1),
+                           ('in_waiting+readline 0.01 s', 0.01),
+                           ('LineReader (selectors)', None)):
+            master, slave = pty.openpty()
+            tty.setraw(slave)
+            ser = serial.Serial(os.ttyname(slave), baud, timeout=1)
+            w = ctx.Process(target=_writer, args=(master, baud, seconds, 60))
+            lat = []
+            n_bytes = 0
+            cpu0 = time.process_time()
+            t0 = time.monotonic()
+            w.start()
+            loop = _new_loop(ser) if idle is None else _old_loop(ser, idle)
+            done = False
+            while not done:
+                for line in next(loop):
+                    if line == 'END':
+                        done = True
+                        break
+                    n_bytes += len(line) + 1
+                    try:
+                        lat.append(time.monotonic() - float(line.split(' ', 1)[0]))
+                    except ValueError:
+                        pass
+            wall = time.monotonic() - t0
+            cpu = time.process_time() - cpu0
+            w.join()
+            ser.close()
+            os.close(master)
+            os.close(slave)
+            lat.sort()
+            p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else float('nan')
+            print(f'{name:28} {baud:>7} {len(lat) / wall:>9.0f} {n_bytes / wall / 1024:>7.1f} '
+                  f'{p(0.5):>10.1f} {p(0.99):>10.1f} {100 * cpu / wall:>6.1f}')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serial line reader benchmark')
+    parser.add_argument('--bench', action='store_true', help='Compare with the in_waiting loops on a pty')
+    parser.add_argument('--seconds', type=float, default=5, help='Seconds per run (default: 5)')
+    args = parser.parse_args()
+    if args.bench:
+        bench(args.seconds)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Wheel speed setpoints, shared by diffdrive.py on the board and
+mac_keyboard_drive.py --pwm on the host (upload it next to diffdrive.py).
+
+One setpoint is 8 ASCII bytes:  V LL RR CC \\n
+    LL, RR  left and right speed, -127..127, as a two's complement byte in hex
+    CC      LL ^ RR ^ 0x56, so a garbled frame is dropped instead of driven
+
+Plain ASCII so it goes through the REPL UART like the key commands do (a raw
+0x03 byte would be Ctrl-C); at 100 Hz that is 800 B/s, 7% of 115200 baud.
+"""
+
+FULL = 127      # full speed forward; -FULL is full speed backward
+SIZE = 8        # bytes per encoded setpoint
+CHECK = 0x56    # 'V'
+
+
+def encode(left, right):
+    """Setpoint line for (left, right), clamped to -FULL..FULL."""
+    l = max(-FULL, min(FULL, int(left))) & 0xFF
+    r = max(-FULL, min(FULL, int(right))) & 0xFF
+    return "V%02x%02x%02x\n" % (l, r, l ^ r ^ CHECK)
+
+
+def decode(digits):
+    """(left, right) from the 6 hex digits after 'V', or None if they don't check."""
+    if len(digits) != 6:
+        return None
+    try:
+        l = int(digits[0:2], 16)
+        r = int(digits[2:4], 16)
+        c = int(digits[4:6], 16)
+    except ValueError:
+        return None
+    if c != l ^ r ^ CHECK or l == 0x80 or r == 0x80:
+        return None
+    return (l - 256 if l > 127 else l, r - 256 if r > 127 else r)
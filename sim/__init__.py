@@ -0,0 +1,164 @@
+"""
+CPython simulation harness for the MicroPython scripts in this repo.
+
+Runs main.py, esp32_l298n_main.py, l298n_test.py, check_power.py, ... unmodified
+on Linux. The shims in sim/shims stand in for `machine`, `micropython`,
+`uselect` and `esp32`; `time` gets MicroPython's ticks_*/sleep_ms on a
+virtual clock, so an hour of device time runs in seconds. Every output pin
+transition is logged with its virtual timestamp in Simulation.pin_log, and
+printed lines are kept with theirs in Simulation.stdout.lines.
+
+    import sim
+    from sim.mpu6050 import MPU6050, with_falls
+
+    s = sim.run('main.py', 600, devices={0x68: MPU6050(with_falls([100, 400]))})
+    falls = [l.t_us for l in s.stdout.lines if l.text == 'FALL_DETECTED']
+
+Top-level constants of the script can be overridden without editing it,
+e.g. overrides={'MODE': 'fifo'}. See `python3 -m sim --help` for the CLI.
+"""
+
+import ast
+import builtins
+import gc
+import importlib
+import os
+import sys
+import time as _time
+import types
+
+from sim import core
+from sim.core import SimulationEnd, Simulation
+
+SHIMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shims')
+SHIM_MODULES = ('machine', 'micropython', 'uselect', 'esp32', '_thread')
+HEAP_BYTES = 110000             # roughly what a plain ESP32 build has free
+CPU_MHZ = 240                   # time.ticks_cpu() counts CPU cycles
+
+
+def _virtual_time(sim):
+    """A `time` module whose MicroPython functions run on the virtual clock."""
+    t = types.ModuleType('time')
+    for name in dir(_time):
+        if not name.startswith('__'):
+            setattr(t, name, getattr(_time, name))
+    clock = sim.clock
+    mask = core.TICKS_PERIOD - 1
+    epoch = _time.time()
+
+    def ticks_us():
+        # Busy-wait loops call this millions of times: skip advance() when no event is due
+        n = clock.now + core.TICK_COST_US
+        if n >= clock.end or (clock._events and clock._events[0][0] <= n):
+            clock.advance(core.TICK_COST_US)
+        else:
+            clock.now = n
+        return clock.now & mask
+
+    def ticks_ms():
+        clock.advance(core.TICK_COST_US)
+        return (clock.now // 1000) & mask
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & mask
+
+    def ticks_diff(a, b):
+        return ((a - b + core.TICKS_PERIOD // 2) & mask) - core.TICKS_PERIOD // 2
+
+    t.ticks_us = ticks_us
+    t.ticks_ms = ticks_ms
+    t.ticks_cpu = lambda: int(clock.now * CPU_MHZ) & mask   # CCOUNT, like the esp32 port
+    t.ticks_add = ticks_add
+    t.ticks_diff = ticks_diff
+    t.sleep = lambda s: sim.sleep_us(s * 1e6)
+    t.sleep_ms = lambda ms: sim.sleep_us(ms * 1000)
+    t.sleep_us = lambda us: sim.sleep_us(us)
+    t.time = lambda: epoch + clock.now / 1e6
+    t.time_ns = lambda: int((epoch + clock.now / 1e6) * 1e9)
+    t.monotonic = lambda: clock.now / 1e6
+    return t
+
+
+def _compile(script, overrides):
+    """Compile script, replacing top-level `NAME = ...` for each override."""
+    with open(script) as f:
+        tree = ast.parse(f.read(), script)
+    seen = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                and isinstance(node.targets[0], ast.Name) and node.targets[0].id in overrides:
+            name = node.targets[0].id
+            node.value = ast.copy_location(ast.Constant(overrides[name]), node.value)
+            seen.add(name)
+    missing = set(overrides) - seen
+    if missing:
+        raise NameError(f'{script} has no top-level assignment to {", ".join(sorted(missing))}')
+    return compile(tree, script, 'exec')
+
+
+def run(script, duration_s, devices=None, stdin=(), adc=None, overrides=None,
+        echo=True, raw_out=None, setup=None, baud=None, stalls=()):
+    """Run a MicroPython script for duration_s of virtual time.
+
+    devices:   {i2c_addr: model} (see sim.mpu6050.MPU6050)
+    stdin:     [(t_seconds, text), ...] typed into the REPL at those times
+    adc:       {gpio: f(t_us) -> volts}
+    overrides: {NAME: value} for top-level constants of the script
+    setup:     f(sim) called before the script starts (drive pins, etc.)
+    baud:      if set, print() blocks for the UART transmit time at this rate
+    stalls:    [(t_seconds, duration_s), ...] when the host stops reading serial
+
+    Returns the Simulation, with pin_log, stdout.lines and clock.now.
+    """
+    sim = Simulation(duration_s, stdin, echo, raw_out, baud, stalls)
+    for addr, dev in (devices or {}).items():
+        sim.add_i2c_device(addr, dev)
+    sim.adc_sources.update(adc or {})
+    code = _compile(script, overrides or {})
+
+    saved_modules = {name: sys.modules.get(name) for name in SHIM_MODULES + ('time', 'utime')}
+    saved_io = sys.stdin, sys.stdout
+    saved_gc = {name: getattr(gc, name, None) for name in ('mem_free', 'mem_alloc')}
+    saved_path = list(sys.path)
+    vtime = _virtual_time(sim)
+    viper_types = {'ptr8': lambda x: x, 'ptr16': lambda x: x, 'ptr32': lambda x: x, 'uint': int}
+
+    core.SIM = sim
+    try:
+        for name in SHIM_MODULES:
+            sys.modules.pop(name, None)
+        sys.path.insert(0, SHIMS)
+        # Built-in modules are found before sys.path, so _thread is swapped in directly
+        sys.modules['_thread'] = importlib.import_module('sim.shims._thread')
+        sys.path.insert(1, os.path.dirname(os.path.abspath(script)))
+        sys.modules['time'] = sys.modules['utime'] = vtime
+        for name, value in viper_types.items():
+            setattr(builtins, name, value)
+        gc.mem_alloc = lambda: 0
+        gc.mem_free = lambda: HEAP_BYTES
+        sys.stdin, sys.stdout = sim.stdin, sim.stdout
+        if setup:
+            setup(sim)
+        try:
+            exec(code, {'__name__': '__main__', '__file__': script})
+        except SimulationEnd:
+            pass
+        sim.finished_at_us = sim.clock.now
+    finally:
+        sim.stop_threads()
+        sys.stdin, sys.stdout = saved_io
+        sys.path[:] = saved_path
+        for name, mod in saved_modules.items():
+            if mod is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = mod
+        for name in viper_types:
+            delattr(builtins, name)
+        for name, fn in saved_gc.items():
+            if fn is None:
+                delattr(gc, name)
+            else:
+                setattr(gc, name, fn)
+        core.SIM = None
+    return sim
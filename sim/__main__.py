@@ -0,0 +1,161 @@
+"""
+Command line for the simulator.
+
+    python3 -m sim main.py --duration 3600 --falls 600,1800 --quiet
+    python3 -m sim main.py --set MODE=fifo --trace fall_events/x.npz
+    python3 -m sim main.py --set MODE=wake --int-pin 32 --falls 120
+    python3 -m sim main.py --set MODE=thread --baud 115200 --stall 29:3 --falls 30
+    python3 -m sim esp32_l298n_main.py --keys "1:w,1.5: ,2:d,3:q" --pin-log pins.csv
+    python3 -m sim l298n_test.py --keys "0:1\\n" --duration 60
+    python3 -m sim check_power.py --supply 34:0.3  # 5 V rail sagging under load
+    python3 -m sim l298n.py                   # per-pin vs bank-write benchmark
+    python3 -m sim diffdrive.py --keys "0.1:V646456\n,1:V9c64ae\n" --pwm-log pwm.csv
+"""
+
+import argparse
+import ast
+import csv
+import time
+
+import numpy as np
+
+import sim
+from sim.mpu6050 import MPU6050, from_trace, still, with_falls
+from sim.supply import Supply
+
+
+def _keys(spec):
+    """'1:w,1.5: ,2:d' -> [(1.0, 'w'), (1.5, ' '), (2.0, 'd')]; \\n escapes allowed."""
+    out = []
+    for item in spec.split(','):
+        t, text = item.split(':', 1)
+        out.append((float(t), text.encode().decode('unicode_escape')))
+    return out
+
+
+def _override(item):
+    name, value = item.split('=', 1)
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def main():
+    p = argparse.ArgumentParser(prog='python3 -m sim', description='Run a MicroPython script on a virtual ESP32')
+    p.add_argument('script')
+    p.add_argument('--duration', type=float, default=60, help='Virtual seconds to run (default: 60)')
+    p.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                   help='Override a top-level constant, e.g. MODE=fifo (repeatable)')
+    p.add_argument('--falls', help='Comma-separated times (s) of simulated falls')
+    p.add_argument('--trace', help='Replay accelerometer data from a .npz (t_ms, xyz)')
+    p.add_argument('--int-pin', type=int, help='GPIO wired to the MPU-6050 INT pin')
+    p.add_argument('--no-mpu', action='store_true', help='No MPU-6050 on the I2C bus')
+    p.add_argument('--keys', help='Serial input as "t:text,..." (t in s)')
+    p.add_argument('--adc', action='append', default=[], metavar='GPIO=VOLTS',
+                   help='Constant voltage on an ADC pin (repeatable)')
+    p.add_argument('--supply', metavar='GPIO[:DIP]',
+                   help='5 V rail through a divider on this ADC pin, dipping DIP volts per load pin turned on')
+    p.add_argument('--baud', type=int, help='Make print() block for the UART time at this baud rate')
+    p.add_argument('--stall', action='append', default=[], metavar='T:SECONDS',
+                   help='Host stops reading serial at T for SECONDS (repeatable)')
+    p.add_argument('--pin-log', help='Write every output pin transition to this CSV')
+    p.add_argument('--pwm-log', help='Write every PWM duty change to this CSV')
+    p.add_argument('--serial-out', help='Write the exact bytes the script sent to this file')
+    p.add_argument('--quiet', action='store_true', help="Don't echo the script's output")
+    args = p.parse_args()
+
+    devices = {}
+    if not args.no_mpu:
+        if args.trace:
+            d = np.load(args.trace)
+            source = from_trace(d['t_ms'], d['xyz'])
+        else:
+            source = still()
+        fall_s = [float(x) for x in args.falls.split(',')] if args.falls else []
+        if fall_s:
+            source = with_falls(fall_s, source)
+        devices[0x68] = MPU6050(source, args.int_pin)
+
+    adc = {}
+    for item in args.adc:
+        pin, volts = item.split('=')
+        adc[int(pin)] = (lambda v: lambda t_us: v)(float(volts))
+    if args.supply:
+        pin, _, dip = args.supply.partition(':')
+        adc[int(pin)] = Supply(dip=float(dip)) if dip else Supply()
+
+    raw = open(args.serial_out, 'wb') if args.serial_out else None
+    t0 = time.perf_counter()
+    try:
+        s = sim.run(args.script, args.duration, devices=devices,
+                    stdin=_keys(args.keys) if args.keys else (), adc=adc,
+                    overrides=dict(_override(x) for x in args.set),
+                    echo=not args.quiet, raw_out=raw, baud=args.baud,
+                    stalls=[tuple(float(v) for v in x.split(':')) for x in args.stall])
+    finally:
+        if raw:
+            raw.close()
+    wall = time.perf_counter() - t0
+    virt = s.finished_at_us / 1e6
+
+    print('-' * 60)
+    print(f'Simulated {virt:.1f} s in {wall:.2f} s wall ({virt / wall:.0f}x real time)')
+    print(f'{len(s.stdout.lines)} lines printed, {len(s.pin_log)} pin transitions'
+          + (f', {len(s.pwm_log)} PWM duty changes' if s.pwm_log else ''))
+    detected = [line.t_us / 1e6 for line in s.stdout.lines if line.text.strip() == 'FALL_DETECTED']
+    if not detected and args.serial_out:
+        # STREAM = "binary": events are frames; their device timestamps are virtual time
+        from telemetry import StreamDecoder
+        dec = StreamDecoder()
+        with open(args.serial_out, 'rb') as f:
+            dec.feed(f.read())
+        detected = [t / 1000 for t, name in dec.take_events() if name == 'FALL_DETECTED']
+    if args.falls or detected:
+        print(f'FALL_DETECTED at: {", ".join(f"{t:.3f}" for t in detected) or "-"} s')
+        if args.falls:
+            # with_falls() puts the impact 300 ms after the free-fall start
+            for f in (float(x) for x in args.falls.split(',')):
+                after = [t for t in detected if t >= f]
+                lat = f'{(after[0] - f - 0.3) * 1000:.1f} ms after impact' if after else 'missed'
+                print(f'  fall at {f:.3f} s: {lat}')
+
+    if args.keys and (s.pin_log or s.pwm_log):
+        # Key-to-GPIO latency: from each --keys entry arriving to the first
+        # output transition or duty change before the next entry, and to the
+        # last one (the outputs settled on what the entry asked for)
+        keys = sorted(_keys(args.keys))
+        changes = sorted([e.t_us for e in s.pin_log] + [e.t_us for e in s.pwm_log])
+        print('Key to pin/PWM latency (first change / settled):')
+        first_lat, settle_lat = [], []
+        for i, (t, text) in enumerate(keys):
+            t0 = int(t * 1e6)
+            t1 = int(keys[i + 1][0] * 1e6) if i + 1 < len(keys) else s.finished_at_us + 1
+            hits = [t_us for t_us in changes if t0 <= t_us < t1]
+            if not hits:
+                print(f'  {t:8.3f} s {text!r:>22}: no pin change')
+                continue
+            first_lat.append(hits[0] - t0)
+            settle_lat.append(hits[-1] - t0)
+            print(f'  {t:8.3f} s {text!r:>22}: {(hits[0] - t0) / 1000:7.3f} / {(hits[-1] - t0) / 1000:7.3f} ms')
+        if first_lat:
+            for name, lats in (('first change', first_lat), ('settled', settle_lat)):
+                print(f'  {name:>12} min/avg/max: {min(lats) / 1000:.3f} / '
+                      f'{sum(lats) / len(lats) / 1000:.3f} / {max(lats) / 1000:.3f} ms')
+
+    if args.pin_log:
+        with open(args.pin_log, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['t_us', 'pin', 'value'])
+            w.writerows(s.pin_log)
+        print(f'Pin log written to {args.pin_log}')
+    if args.pwm_log:
+        with open(args.pwm_log, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['t_us', 'pin', 'duty_u16'])
+            w.writerows(s.pwm_log)
+        print(f'PWM log written to {args.pwm_log}')
+
+
+if __name__ == '__main__':
+    main()
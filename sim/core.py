@@ -0,0 +1,314 @@
+"""
+Virtual device state shared by the shim modules in sim/shims.
+
+Everything the scripts observe runs on one virtual clock (microseconds).
+Nothing sleeps for real: sleep_ms(), poll timeouts, lightsleep() and I2C
+transfers just move the clock forward, firing Timer callbacks, scheduled
+functions and sensor interrupts on the way.
+"""
+
+import heapq
+import sys
+import threading
+import traceback
+from collections import namedtuple
+
+TICKS_PERIOD = 1 << 30          # MicroPython ticks_* wrap here
+TICK_COST_US = 1                # virtual CPU time charged per ticks_*() call
+SCHEDULE_DEPTH = 8              # micropython.schedule() queue length
+
+PinEvent = namedtuple('PinEvent', 't_us pin value')
+PwmEvent = namedtuple('PwmEvent', 't_us pin duty_u16')
+OutputLine = namedtuple('OutputLine', 't_us text')
+
+
+class SimulationEnd(BaseException):
+    """Raised from the clock once the run time is used up.
+
+    A BaseException so the scripts' own `except Exception` blocks let it through.
+    """
+
+
+class Clock:
+    def __init__(self, end_us):
+        self.now = 0
+        self.end = end_us
+        self._events = []
+        self._seq = 0
+        self._scheduled = []
+        self._in_scheduled = False
+
+    def at(self, t_us, callback):
+        """Run callback() when the clock reaches t_us."""
+        self._seq += 1
+        heapq.heappush(self._events, (t_us, self._seq, callback))
+
+    def next_event(self):
+        return self._events[0][0] if self._events else None
+
+    def advance(self, dt_us):
+        target = self.now + max(0, int(dt_us))
+        while self._events and self._events[0][0] <= target:
+            t, _, cb = heapq.heappop(self._events)
+            if t > self.now:
+                self.now = t
+            self._check_end()
+            cb()
+            self.run_scheduled()
+        if target > self.now:
+            self.now = target
+        self._check_end()
+
+    def advance_until(self, cond, timeout_us=None):
+        """Advance event by event until cond() is true or timeout_us passes."""
+        deadline = self.end if timeout_us is None else min(self.end, self.now + timeout_us)
+        while not cond():
+            nxt = self.next_event()
+            if nxt is None or nxt > deadline:
+                self.advance(deadline - self.now)
+                return cond()
+            self.advance(nxt - self.now)
+        return True
+
+    def schedule(self, func, arg):
+        if len(self._scheduled) >= SCHEDULE_DEPTH:
+            raise RuntimeError('schedule queue full')
+        self._scheduled.append((func, arg))
+
+    def run_scheduled(self):
+        # Like the firmware: scheduled callbacks never preempt each other
+        if self._in_scheduled:
+            return
+        self._in_scheduled = True
+        try:
+            while self._scheduled:
+                func, arg = self._scheduled.pop(0)
+                func(arg)
+        finally:
+            self._in_scheduled = False
+
+    def _check_end(self):
+        if self.now >= self.end:
+            raise SimulationEnd()
+
+
+class SimThread:
+    """A _thread thread, run one at a time against the virtual clock.
+
+    Each runs on a real OS thread, but only one of them (or the script's main
+    thread) executes at any moment: the others are parked in sleep_*() until
+    the clock reaches their wake-up time, which is when a GIL-holding
+    MicroPython thread would get the CPU back.
+    """
+
+    def __init__(self, sim, func, args, kwargs):
+        self.sim = sim
+        self.func, self.args, self.kwargs = func, args, kwargs
+        self._go = threading.Semaphore(0)
+        self._back = threading.Semaphore(0)
+        self.done = False
+        self.ended = False          # hit the end of the simulation
+        self.thread = threading.Thread(target=self._main, daemon=True)
+        self.thread.start()
+        sim.threads[self.thread.ident] = self
+        sim.clock.at(sim.clock.now, self._resume)
+
+    def _main(self):
+        self._go.acquire()
+        try:
+            if not self.sim.stopping:
+                self.func(*self.args, **self.kwargs)
+        except SimulationEnd:
+            self.ended = True
+        except SystemExit:
+            pass
+        except BaseException:
+            self.sim.stdout.write('Unhandled exception in thread started by %r\n' % self.func)
+            self.sim.stdout.write(traceback.format_exc())
+        finally:
+            self.done = True
+            self._back.release()
+
+    def _resume(self):
+        """Hand the CPU to this thread until it sleeps or exits."""
+        if self.done:
+            return
+        self._go.release()
+        self._back.acquire()
+        if self.ended:
+            raise SimulationEnd()
+
+    def sleep_us(self, us):
+        self.sim.clock.at(self.sim.clock.now + max(0, int(us)), self._resume)
+        self._back.release()
+        self._go.acquire()
+        if self.sim.stopping:
+            raise SimulationEnd()
+
+    def stop(self):
+        if not self.done:
+            self._go.release()
+            self._back.acquire()
+
+
+class VirtualStdin:
+    """sys.stdin stand-in fed from a script of (t_seconds, text) entries."""
+
+    def __init__(self, sim, script=()):
+        self.sim = sim
+        self._buf = ''
+        self._queue = sorted((int(t * 1e6), text) for t, text in script)
+        for t_us, text in self._queue:
+            sim.clock.at(t_us, lambda text=text: self._arrive(text))
+
+    def _arrive(self, text):
+        self._buf += text
+
+    def readable_now(self):
+        return bool(self._buf)
+
+    def feed(self, text):
+        """Inject input at the current virtual time."""
+        self._buf += text
+
+    def read(self, n=-1):
+        self.sim.clock.advance_until(lambda: self._buf)
+        if n is None or n < 0:
+            n = len(self._buf)
+        out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+    def readline(self):
+        self.sim.clock.advance_until(lambda: '\n' in self._buf)
+        i = self._buf.index('\n') + 1
+        out, self._buf = self._buf[:i], self._buf[i:]
+        return out
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        raise OSError('virtual stdin has no file descriptor')
+
+
+class _Bytes:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, data):
+        self.out.write_bytes(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class VirtualStdout:
+    """Captures what the script prints, stamped with virtual time."""
+
+    def __init__(self, sim, echo=True, raw=None, baud=None, stalls=()):
+        self.sim = sim
+        self.echo = echo
+        self.raw = raw              # optional binary file for the exact serial bytes
+        self.baud = baud            # if set, writes block for the UART transmit time
+        self.stalls = [(int(t * 1e6), int((t + d) * 1e6)) for t, d in stalls]
+        self.lines = []
+        self._partial = ''
+        self.buffer = _Bytes(self)
+
+    def _transmit(self, nbytes):
+        """Block the writer like a full UART TX buffer would."""
+        sim = self.sim
+        for t0, t1 in self.stalls:
+            # Host stopped reading: the write can't finish before the stall ends
+            if t0 <= sim.clock.now < t1:
+                sim.sleep_us(t1 - sim.clock.now)
+        if self.baud:
+            sim.sleep_us(nbytes * 10e6 / self.baud)
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        if self.raw:
+            self.raw.write(data)
+        self._transmit(len(data))
+        self._partial += text
+        while '\n' in self._partial:
+            line, self._partial = self._partial.split('\n', 1)
+            self.lines.append(OutputLine(self.sim.clock.now, line))
+            if self.echo:
+                sys.__stdout__.write(f'[{self.sim.clock.now / 1e6:10.3f}] {line}\n')
+        return len(text)
+
+    def write_bytes(self, data):
+        if self.raw:
+            self.raw.write(data)
+        self._transmit(len(data))
+
+    def flush(self):
+        pass
+
+
+class Simulation:
+    """One simulated board: clock, GPIO levels, I2C devices, stdin/stdout."""
+
+    def __init__(self, duration_s, stdin_script=(), echo=True, raw_out=None, baud=None, stalls=()):
+        self.clock = Clock(int(duration_s * 1e6))
+        self.gpio = {}              # pin number -> level
+        self.pin_log = []           # every output transition as PinEvent
+        self.pwm = {}               # pin number -> duty_u16 of its PWM channel
+        self.pwm_log = []           # every duty change as PwmEvent
+        self.irqs = {}              # pin number -> (trigger mask, handler, pin object)
+        self.i2c_devices = {}       # address -> device model
+        self.adc_sources = {}       # pin number -> f(t_us) -> volts
+        self.wake_ext0 = None       # (pin number, level) for lightsleep wake
+        self.threads = {}           # OS thread ident -> SimThread
+        self.stopping = False
+        self.stdin = VirtualStdin(self, stdin_script)
+        self.stdout = VirtualStdout(self, echo, raw_out, baud, stalls)
+
+    def sleep_us(self, us):
+        """Block the calling script thread for us of virtual time."""
+        t = self.threads.get(threading.get_ident())
+        if t:
+            t.sleep_us(us)
+        else:
+            self.clock.advance(us)
+
+    def stop_threads(self):
+        self.stopping = True
+        for t in list(self.threads.values()):
+            t.stop()
+
+    def set_level(self, pin, value, log=True):
+        """Drive a GPIO level, logging it and firing any registered IRQ."""
+        value = 1 if value else 0
+        old = self.gpio.get(pin, 0)
+        self.gpio[pin] = value
+        if value == old:
+            return
+        if log:
+            self.pin_log.append(PinEvent(self.clock.now, pin, value))
+        irq = self.irqs.get(pin)
+        if irq:
+            trigger, handler, obj = irq
+            if (value and trigger & 1) or (not value and trigger & 2):
+                handler(obj)
+
+    def set_duty(self, pin, duty_u16):
+        """Set a PWM channel's duty cycle, logging the change."""
+        if self.pwm.get(pin) != duty_u16:
+            self.pwm[pin] = duty_u16
+            self.pwm_log.append(PwmEvent(self.clock.now, pin, duty_u16))
+
+    def add_i2c_device(self, addr, device):
+        self.i2c_devices[addr] = device
+        device.attach(self)
+
+
+SIM = None
+
+
+def current():
+    if SIM is None:
+        raise RuntimeError('no simulation running (use sim.run())')
+    return SIM
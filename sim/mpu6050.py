@@ -0,0 +1,214 @@
+"""
+Register-level MPU-6050 model for the simulator.
+
+Covers what the repo's scripts touch: ACCEL_XOUT..ZOUT, PWR_MGMT_1,
+ACCEL_CONFIG, the sample-rate divider and FIFO (SMPLRT_DIV, CONFIG, FIFO_EN,
+USER_CTRL, FIFO_COUNT, FIFO_R_W, FIFO overflow), and the free-fall / motion
+interrupts on the INT pin (FF_THR/FF_DUR, MOT_THR/MOT_DUR, INT_PIN_CFG,
+INT_ENABLE, INT_STATUS). Accelerometer data comes from a source function
+f(t_us) -> (x, y, z) raw LSB at +/-2g.
+"""
+
+import numpy as np
+
+FIFO_SIZE = 1024
+MG_PER_LSB = 1000.0 / 16384
+
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+ACCEL_CONFIG = 0x1C
+FF_THR = 0x1D
+FF_DUR = 0x1E
+MOT_THR = 0x1F
+MOT_DUR = 0x20
+FIFO_EN = 0x23
+INT_PIN_CFG = 0x37
+INT_ENABLE = 0x38
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNT_H = 0x72
+FIFO_COUNT_L = 0x73
+FIFO_R_W = 0x74
+WHO_AM_I = 0x75
+
+FF_INT = 0x80
+MOT_INT = 0x40
+FIFO_OFLOW_INT = 0x10
+
+
+def _clip(v):
+    return int(max(-32768, min(32767, round(v))))
+
+
+def still(noise_lsb=300, seed=0):
+    """Lying flat: 1 g on Z plus Gaussian noise (a new value every ms, repeating every 4 s)."""
+    rng = np.random.default_rng(seed)
+    noise = np.clip(np.rint(rng.normal(0, noise_lsb, (4096, 3))) + (0, 0, 16384),
+                    -32768, 32767).astype(int).tolist()
+    return lambda t_us: noise[(t_us // 1000) & 4095]
+
+
+def with_falls(fall_times_s, base=None, free_fall_ms=300, impact_ms=30):
+    """base plus falls: free_fall_ms near 0 g, then impact_ms at ~2.6 g, at each time.
+
+    fall_times_s are when the free-fall begins; the impact follows free_fall_ms later.
+    """
+    base = base or still()
+    spans = [(int(t * 1e6), int(t * 1e6) + free_fall_ms * 1000,
+              int(t * 1e6) + (free_fall_ms + impact_ms) * 1000) for t in fall_times_s]
+
+    def source(t_us):
+        for t0, t1, t2 in spans:
+            if t0 <= t_us < t1:
+                return (200, -150, 500)
+            if t1 <= t_us < t2:
+                return (25000, -25000, 25000)
+        return base(t_us)
+    return source
+
+
+def from_trace(t_ms, xyz, offset_s=0.0):
+    """Replay a recorded trace (t_ms, xyz raw LSB), holding each sample until the next."""
+    t_us = (np.asarray(t_ms, dtype=np.float64) - t_ms[0]) * 1000 + offset_s * 1e6
+    xyz = np.asarray(xyz)
+
+    def source(t):
+        i = max(0, int(np.searchsorted(t_us, t, 'right')) - 1)
+        return tuple(int(v) for v in xyz[min(i, len(xyz) - 1)])
+    return source
+
+
+class MPU6050:
+    def __init__(self, source=None, int_pin=None):
+        self.source = source or still()
+        self.int_pin = int_pin      # ESP32 GPIO wired to INT, if any
+        self.regs = bytearray(128)
+        self.regs[PWR_MGMT_1] = 0x40        # asleep after power-on
+        self.regs[WHO_AM_I] = 0x68
+        self.fifo = bytearray()
+        self.sim = None
+        self._next_sample = None
+        self._ff_ms = 0
+        self._mot_ms = 0
+        self._baseline = None
+        self._int_tick_armed = False
+
+    def attach(self, sim):
+        self.sim = sim
+
+    # -- I2C interface -------------------------------------------------------
+
+    def write(self, reg, data):
+        self._catch_up()
+        for i, v in enumerate(data):
+            self._write_reg(reg + i, v)
+
+    def read(self, reg, n):
+        self._catch_up()
+        if reg == FIFO_R_W:
+            out = bytes(self.fifo[:n]).ljust(n, b'\x00')
+            del self.fifo[:n]
+            return out
+        out = bytearray()
+        for r in range(reg, reg + n):
+            out.append(self._read_reg(r))
+        return bytes(out)
+
+    # -- registers -----------------------------------------------------------
+
+    def _write_reg(self, reg, v):
+        if reg == USER_CTRL:
+            if v & 0x04:
+                self.fifo.clear()
+                v &= ~0x04
+            was_on = self.regs[USER_CTRL] & 0x40
+            self.regs[reg] = v
+            if v & 0x40 and not was_on:
+                self._next_sample = self.sim.clock.now + self._period_us()
+            return
+        self.regs[reg] = v
+        if reg in (INT_ENABLE, INT_PIN_CFG):
+            self._arm_int_tick()
+
+    def _read_reg(self, reg):
+        if ACCEL_XOUT_H <= reg < ACCEL_XOUT_H + 6:
+            x, y, z = self.source(self.sim.clock.now)
+            raw = b''.join(int(v).to_bytes(2, 'big', signed=True) for v in (x, y, z))
+            return raw[reg - ACCEL_XOUT_H]
+        if reg == FIFO_COUNT_H:
+            return len(self.fifo) >> 8
+        if reg == FIFO_COUNT_L:
+            return len(self.fifo) & 0xFF
+        if reg == INT_STATUS:
+            v = self.regs[INT_STATUS]
+            self.regs[INT_STATUS] = 0
+            self._update_int_pin()
+            return v
+        return self.regs[reg]
+
+    # -- FIFO ----------------------------------------------------------------
+
+    def _period_us(self):
+        dlpf = self.regs[CONFIG] & 0x07
+        base = 1000 if 0 < dlpf < 7 else 8000
+        return 1e6 * (1 + self.regs[SMPLRT_DIV]) / base
+
+    def _catch_up(self):
+        """Push every sample the FIFO would have taken since the last access."""
+        if not (self.regs[USER_CTRL] & 0x40 and self.regs[FIFO_EN] & 0x08):
+            return
+        now = self.sim.clock.now
+        period = self._period_us()
+        while self._next_sample is not None and self._next_sample <= now:
+            x, y, z = self.source(int(self._next_sample))
+            self.fifo += b''.join(int(v).to_bytes(2, 'big', signed=True) for v in (x, y, z))
+            if len(self.fifo) > FIFO_SIZE:
+                # The oldest bytes are overwritten, which breaks 6-byte alignment
+                del self.fifo[:len(self.fifo) - FIFO_SIZE]
+                self._latch(FIFO_OFLOW_INT)
+            self._next_sample += period
+
+    # -- interrupts ----------------------------------------------------------
+
+    def _arm_int_tick(self):
+        if self._int_tick_armed or not (self.regs[INT_ENABLE] & (FF_INT | MOT_INT)):
+            return
+        self._int_tick_armed = True
+        self.sim.clock.at(self.sim.clock.now + 1000, self._int_tick)
+
+    def _int_tick(self):
+        """1 kHz free-fall / motion detection, like the sensor's own logic."""
+        self._int_tick_armed = False
+        en = self.regs[INT_ENABLE]
+        if not en & (FF_INT | MOT_INT):
+            return
+        a = [v * MG_PER_LSB for v in self.source(self.sim.clock.now)]
+        if en & FF_INT:
+            thr = self.regs[FF_THR] * 2
+            self._ff_ms = self._ff_ms + 1 if all(abs(v) < thr for v in a) else 0
+            if self._ff_ms >= max(1, self.regs[FF_DUR]):
+                self._latch(FF_INT)
+        if en & MOT_INT:
+            if self._baseline is None:
+                self._baseline = a
+            hp = [v - b for v, b in zip(a, self._baseline)]
+            # ~5 Hz high-pass, like the ACCEL_HPF setting used for wake
+            self._baseline = [b + (v - b) / 32 for v, b in zip(a, self._baseline)]
+            thr = self.regs[MOT_THR] * 2
+            self._mot_ms = self._mot_ms + 1 if any(abs(v) > thr for v in hp) else 0
+            if self._mot_ms >= max(1, self.regs[MOT_DUR]):
+                self._latch(MOT_INT)
+        self._arm_int_tick()
+
+    def _latch(self, bit):
+        self.regs[INT_STATUS] |= bit
+        self._update_int_pin()
+
+    def _update_int_pin(self):
+        if self.int_pin is None:
+            return
+        active = bool(self.regs[INT_STATUS] & self.regs[INT_ENABLE])
+        active_low = self.regs[INT_PIN_CFG] & 0x80
+        self.sim.set_level(self.int_pin, (not active) if active_low else active, log=False)
@@ -0,0 +1,61 @@
+"""Simulated `_thread`: threads take turns on the virtual clock (see core.SimThread)."""
+
+import threading
+
+from sim import core
+
+_stack_size = 4096
+
+
+def start_new_thread(func, args, kwargs=None):
+    t = core.SimThread(core.current(), func, args, kwargs or {})
+    return t.thread.ident
+
+
+def get_ident():
+    return threading.get_ident()
+
+
+def stack_size(size=None):
+    global _stack_size
+    old = _stack_size
+    if size is not None:
+        _stack_size = size
+    return old
+
+
+def exit():
+    raise SystemExit
+
+
+class LockType:
+    def __init__(self):
+        self._locked = False
+
+    def acquire(self, waitflag=1, timeout=-1):
+        sim = core.current()
+        deadline = None if timeout is None or timeout < 0 else sim.clock.now + int(timeout * 1e6)
+        while self._locked:
+            if not waitflag or (deadline is not None and sim.clock.now >= deadline):
+                return False
+            # Nothing else runs until this thread blocks, so give the holder a turn
+            sim.sleep_us(100)
+        self._locked = True
+        return True
+
+    def release(self):
+        if not self._locked:
+            raise RuntimeError('release unlocked lock')
+        self._locked = False
+
+    def locked(self):
+        return self._locked
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def allocate_lock():
+    return LockType()
@@ -0,0 +1,18 @@
+"""Simulated `esp32` module: ext0 wake source for lightsleep()."""
+
+from sim import core
+
+WAKEUP_ALL_LOW = False
+WAKEUP_ANY_HIGH = True
+
+
+def wake_on_ext0(pin, level):
+    core.current().wake_ext0 = None if pin is None else (pin.id, level)
+
+
+def wake_on_ext1(pins, level):
+    pass
+
+
+def raw_temperature():
+    return 120
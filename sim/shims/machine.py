@@ -0,0 +1,347 @@
+"""Simulated `machine` module: Pin, PWM, I2C/SoftI2C, ADC, Timer, UART, mem32, sleep and idle."""
+
+from sim import core
+
+I2C_OVERHEAD_US = 40            # MicroPython call + driver overhead per transfer
+ADC_READ_US = 20
+PIN_WRITE_US = 4                # Pin.value()/on()/off() as a MicroPython call at 240 MHz
+MEM32_US = 1.5                  # one machine.mem32[addr] load or store
+PWM_WRITE_US = 8                # PWM.duty_u16(): LEDC duty register update
+
+# GPIO registers modelled by mem32 (pins 0-31 only)
+GPIO_OUT_REG = 0x3FF44004
+GPIO_OUT_W1TS_REG = 0x3FF44008
+GPIO_OUT_W1TC_REG = 0x3FF4400C
+GPIO_IN_REG = 0x3FF4403C
+
+
+def _sim():
+    return core.current()
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_DOWN = 1
+    PULL_UP = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        sim = _sim()
+        if v is None:
+            return sim.gpio.get(self.id, 1 if self.pull == Pin.PULL_UP else 0)
+        if self.mode in (Pin.OUT, Pin.OPEN_DRAIN):
+            sim.clock.advance(PIN_WRITE_US)
+            sim.set_level(self.id, v)
+        else:
+            sim.set_level(self.id, v, log=False)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING, hard=False, **kwargs):
+        sim = _sim()
+        if handler is None:
+            sim.irqs.pop(self.id, None)
+        else:
+            sim.irqs[self.id] = (trigger, handler, self)
+
+    def __repr__(self):
+        return f'Pin({self.id})'
+
+
+class PWM:
+    """LEDC channel on a pin. Duty changes go to Simulation.pwm_log at the time
+    of the call; the hardware latches them at the end of the current period."""
+
+    def __init__(self, dest, freq=5000, duty_u16=None, duty=None):
+        self.pin = dest.id if isinstance(dest, Pin) else dest
+        self._freq = freq
+        self._duty = 0
+        if duty is not None:
+            self.duty(duty)
+        else:
+            self.duty_u16(duty_u16 or 0)
+
+    def init(self, freq=None, duty_u16=None, duty=None):
+        if freq is not None:
+            self._freq = freq
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+        elif duty is not None:
+            self.duty(duty)
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        sim = _sim()
+        sim.clock.advance(PWM_WRITE_US)
+        self._duty = max(0, min(65535, int(d)))
+        sim.set_duty(self.pin, self._duty)
+
+    def duty(self, d=None):
+        # 10-bit duty, the older esp32 API
+        if d is None:
+            return self._duty * 1023 // 65535
+        self.duty_u16(int(d) * 65535 // 1023)
+
+    def deinit(self):
+        self.duty_u16(0)
+
+
+class I2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+
+    def _device(self, addr):
+        dev = _sim().i2c_devices.get(addr)
+        if dev is None:
+            _sim().clock.advance(I2C_OVERHEAD_US)
+            raise OSError(19, 'ENODEV')
+        return dev
+
+    def _bus_time(self, nbytes):
+        # 9 clocks per byte (with ACK) plus address byte(s)
+        _sim().clock.advance(I2C_OVERHEAD_US + (nbytes + 2) * 9 * 1e6 / self.freq)
+
+    def scan(self):
+        return sorted(_sim().i2c_devices)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._device(addr).write(memaddr, bytes(buf))
+        self._bus_time(len(buf) + 1)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        data = self._device(addr).read(memaddr, nbytes)
+        self._bus_time(nbytes + 2)
+        return data
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+        self._bus_time(len(buf) + 2)
+
+    def writeto(self, addr, buf, stop=True):
+        buf = bytes(buf)
+        dev = self._device(addr)
+        if len(buf) > 1:
+            dev.write(buf[0], buf[1:])
+        self._pointer = buf[0] if buf else 0
+        self._bus_time(len(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        data = self._device(addr).read(getattr(self, '_pointer', 0), nbytes)
+        self._bus_time(nbytes)
+        return data
+
+
+SoftI2C = I2C
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    WIDTH_9BIT = 0
+    WIDTH_10BIT = 1
+    WIDTH_11BIT = 2
+    WIDTH_12BIT = 3
+
+    _FULL_SCALE = {0: 0.95, 1: 1.25, 2: 1.75, 3: 3.3}
+
+    def __init__(self, pin, atten=ATTN_0DB):
+        self.pin = pin.id if isinstance(pin, Pin) else pin
+        self._atten = atten
+        self._bits = 12
+
+    def atten(self, a):
+        self._atten = a
+
+    def width(self, w):
+        self._bits = 9 + w
+
+    def _volts(self):
+        sim = _sim()
+        src = sim.adc_sources.get(self.pin)
+        v = src(sim.clock.now) if src else 0.0
+        sim.clock.advance(ADC_READ_US)
+        return max(0.0, min(v, self._FULL_SCALE[self._atten]))
+
+    def read(self):
+        return int(self._volts() / self._FULL_SCALE[self._atten] * ((1 << self._bits) - 1))
+
+    def read_u16(self):
+        return int(self._volts() / self._FULL_SCALE[self._atten] * 65535)
+
+    def read_uv(self):
+        return int(self._volts() * 1e6)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self._gen = 0
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None, **kwargs):
+        self._gen += 1
+        if freq > 0:
+            self._period_us = int(1e6 / freq)
+        else:
+            self._period_us = int(period) * 1000
+        self._mode = mode
+        self._callback = callback
+        self._arm(_sim().clock.now + self._period_us, self._gen)
+
+    def _arm(self, t_us, gen):
+        _sim().clock.at(t_us, lambda: self._fire(t_us, gen))
+
+    def _fire(self, t_us, gen):
+        if gen != self._gen:
+            return
+        if self._mode == Timer.PERIODIC:
+            self._arm(t_us + self._period_us, gen)
+        if self._callback:
+            self._callback(self)
+
+    def deinit(self):
+        self._gen += 1
+
+
+class _Mem32:
+    """machine.mem32: the GPIO output/input registers act on the simulated pins,
+    every write to a register bank changing its pins at the same instant."""
+
+    def __init__(self):
+        self.regs = {}
+
+    def __getitem__(self, addr):
+        sim = _sim()
+        sim.clock.advance(MEM32_US)
+        if addr in (GPIO_OUT_REG, GPIO_IN_REG):
+            return sum(1 << p for p, v in sim.gpio.items() if v and 0 <= p < 32)
+        return self.regs.get(addr, 0)
+
+    def __setitem__(self, addr, value):
+        sim = _sim()
+        sim.clock.advance(MEM32_US)
+        value &= 0xFFFFFFFF
+        if addr == GPIO_OUT_REG:
+            for p in range(32):
+                if value >> p & 1 or p in sim.gpio:
+                    sim.set_level(p, value >> p & 1)
+        elif addr == GPIO_OUT_W1TS_REG:
+            for p in range(32):
+                if value >> p & 1:
+                    sim.set_level(p, 1)
+        elif addr == GPIO_OUT_W1TC_REG:
+            for p in range(32):
+                if value >> p & 1:
+                    sim.set_level(p, 0)
+        else:
+            self.regs[addr] = value
+
+
+mem32 = _Mem32()
+
+
+class UART:
+    """UART(0) is the REPL/stdout link: re-init changes the modelled baud rate."""
+
+    def __init__(self, id, baudrate=115200, **kwargs):
+        self.id = id
+        self.init(baudrate, **kwargs)
+
+    def init(self, baudrate=115200, **kwargs):
+        self.baudrate = baudrate
+        out = _sim().stdout
+        # Only retime the link when the run models one (--baud)
+        if self.id == 0 and out.baud:
+            out.baud = baudrate
+
+    def write(self, buf):
+        _sim().stdout.write_bytes(bytes(buf))
+        return len(buf)
+
+    def flush(self):
+        pass                        # writes already block for their transmit time
+
+
+def _ext0_active():
+    sim = _sim()
+    if not sim.wake_ext0:
+        return False
+    pin, level = sim.wake_ext0
+    return bool(sim.gpio.get(pin, 0)) == bool(level)
+
+
+def lightsleep(time_ms=None):
+    clock = _sim().clock
+    clock.advance_until(_ext0_active, None if time_ms is None else time_ms * 1000)
+
+
+def deepsleep(time_ms=None):
+    raise core.SimulationEnd()
+
+
+def idle():
+    # Returns on the next interrupt; at worst the 100 Hz FreeRTOS tick
+    clock = _sim().clock
+    nxt = clock.next_event()
+    clock.advance(10000 if nxt is None else min(10000, max(1, nxt - clock.now)))
+
+
+def reset():
+    raise core.SimulationEnd()
+
+
+def soft_reset():
+    raise core.SimulationEnd()
+
+
+def freq(hz=None):
+    return 240000000 if hz is None else None
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x00\x00\x01'
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
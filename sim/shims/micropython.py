@@ -0,0 +1,50 @@
+"""Simulated `micropython` module: code emitters are no-ops, schedule() is virtual."""
+
+from sim import core
+
+
+def const(x):
+    return x
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def schedule(func, arg):
+    core.current().clock.schedule(func, arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0 if level is None else None
+
+
+def mem_info(verbose=False):
+    print('mem: simulated')
+
+
+def qstr_info(verbose=False):
+    pass
+
+
+def stack_use():
+    return 0
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def kbd_intr(chr):
+    pass
@@ -0,0 +1,50 @@
+"""Simulated `uselect`: poll() on the virtual stdin waits in virtual time."""
+
+from sim import core
+
+POLLIN = 0x001
+POLLOUT = 0x004
+POLLERR = 0x008
+POLLHUP = 0x010
+
+
+class _Poll:
+    def __init__(self):
+        self._objs = {}
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        self._objs[id(obj)] = (obj, eventmask)
+
+    def unregister(self, obj):
+        self._objs.pop(id(obj), None)
+
+    def modify(self, obj, eventmask):
+        self._objs[id(obj)] = (obj, eventmask)
+
+    def _ready(self):
+        sim = core.current()
+        out = []
+        for obj, mask in self._objs.values():
+            ev = 0
+            if mask & POLLIN and obj is sim.stdin and sim.stdin.readable_now():
+                ev |= POLLIN
+            if mask & POLLOUT and obj is not sim.stdin:
+                ev |= POLLOUT
+            if ev:
+                out.append((obj, ev))
+        return out
+
+    def poll(self, timeout=-1):
+        ready = self._ready()
+        if ready or timeout == 0:
+            return ready
+        core.current().clock.advance_until(lambda: bool(self._ready()),
+                                           None if timeout < 0 else timeout * 1000)
+        return self._ready()
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
+
+
+def poll():
+    return _Poll()
@@ -0,0 +1,43 @@
+"""
+Supply rail model for the simulator: the 5 V rail sagging under the L298N.
+
+Feeds an ADC pin through a divider, as check_power.py expects it wired. Every
+load pin that goes high is a current step: the rail dips by `dip` volts at
+once and recovers with time constant tau_ms, down to a steady droop of
+`droop` volts for each load pin that stays high.
+
+    python3 -m sim check_power.py --supply 34          # 0.1 V dip per pin
+    python3 -m sim check_power.py --supply 34:0.3      # a weaker supply
+"""
+
+import math
+
+from sim import core
+
+
+class Supply:
+    def __init__(self, nominal=5.0, divider=3.2, load_pins=(5, 18, 19, 23),
+                 dip=0.1, droop=0.02, tau_ms=8.0):
+        self.nominal = nominal
+        self.divider = divider
+        self.load_pins = set(load_pins)
+        self.dip = dip
+        self.droop = droop
+        self.tau_us = tau_ms * 1000
+
+    def rail(self, t_us):
+        """Rail volts at t_us (the current time or just before it)."""
+        sim = core.current()
+        high = sum(1 for p in self.load_pins if sim.gpio.get(p))
+        v = self.nominal - self.droop * high
+        for e in reversed(sim.pin_log):
+            age = t_us - e.t_us
+            if age > 10 * self.tau_us:
+                break
+            if e.value and e.pin in self.load_pins and age >= 0:
+                v -= (self.dip - self.droop) * math.exp(-age / self.tau_us)
+        return v
+
+    def __call__(self, t_us):
+        """Volts at the ADC pin."""
+        return self.rail(t_us) / self.divider
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Binary telemetry decoder for the fall detector (main.py / fall_detector.ino
+with STREAM set to binary).
+
+Frame layout, as written by the device:
+    0x00, COBS(type u8, seq u8, body..., crc16 u16 LE), 0x00
+
+crc16 is CRC-16/CCITT-FALSE over type..body. Bodies are little endian:
+    FRAME_SAMPLES  t0_ms u32, t1_ms u32, n u8, enc u8, samples
+                   enc 0: n * (x, y, z) int16 big endian (raw MPU-6050 order)
+                   enc 1: first sample as enc 0, then (n-1) * (dx, dy, dz) int8
+    FRAME_EVENT    t_ms u32, code u8
+    FRAME_SNAPSHOT event t_ms u32, offset u16, total u16, n u8,
+                   n * (dt_ms, x, y, z) int16 big endian, dt_ms relative to the event
+
+Times are device ticks in ms, wrapping at 2**30. Anything between delimiters
+that is not a valid frame but looks like text (boot banner, stats lines) is
+kept as text instead of being counted as corruption, so the decoder also
+works on a text-mode device that only sends frames for snapshots.
+
+Usage as a library:
+    dec = StreamDecoder()
+    dec.feed(ser.read(4096))
+    t_ms, xyz = dec.take_samples()     # float64 (N,), int16 (N, 3)
+    for t, name in dec.take_events(): ...
+    for snap in dec.take_snapshots(): ...  # Snapshot(event_t_ms, t_ms, xyz, complete)
+
+Usage from the command line:
+    python3 telemetry.py /dev/cu.usbserial-0001 [--save out.npz] [--fast] [-b auto]
+
+Requires: pip install numpy pyserial
+"""
+
+import binascii
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+FRAME_SAMPLES = 0x01
+FRAME_EVENT = 0x02
+FRAME_SNAPSHOT = 0x03
+
+EVENT_NAMES = {
+    1: 'FREE_FALL_START',
+    2: 'FALL_DETECTED',
+    3: 'FREE_FALL_TIMEOUT',
+}
+
+TICKS_PERIOD = 1 << 30
+LSB_PER_G = 16384.0
+
+_SAMPLES_HDR = struct.Struct('<IIBB')
+_EVENT_BODY = struct.Struct('<IB')
+_SNAPSHOT_HDR = struct.Struct('<IHHB')
+
+# A pre/post window around FALL_DETECTED; complete is False if chunks were lost
+Snapshot = namedtuple('Snapshot', 'event_t_ms t_ms xyz complete')
+
+
+def crc16(data) -> int:
+    """CRC-16/CCITT-FALSE, the same as the device's _crc16()."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def cobs_decode(data) -> bytes:
+    """Decode one COBS block (without delimiters). Raises ValueError if malformed."""
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        code = data[i]
+        if code == 0:
+            raise ValueError('zero byte inside COBS block')
+        end = i + code
+        if end > n + 1:
+            raise ValueError('COBS block overruns data')
+        out += data[i + 1:end]
+        i = end
+        if code != 0xFF and i < n:
+            out.append(0)
+    return bytes(out)
+
+
+_CONTROL = bytes(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _is_text(data) -> bool:
+    """Text lines never carry control bytes; every frame does (its type byte)."""
+    data = bytes(data)
+    return bool(data) and len(data.translate(None, _CONTROL)) == len(data)
+
+
+class StreamDecoder:
+    """Incremental decoder: feed() raw serial bytes, take_*() decoded data."""
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._t = []
+        self._xyz = []
+        self._events = []
+        self._text = []
+        self._snaps = []
+        self._snap = None
+        self._last_tick = None
+        self._epoch = 0
+        self._last_seq = None
+        self.frames = 0
+        self.samples = 0
+        self.crc_errors = 0
+        self.dropped_frames = 0
+
+    def feed(self, data) -> None:
+        if not data:
+            return
+        self._pending += data
+        end = self._pending.rfind(b'\x00')
+        if end >= 0:
+            chunks = bytes(self._pending[:end]).split(b'\x00')
+            del self._pending[:end + 1]
+            for chunk in chunks:
+                if chunk:
+                    self._chunk(chunk)
+        # Complete text lines after the last delimiter don't need to wait for it
+        nl = self._pending.rfind(b'\n')
+        if nl >= 0 and _is_text(self._pending[:nl + 1]):
+            self._add_text(self._pending[:nl + 1])
+            del self._pending[:nl + 1]
+
+    def take_samples(self):
+        """All samples decoded so far as (t_ms float64 (N,), xyz int16 (N, 3))."""
+        if not self._t:
+            return np.empty(0), np.empty((0, 3), dtype=np.int16)
+        t = np.concatenate(self._t)
+        xyz = np.concatenate(self._xyz)
+        self._t.clear()
+        self._xyz.clear()
+        return t, xyz
+
+    def take_events(self):
+        """Events decoded so far as [(t_ms, name), ...]."""
+        ev, self._events = self._events, []
+        return ev
+
+    def take_text(self):
+        """Text lines seen between frames."""
+        text, self._text = self._text, []
+        return text
+
+    def take_snapshots(self):
+        """Event snapshots whose last chunk has arrived, as [Snapshot, ...]."""
+        snaps, self._snaps = self._snaps, []
+        return snaps
+
+    def _unwrap(self, tick: int) -> int:
+        if self._last_tick is not None and tick < self._last_tick - TICKS_PERIOD // 2:
+            self._epoch += TICKS_PERIOD
+        self._last_tick = tick
+        return tick + self._epoch
+
+    def _chunk(self, chunk: bytes) -> None:
+        try:
+            frame = cobs_decode(chunk)
+        except ValueError:
+            frame = b''
+        if len(frame) < 4 or crc16(frame[:-2]) != int.from_bytes(frame[-2:], 'little'):
+            if _is_text(chunk):
+                self._add_text(chunk)
+            else:
+                self.crc_errors += 1
+            return
+
+        ftype, seq = frame[0], frame[1]
+        if self._last_seq is not None:
+            self.dropped_frames += (seq - self._last_seq - 1) & 0xFF
+        self._last_seq = seq
+        self.frames += 1
+        body = frame[2:-2]
+
+        if ftype == FRAME_SAMPLES:
+            self._samples(body)
+        elif ftype == FRAME_EVENT:
+            t, code = _EVENT_BODY.unpack_from(body)
+            self._events.append((float(self._unwrap(t)), EVENT_NAMES.get(code, f'EVENT_{code}')))
+        elif ftype == FRAME_SNAPSHOT:
+            self._snapshot(body)
+
+    def _add_text(self, data) -> None:
+        for line in bytes(data).decode('utf-8', errors='replace').splitlines():
+            if line.strip():
+                self._text.append(line.strip())
+
+    def _snapshot(self, body: bytes) -> None:
+        ev_t, off, total, n = _SNAPSHOT_HDR.unpack_from(body)
+        rec = np.frombuffer(body, dtype='>i2', offset=_SNAPSHOT_HDR.size, count=4 * n).reshape(n, 4)
+        snap = self._snap
+        if snap is not None and snap['ev_t'] != ev_t:
+            self._finish_snapshot()
+            snap = None
+        if snap is None:
+            snap = self._snap = {'ev_t': ev_t, 'total': total, 'parts': {}}
+        snap['parts'][off] = rec
+        if off + n >= total:
+            self._finish_snapshot()
+
+    def _finish_snapshot(self) -> None:
+        snap, self._snap = self._snap, None
+        parts = [snap['parts'][k] for k in sorted(snap['parts'])]
+        rec = np.concatenate(parts)
+        ev_t = float(self._unwrap(snap['ev_t']))
+        self._snaps.append(Snapshot(ev_t, ev_t + rec[:, 0].astype(np.float64),
+                                    rec[:, 1:].astype(np.int16), len(rec) == snap['total']))
+
+    def _samples(self, body: bytes) -> None:
+        t0, t1, n, enc = _SAMPLES_HDR.unpack_from(body)
+        data = body[_SAMPLES_HDR.size:]
+        if enc == 0:
+            xyz = np.frombuffer(data, dtype='>i2', count=3 * n).reshape(n, 3)
+        else:
+            first = np.frombuffer(data, dtype='>i2', count=3).astype(np.int32)
+            deltas = np.frombuffer(data, dtype=np.int8, offset=6, count=3 * (n - 1)).reshape(n - 1, 3)
+            xyz = np.empty((n, 3), dtype=np.int32)
+            xyz[0] = first
+            np.cumsum(deltas, axis=0, dtype=np.int32, out=xyz[1:])
+            xyz[1:] += first
+        t0 = self._unwrap(t0)
+        t1 = t0 + ((t1 - t0) % TICKS_PERIOD)
+        self._t.append(np.linspace(t0, t1, n))
+        self._xyz.append(xyz.astype(np.int16))
+        self.samples += n
+
+
+def main():
+    import argparse
+
+    import serial
+
+    from baudlink import baud_arg, open_link
+
+    parser = argparse.ArgumentParser(description='Decode binary fall-detector telemetry')
+    parser.add_argument('port', help='Serial port (e.g., /dev/cu.usbserial-0001)')
+    parser.add_argument('-b', '--baud', type=baud_arg, default=115200,
+                        help="Baud rate, or 'auto' to detect it (default: 115200)")
+    parser.add_argument('--fast', action='store_true', help='Negotiate a faster link (baudlink.py)')
+    parser.add_argument('--save', help='Write samples and events to this .npz on exit')
+    args = parser.parse_args()
+
+    dec = StreamDecoder()
+    all_t, all_xyz, all_ev = [], [], []
+    link = None
+    print(f'Listening on {args.port} at {args.baud or "auto"}')
+    try:
+        ser, link = open_link(args.port, None if args.fast else args.baud, fast=args.fast, timeout=0.2)
+        with ser:
+            t_report = time.time()
+            n_report = 0
+            while True:
+                data = ser.read(max(1, ser.in_waiting))
+                dec.feed(data)
+                link.count(len(data), dec)
+                t, xyz = dec.take_samples()
+                n_report += len(t)
+                if args.save and len(t):
+                    all_t.append(t)
+                    all_xyz.append(xyz)
+                for line in dec.take_text():
+                    print(line)
+                for ev in dec.take_events():
+                    all_ev.append(ev)
+                    print(f'{ev[0]:.0f} ms  {ev[1]}')
+                if time.time() - t_report >= 1.0:
+                    print(f'{n_report} samples/s  frames={dec.frames} '
+                          f'crc_errors={dec.crc_errors} dropped={dec.dropped_frames}  {link.stats}')
+                    link.check()
+                    t_report = time.time()
+                    n_report = 0
+    except serial.SerialException as e:
+        print('Serial error:', e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if link:
+            print(link.report())
+        if args.save:
+            t = np.concatenate(all_t) if all_t else np.empty(0)
+            xyz = np.concatenate(all_xyz) if all_xyz else np.empty((0, 3), dtype=np.int16)
+            np.savez(args.save, t_ms=t, xyz=xyz,
+                     event_t_ms=np.array([e[0] for e in all_ev]),
+                     event=np.array([e[1] for e in all_ev]))
+            print(f'Saved {len(t)} samples, {len(all_ev)} events to {args.save}')
+
+
+if __name__ == '__main__':
+    main()
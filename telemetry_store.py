@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+"""
+Append-only accelerometer history for the fall detector.
+
+Records what main.py / fall_detector.ino send (binary frames decoded by
+telemetry.StreamDecoder, or the "ACC g:" / event lines of the text format)
+into a directory of memory-mapped column chunks, so old data is still there
+after the terminal has scrolled it away:
+
+    c00000042.col   one sealed chunk: header + t, ax, ay, az, flags columns
+    active.col      the chunk being written (preallocated, sparse)
+    time.idx        one record per sealed chunk: seq, count, t_first, t_last
+    events.idx      one record per event: t_ms, chunk seq, code
+
+Columns: t float64 (host epoch ms, never decreasing), ax/ay/az int16 (raw
+LSB, 16384 per g), flags uint8 (FLAG_*). Device ticks are mapped to host
+time and re-anchored when the device reboots, so weeks of recordings share
+one time axis.
+
+The time index is sparse (one entry per chunk): a range query bisects it to
+find the chunks that overlap, then bisects the sorted t column of just those
+chunks in place. Nothing else is mapped or read, and the results are NumPy
+views straight into the mapped files (read-only for sealed chunks). Events
+(FREE_FALL_START, FALL_DETECTED, which marks the impact sample, and
+FREE_FALL_TIMEOUT) are kept in their own index, which is small enough to
+search without touching any chunk.
+
+Crash safety: a chunk is sealed by msync-ing its columns, then its header
+(count, t range, sealed flag), then fsync, then an atomic rename to its final
+name and an fsync of the directory. The index files only cache what the
+sealed chunk headers say and are repaired from them on open. active.col is
+checkpointed every CHECKPOINT_S (columns first, then the count in its
+header) and whatever checkpointed prefix survives is sealed on the next
+open, so a power cut loses at most the one unsealed chunk, and usually only
+the last CHECKPOINT_S.
+
+    store = TelemetryStore('accel_history')
+    for part in store.query(t0_ms, t1_ms):      # Part(t, ax, ay, az, flags), views
+        ...
+    ev = store.events(t0_ms, t1_ms, 'FALL_DETECTED')   # structured view: t_ms, chunk, code
+
+Record (next to mac_fall_alarm.py with serial_mux.py --mux), inspect, test:
+    python3 telemetry_store.py -p /dev/cu.usbserial-0001 --dir accel_history
+    python3 telemetry_store.py --dir accel_history --info
+    python3 telemetry_store.py --dir accel_history --query 2025-08-10T14:00 2025-08-10T14:05
+    python3 telemetry_store.py --selftest
+
+Requires: pip install numpy pyserial
+"""
+
+import mmap
+import os
+import re
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from telemetry import EVENT_NAMES, LSB_PER_G, StreamDecoder
+
+PORT = '/dev/cu.usbserial-0001'
+BAUD = 115200
+STORE_DIR = 'accel_history'
+
+CHUNK_SAMPLES = 1 << 18     # 262144 samples: ~4.4 min at 1 kHz, ~87 min at 50 Hz, 3.9 MB
+CHECKPOINT_S = 10.0         # how much of active.col a crash can lose, normally
+REANCHOR_MS = 2000          # re-map device ticks to host time beyond this disagreement
+IMPACT_WINDOW_MS = 1500     # the detector's WIN_MS: a free-fall it cancels silently ends here
+
+FLAG_GAP = 0x01             # frames were lost just before this sample
+FLAG_FREE_FALL = 0x02       # from FREE_FALL_START to its FALL_DETECTED / timeout, at most IMPACT_WINDOW_MS
+FLAG_TEXT = 0x04            # from a decimated "ACC g:" line (0.01 g resolution)
+
+EVENT_CODES = {name: code for code, name in EVENT_NAMES.items()}
+
+_MAGIC = b'ACCOL001'
+_HDR = struct.Struct('<8sIIIddB')   # magic, capacity, count, seq, t_first, t_last, sealed
+_HDR_SIZE = 64
+_COLUMNS = (('t', np.float64), ('ax', np.int16), ('ay', np.int16), ('az', np.int16),
+            ('flags', np.uint8))
+_ROW_BYTES = sum(np.dtype(dt).itemsize for _, dt in _COLUMNS)
+
+TIME_IDX = np.dtype([('seq', '<u4'), ('count', '<u4'), ('t_first', '<f8'), ('t_last', '<f8')])
+EVENT_IDX = np.dtype([('t_ms', '<f8'), ('chunk', '<u4'), ('code', 'u1'), ('pad', 'V3')])
+
+Part = namedtuple('Part', 't ax ay az flags')
+
+
+def _chunk_bytes(capacity):
+    return _HDR_SIZE + _ROW_BYTES * capacity
+
+
+def _columns(buf, capacity, count):
+    """Zero-copy column views of the first count rows of a chunk mapping."""
+    cols = []
+    off = _HDR_SIZE
+    for _, dt in _COLUMNS:
+        cols.append(np.frombuffer(buf, dtype=dt, count=count, offset=off))
+        off += np.dtype(dt).itemsize * capacity
+    return Part(*cols)
+
+
+def _read_header(buf):
+    magic, cap, count, seq, t_first, t_last, sealed = _HDR.unpack_from(buf)
+    if magic != _MAGIC:
+        raise ValueError('not a chunk file')
+    return cap, count, seq, t_first, t_last, sealed
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _append_records(path, rec):
+    with open(path, 'ab') as f:
+        f.write(rec.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class _Chunk:
+    """A sealed chunk, mapped read-only on first use."""
+
+    def __init__(self, path, capacity, count):
+        self.path = path
+        self.capacity = capacity
+        self.count = count
+        self._mm = None
+
+    def part(self):
+        if self._mm is None:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return _columns(self._mm, self.capacity, self.count)
+
+
+class TelemetryStore:
+    """Chunked column store; one writer process, any number of readers."""
+
+    def __init__(self, path=STORE_DIR, chunk_samples=CHUNK_SAMPLES, readonly=False):
+        self.path = path
+        self.chunk_samples = chunk_samples
+        self.readonly = readonly
+        self.chunks_mapped = 0          # chunks touched by query(), for --info / --selftest
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self._time_path = os.path.join(path, 'time.idx')
+        self._event_path = os.path.join(path, 'events.idx')
+        self._active_path = os.path.join(path, 'active.col')
+        self._active = None
+        self._chunks = {}
+        self._load_index()
+        self._load_events()
+        self.next_seq = int(self.index['seq'][-1]) + 1 if len(self.index) else 0
+        if not readonly:
+            self._recover_active()
+        self.last_t = float(self.index['t_last'][-1]) if len(self.index) else -np.inf
+
+    # -- index -------------------------------------------------------------
+
+    def _chunk_path(self, seq):
+        return os.path.join(self.path, f'c{seq:08d}.col')
+
+    def _load_index(self):
+        """Read time.idx and add any sealed chunk it is missing (crash between rename and append)."""
+        size = os.path.getsize(self._time_path) if os.path.exists(self._time_path) else 0
+        idx = np.fromfile(self._time_path, dtype=TIME_IDX, count=size // TIME_IDX.itemsize) \
+            if size else np.empty(0, dtype=TIME_IDX)
+        if size % TIME_IDX.itemsize and not self.readonly:
+            os.truncate(self._time_path, len(idx) * TIME_IDX.itemsize)   # torn last record
+        known = set(idx['seq'].tolist())
+        missing = []
+        for name in sorted(os.listdir(self.path)) if os.path.isdir(self.path) else ():
+            m = re.fullmatch(r'c(\d{8})\.col', name)
+            if not m or int(m.group(1)) in known:
+                continue
+            with open(os.path.join(self.path, name), 'rb') as f:
+                cap, count, seq, t_first, t_last, sealed = _read_header(f.read(_HDR_SIZE))
+            if sealed and count:
+                missing.append((seq, count, t_first, t_last))
+        if missing:
+            extra = np.array(missing, dtype=TIME_IDX)
+            if not self.readonly:
+                _append_records(self._time_path, extra)
+            idx = np.sort(np.concatenate([idx, extra]), order='seq')
+        self.index = idx
+
+    def _load_events(self):
+        if os.path.exists(self._event_path):
+            n = os.path.getsize(self._event_path) // EVENT_IDX.itemsize
+            if not self.readonly and os.path.getsize(self._event_path) != n * EVENT_IDX.itemsize:
+                os.truncate(self._event_path, n * EVENT_IDX.itemsize)
+            self._events = np.memmap(self._event_path, dtype=EVENT_IDX, mode='r', shape=(n,)) \
+                if n else np.empty(0, dtype=EVENT_IDX)
+        else:
+            self._events = np.empty(0, dtype=EVENT_IDX)
+
+    # -- writing -----------------------------------------------------------
+
+    def _open_active(self):
+        size = _chunk_bytes(self.chunk_samples)
+        fd = os.open(self._active_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)              # sparse: unwritten rows take no disk
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        _HDR.pack_into(mm, 0, _MAGIC, self.chunk_samples, 0, self.next_seq, 0.0, 0.0, 0)
+        self._active = {'mm': mm, 'cols': _columns(mm, self.chunk_samples, self.chunk_samples),
+                        'n': 0, 'saved': 0, 't_saved': time.monotonic()}
+
+    def append(self, t_ms, xyz, flags=0):
+        """Store samples: t_ms (N,) host epoch ms, xyz (N, 3) raw LSB, flags scalar or (N,)."""
+        t_ms = np.asarray(t_ms, dtype=np.float64)
+        xyz = np.asarray(xyz)
+        flags = np.broadcast_to(np.asarray(flags, dtype=np.uint8), t_ms.shape)
+        # The t column must stay sorted for bisecting; clamp host-clock steps backwards
+        t_ms = np.maximum.accumulate(np.maximum(t_ms, self.last_t))
+        i = 0
+        while i < len(t_ms):
+            if self._active is None:
+                self._open_active()
+            a = self._active
+            k = min(len(t_ms) - i, self.chunk_samples - a['n'])
+            c, n = a['cols'], a['n']
+            c.t[n:n + k] = t_ms[i:i + k]
+            c.ax[n:n + k] = xyz[i:i + k, 0]
+            c.ay[n:n + k] = xyz[i:i + k, 1]
+            c.az[n:n + k] = xyz[i:i + k, 2]
+            c.flags[n:n + k] = flags[i:i + k]
+            a['n'] += k
+            i += k
+            if a['n'] == self.chunk_samples:
+                self.seal()
+        if len(t_ms):
+            self.last_t = float(t_ms[-1])
+        if self._active and time.monotonic() - self._active['t_saved'] >= CHECKPOINT_S:
+            self.checkpoint()
+
+    def event(self, t_ms, code):
+        """Store one event (code from telemetry.EVENT_NAMES); fsynced, they are rare."""
+        rec = np.array([(t_ms, self.next_seq, code, b'')], dtype=EVENT_IDX)
+        _append_records(self._event_path, rec)
+        self._load_events()
+
+    def checkpoint(self):
+        """Make the rows written so far survive a crash: columns first, then the count."""
+        a = self._active
+        if a is None or a['n'] == a['saved']:
+            return
+        a['mm'].flush()
+        c = a['cols']
+        _HDR.pack_into(a['mm'], 0, _MAGIC, self.chunk_samples, a['n'], self.next_seq,
+                       float(c.t[0]), float(c.t[a['n'] - 1]), 0)
+        a['mm'].flush()
+        a['saved'] = a['n']
+        a['t_saved'] = time.monotonic()
+
+    def seal(self):
+        """Close the active chunk: durable, renamed to its final name, then indexed."""
+        a, self._active = self._active, None
+        if a is None:
+            return
+        mm, n = a['mm'], a['n']
+        if n == 0:
+            mm.close()
+            os.unlink(self._active_path)
+            return
+        c = a['cols']
+        entry = (self.next_seq, n, float(c.t[0]), float(c.t[n - 1]))
+        del c, a
+        mm.flush()
+        _HDR.pack_into(mm, 0, _MAGIC, self.chunk_samples, n, self.next_seq, entry[2], entry[3], 1)
+        mm.flush()
+        try:
+            mm.close()
+        except BufferError:
+            pass                    # a caller still holds query() views; unmapped when they go
+        self._seal_file(self._active_path, entry)
+
+    def _seal_file(self, path, entry):
+        seq = entry[0]
+        with open(path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.rename(path, self._chunk_path(seq))
+        _fsync_dir(self.path)
+        rec = np.array([entry], dtype=TIME_IDX)
+        _append_records(self._time_path, rec)
+        self.index = np.concatenate([self.index, rec])
+        self.next_seq = seq + 1
+
+    def _recover_active(self):
+        """Seal whatever checkpointed prefix of active.col survived a crash."""
+        if not os.path.exists(self._active_path):
+            return
+        with open(self._active_path, 'rb') as f:
+            try:
+                cap, count, seq, _, _, _ = _read_header(f.read(_HDR_SIZE))
+            except (ValueError, struct.error):
+                count = 0
+        if count == 0:
+            os.unlink(self._active_path)
+            return
+        with open(self._active_path, 'r+b') as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        t = _columns(mm, cap, count).t
+        # Keep the sorted prefix; anything after a torn page is dropped
+        bad = np.flatnonzero(np.diff(t) < 0)
+        count = int(bad[0]) + 1 if len(bad) else count
+        t_first, t_last = float(t[0]), float(t[count - 1])
+        del t
+        _HDR.pack_into(mm, 0, _MAGIC, cap, count, seq, t_first, t_last, 1)
+        mm.flush()
+        mm.close()
+        print(f'Recovered {count} samples from an unsealed chunk')
+        self._seal_file(self._active_path, (seq, count, t_first, t_last))
+
+    def close(self):
+        if not self.readonly:
+            self.seal()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- reading -----------------------------------------------------------
+
+    def _chunk(self, seq, count):
+        ch = self._chunks.get(seq)
+        if ch is None or ch.count != count:
+            with open(self._chunk_path(seq), 'rb') as f:
+                cap = _read_header(f.read(_HDR_SIZE))[0]
+            ch = self._chunks[seq] = _Chunk(self._chunk_path(seq), cap, count)
+        return ch
+
+    def query(self, t0_ms=-np.inf, t1_ms=np.inf):
+        """Samples with t0 <= t < t1, as one Part of column views per chunk."""
+        idx = self.index
+        # Chunks are in time order: skip those ending before t0, stop at the first starting at t1
+        lo = int(np.searchsorted(idx['t_last'], t0_ms, 'left'))
+        hi = int(np.searchsorted(idx['t_first'], t1_ms, 'left'))
+        parts = []
+        for seq, count in zip(idx['seq'][lo:hi].tolist(), idx['count'][lo:hi].tolist()):
+            self.chunks_mapped += 1
+            p = self._chunk(seq, count).part()
+            parts.append(p)
+        if self._active is not None and self._active['n']:
+            a = self._active
+            parts.append(Part(*(col[:a['n']] for col in a['cols'])))
+        out = []
+        for p in parts:
+            i = int(np.searchsorted(p.t, t0_ms, 'left'))
+            j = int(np.searchsorted(p.t, t1_ms, 'left'))
+            if j > i:
+                out.append(Part(*(col[i:j] for col in p)))
+        return out
+
+    def read(self, t0_ms=-np.inf, t1_ms=np.inf):
+        """Like query() but one Part of contiguous arrays (copies if it spans chunks)."""
+        parts = self.query(t0_ms, t1_ms)
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return Part(*(np.empty(0, dtype=dt) for _, dt in _COLUMNS))
+        return Part(*(np.concatenate(cols) for cols in zip(*parts)))
+
+    def events(self, t0_ms=-np.inf, t1_ms=np.inf, name=None):
+        """Events with t0 <= t_ms < t1 (optionally one EVENT_NAMES name), as a view."""
+        ev = self._events
+        ev = ev[int(np.searchsorted(ev['t_ms'], t0_ms, 'left')):
+                int(np.searchsorted(ev['t_ms'], t1_ms, 'left'))]
+        if name is not None:
+            ev = ev[ev['code'] == EVENT_CODES[name]]
+        return ev
+
+    def window(self, t_ms, before_ms=3000, after_ms=1000):
+        """The samples around one event, e.g. store.window(store.events(name='FALL_DETECTED')['t_ms'][0])."""
+        return self.read(t_ms - before_ms, t_ms + after_ms)
+
+
+# ---------------------------------------------------------------------------
+# Recorder
+
+
+_ACC_G = re.compile(r'ACC g:\s*(-?[\d.]+),?\s+(-?[\d.]+),?\s+(-?[\d.]+)')
+_TEXT_EVENTS = {'-- free-fall start --': EVENT_CODES['FREE_FALL_START'],
+                'FALL_DETECTED': EVENT_CODES['FALL_DETECTED'],
+                '-- free-fall timeout --': EVENT_CODES['FREE_FALL_TIMEOUT']}
+
+
+class Recorder:
+    """Feeds a StreamDecoder's output into a TelemetryStore on one time axis.
+
+    Free-fall spans are kept in host ms, so samples are flagged by their own
+    time whichever order they and the events arrive in. The detector also
+    drops a free-fall without an event when |a| comes back near 1 g; such a
+    span ends IMPACT_WINDOW_MS after its start.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.anchor = None              # host epoch ms - device ms
+        self.spans = []                 # [t_start, t_end] host ms of recent free-falls
+        self.dropped_seen = 0
+
+    def host_ms(self, dev_t):
+        """Device ms -> host epoch ms; re-anchored on reboot (ticks restart) or drift."""
+        now = time.time() * 1000
+        if (self.anchor is None or abs(self.anchor + dev_t - now) > REANCHOR_MS):
+            self.anchor = now - dev_t
+        return self.anchor + dev_t
+
+    def free_fall_flags(self, t):
+        """FLAG_FREE_FALL for the host times t inside a span, dropping spans before t[-1]."""
+        flags = np.zeros(len(t), dtype=np.uint8)
+        for t0, t1 in self.spans:
+            flags[(t >= t0) & (t < t1)] = FLAG_FREE_FALL
+        self.spans = [s for s in self.spans if s[1] > t[-1]]
+        return flags
+
+    def samples(self, t_dev, xyz, dropped=0):
+        if not len(t_dev):
+            return
+        self.host_ms(float(t_dev[-1]))
+        t = self.anchor + t_dev
+        flags = self.free_fall_flags(t)
+        if dropped > self.dropped_seen:
+            flags[0] |= FLAG_GAP
+            self.dropped_seen = dropped
+        self.store.append(t, xyz, flags)
+
+    def event(self, t_host, code):
+        self.store.event(t_host, code)
+        if self.spans and self.spans[-1][1] > t_host:
+            self.spans[-1][1] = t_host          # any event ends the free-fall before it
+        if code == EVENT_CODES['FREE_FALL_START']:
+            self.spans.append([t_host, t_host + IMPACT_WINDOW_MS])
+
+    def text(self, line):
+        m = _ACC_G.search(line)
+        if m:
+            g = np.array([[float(v) for v in m.groups()]])
+            xyz = np.clip(np.rint(g * LSB_PER_G), -32768, 32767).astype(np.int16)
+            t = np.array([time.time() * 1000])
+            self.store.append(t, xyz, FLAG_TEXT | self.free_fall_flags(t))
+            return
+        for text, code in _TEXT_EVENTS.items():
+            if text in line:
+                self.event(time.time() * 1000, code)
+
+    def feed(self, dec):
+        """Move everything the decoder has into the store, events first so they flag the samples."""
+        for line in dec.take_text():
+            self.text(line)
+        for t_ms, name in dec.take_events():
+            self.event(self.host_ms(t_ms), EVENT_CODES.get(name, 0))
+        t, xyz = dec.take_samples()
+        self.samples(t, xyz, dec.dropped_frames)
+
+
+def record(port, store_dir, baud=BAUD, mux=False):
+    from serial_mux import open_serial
+
+    dec = StreamDecoder()
+    with TelemetryStore(store_dir) as store:
+        rec = Recorder(store)
+        print(f'Recording {port} into {store_dir}/ (Ctrl+C to stop)')
+        t_report = time.monotonic()
+        try:
+            with open_serial(port, baud, mux=mux, timeout=1) as ser:
+                while True:
+                    dec.feed(ser.read(max(1, ser.in_waiting)))
+                    rec.feed(dec)
+                    if time.monotonic() - t_report >= 10:
+                        t_report = time.monotonic()
+                        print(f'{dec.samples} binary samples, {len(store.index)} sealed chunks, '
+                              f'{len(store.events())} events, crc_errors={dec.crc_errors} '
+                              f'dropped={dec.dropped_frames}')
+        except KeyboardInterrupt:
+            pass
+    print('Store sealed')
+
+
+# ---------------------------------------------------------------------------
+# Command line
+
+
+def _parse_time(s):
+    """Epoch ms from an ISO local time (2025-08-10T14:00[:05]) or a number of ms."""
+    try:
+        return float(s)
+    except ValueError:
+        fmt = '%Y-%m-%dT%H:%M:%S' if s.count(':') == 2 else '%Y-%m-%dT%H:%M'
+        return time.mktime(time.strptime(s, fmt)) * 1000
+
+
+def _fmt_time(t_ms):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t_ms / 1000)) + f'.{int(t_ms) % 1000:03d}'
+
+
+def info(store):
+    idx = store.index
+    n = int(idx['count'].sum())
+    print(f'{store.path}: {len(idx)} sealed chunks, {n} samples')
+    if len(idx):
+        print(f'  from {_fmt_time(idx["t_first"][0])} to {_fmt_time(idx["t_last"][-1])}')
+    for code, name in EVENT_NAMES.items():
+        ev = store.events(name=name)
+        print(f'  {name:18} {len(ev)}' + (f'  last {_fmt_time(ev["t_ms"][-1])}' if len(ev) else ''))
+
+
+def query(store, t0, t1):
+    parts = store.query(t0, t1)
+    n = sum(len(p.t) for p in parts)
+    print(f'{n} samples in {len(parts)} chunk(s)')
+    for p in parts:
+        g = np.sqrt((np.stack([p.ax, p.ay, p.az], 1).astype(np.float64) ** 2).sum(1)) / LSB_PER_G
+        print(f'  {_fmt_time(p.t[0])} .. {_fmt_time(p.t[-1])}  {len(p.t):>7} samples  '
+              f'|a| min {g.min():.2f} max {g.max():.2f} g  gaps {int(np.count_nonzero(p.flags & FLAG_GAP))}')
+    for t_ms, _, code, _ in store.events(t0, t1):
+        print(f'  {_fmt_time(t_ms)}  {EVENT_NAMES.get(int(code), code)}')
+
+
+def selftest(hours=6.0, rate_hz=200, chunk=1 << 16):
+    """Write synthetic history, check range queries, then kill a writer mid-chunk."""
+    import shutil
+    import signal
+    import tempfile
+
+    d = tempfile.mkdtemp(prefix='accel_store_')
+    ok = True
+    try:
+        n = int(hours * 3600 * rate_hz)
+        t_start = 1.75e12
+        t = t_start + np.arange(n) * (1000.0 / rate_hz)
+        rng = np.random.default_rng(0)
+        xyz = rng.normal(0, 300, (n, 3)).astype(np.int16)
+        xyz[:, 2] += 16384
+        t0 = time.perf_counter()
+        with TelemetryStore(d, chunk_samples=chunk) as store:
+            for i in range(0, n, 5000):
+                store.append(t[i:i + 5000], xyz[i:i + 5000])
+                if i % (rate_hz * 1800) < 5000:
+                    store.event(t[i], EVENT_CODES['FALL_DETECTED'])
+        dt = time.perf_counter() - t0
+        print(f'wrote {n} samples ({hours:g} h at {rate_hz} Hz) in {dt:.2f} s '
+              f'= {n / dt / 1e6:.1f} M samples/s, {n * _ROW_BYTES / 2**20:.0f} MB')
+
+        store = TelemetryStore(d, readonly=True)
+        ok &= len(store.index) == -(-n // chunk) and int(store.index['count'].sum()) == n
+        q0, q1 = t_start + 3.3 * 3600e3, t_start + 3.3 * 3600e3 + 60e3
+        t_q = time.perf_counter()
+        parts = store.query(q0, q1)
+        t_q = time.perf_counter() - t_q
+        touched = store.chunks_mapped
+        got = store.read(q0, q1)
+        want = (t >= q0) & (t < q1)
+        ok &= np.array_equal(got.t, t[want]) and np.array_equal(got.az, xyz[want, 2])
+        ok &= all(p.t.base is not None and not p.t.flags.writeable for p in parts)
+        print(f'1 min query: {len(got.t)} samples from {touched} of {len(store.index)} '
+              f'chunks in {t_q * 1e3:.2f} ms, zero-copy read-only views: {ok}')
+        ev = store.events(name='FALL_DETECTED')
+        w = store.window(float(ev['t_ms'][2]))
+        ok &= len(ev) == int(hours * 2) and len(w.t) == 4 * rate_hz
+        print(f'{len(ev)} FALL_DETECTED events; window around #3: {len(w.t)} samples')
+        del parts, got, w, store
+
+        # A writer killed between checkpoints: sealed chunks intact, active recovered
+        # up to its last checkpoint, at most one chunk's worth lost
+        pid = os.fork()
+        if pid == 0:
+            s = TelemetryStore(d, chunk_samples=chunk)
+            base = s.last_t + 1
+            s.append(base + np.arange(chunk + chunk // 2), np.zeros((chunk + chunk // 2, 3)))
+            s.checkpoint()
+            s.append(base + chunk + chunk // 2 + np.arange(1000), np.zeros((1000, 3)))
+            os.kill(os.getpid(), signal.SIGKILL)
+        os.waitpid(pid, 0)
+        store = TelemetryStore(d, chunk_samples=chunk)
+        total = int(store.index['count'].sum())
+        ok &= total == n + chunk + chunk // 2 and not os.path.exists(os.path.join(d, 'active.col'))
+        print(f'after SIGKILL mid-chunk: {total - n} of {chunk + chunk // 2 + 1000} new samples kept '
+              f'(1000 written after the last checkpoint lost)')
+        store.close()
+
+        # Free-fall flags through the Recorder, in two decoder batches: a fall
+        # (start, impact), then a free-fall the detector drops without an event
+        # that must stop being flagged IMPACT_WINDOW_MS later, in the next batch
+        from types import SimpleNamespace
+
+        def batch(t_dev, events):
+            t_dev = np.asarray(t_dev, dtype=np.float64)
+            return SimpleNamespace(take_text=lambda: [], take_events=lambda: events, dropped_frames=0,
+                                   take_samples=lambda: (t_dev, np.zeros((len(t_dev), 3), np.int16)))
+
+        t_dev = np.arange(0, 3000, 10.0)
+        with TelemetryStore(os.path.join(d, 'rec'), chunk_samples=chunk) as rstore:
+            rec = Recorder(rstore)
+            rec.anchor = time.time() * 1000 - 1500
+            rec.feed(batch(t_dev[:150], [(100, 'FREE_FALL_START'), (400, 'FALL_DETECTED'),
+                                         (1000, 'FREE_FALL_START')]))
+            rec.feed(batch(t_dev[150:], []))
+            got = rstore.read(-np.inf, np.inf)
+            flagged = (got.flags & FLAG_FREE_FALL) != 0
+            want = ((t_dev >= 100) & (t_dev < 400)) | ((t_dev >= 1000) & (t_dev < 1000 + IMPACT_WINDOW_MS))
+            good = np.array_equal(flagged, want)
+        ok &= good
+        print(f'free-fall flags: {int(flagged.sum())} samples flagged, spans as expected: {good}')
+    finally:
+        shutil.rmtree(d)
+    print('OK' if ok else 'FAILED')
+    return ok
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Record and query accelerometer history')
+    parser.add_argument('-p', '--port', default=PORT, help=f'Serial port (default: {PORT})')
+    parser.add_argument('-b', '--baud', type=int, default=BAUD, help=f'Baud rate (default: {BAUD})')
+    parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
+    parser.add_argument('--dir', default=STORE_DIR, help=f'Store directory (default: {STORE_DIR})')
+    parser.add_argument('--info', action='store_true', help='Summarise the store and exit')
+    parser.add_argument('--query', nargs=2, metavar=('FROM', 'TO'),
+                        help='Samples and events between two local times (YYYY-MM-DDTHH:MM[:SS]) or epoch ms')
+    parser.add_argument('--selftest', action='store_true', help='Write, query and crash a store in a temp dir')
+    args = parser.parse_args()
+
+    if args.selftest:
+        raise SystemExit(0 if selftest() else 1)
+    if args.info:
+        info(TelemetryStore(args.dir, readonly=True))
+    elif args.query:
+        query(TelemetryStore(args.dir, readonly=True), *map(_parse_time, args.query))
+    else:
+        record(args.port, args.dir, args.baud, args.mux)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,15 @@
 Quick connection test for ESP32 with MPU-6050
 """
 
+import argparse
 import serial
 import time
 import sys
 
-def test_connection():
+from serial_mux import open_serial
+from serial_reader import LineReader
+
+def test_connection(mux=False):
     port = '/dev/cu.usbserial-0001'
     baudrate = 115200
     
@@ -21,10 +25,11 @@ def test_connection():
     try:
         # Open serial connection
         print("Connecting to ESP32...")
-        ser = serial.Serial(port, baudrate, timeout=2)
+        ser = open_serial(port, baudrate, mux=mux, timeout=2)
         time.sleep(2)  # Wait for connection
         
-        # Send a reset command to ESP32 (DTR toggle)
+        # Send a reset command to ESP32 (DTR toggle; not possible through
+        # serial_mux.py, which owns the control lines)
         ser.setDTR(False)
         time.sleep(0.1)
         ser.setDTR(True)
@@ -41,22 +46,19 @@ def test_connection():
         start_time = time.time()
         data_received = False
         
+        reader = LineReader(ser)
         while time.time() - start_time < 10:
-            if ser.in_waiting > 0:
-                try:
-                    line = ser.readline().decode('utf-8').rstrip()
-                    if line:
-                        print(line)
-                        data_received = True
-                        
-                        # Check for specific indicators
-                        if "MPU-6050" in line or "0x68" in line:
-                            print("\n✅ MPU-6050 DETECTED!")
-                        elif "not found" in line.lower() or "no i2c" in line.lower():
-                            print("\n⚠️ MPU-6050 might not be connected properly")
-                            
-                except UnicodeDecodeError:
-                    pass
+            for line in reader.read_lines(timeout=max(0, 10 - (time.time() - start_time))):
+                line = line.rstrip()
+                if line:
+                    print(line)
+                    data_received = True
+                    
+                    # Check for specific indicators
+                    if "MPU-6050" in line or "0x68" in line:
+                        print("\n✅ MPU-6050 DETECTED!")
+                    elif "not found" in line.lower() or "no i2c" in line.lower():
+                        print("\n⚠️ MPU-6050 might not be connected properly")
         
         if not data_received:
             print("\n⚠️ No data received from ESP32")
@@ -66,7 +68,7 @@ def test_connection():
             print("3. Wrong baud rate")
             print("\n📝 Recommendation: Upload i2c_scanner.ino to test")
             
-    except serial.SerialException as e:
+    except (serial.SerialException, OSError) as e:
         print(f"\n❌ Error: Could not open port {port}")
         print(f"Details: {e}")
         
@@ -79,4 +81,6 @@ def test_connection():
             print("\nConnection closed.")
 
 if __name__ == "__main__":
-    test_connection() 
+    parser = argparse.ArgumentParser(description='ESP32 MPU-6050 connection test')
+    parser.add_argument('--mux', action='store_true', help='Attach to serial_mux.py instead of the port')
+    test_connection(parser.parse_args().mux)